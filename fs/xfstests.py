@@ -47,20 +47,50 @@ class Xfstests(Test):
 
     def get_half_region_size(self, region):
         size_align = self.get_size_alignval()
-        region_size = self.plib.run_ndctl_list_val(self.plib.run_ndctl_list(
-            '-r %s' % region)[0], 'size')
+        region_size = self.plib.run_ndctl_list_val(
+            self.region_json[region], 'size')
 
         namespace_size = region_size // 2
         namespace_size = (namespace_size // size_align) * size_align
         return namespace_size
 
+    def setup_pmem_namespaces(self, region, size, clear=True, **kwargs):
+        """
+        Return the block devices of two namespaces of the given mode and
+        size on the region, reusing the ones already there if possible
+        """
+        mode = kwargs.get('mode', 'fsdax')
+        namespaces = [ns for ns in self.region_ns.get(region, [])
+                      if ns.get('mode') == mode and int(genio.read_one_line(
+                          '/sys/bus/nd/devices/%s/size' % ns['dev'])) == size]
+        if len(namespaces) < 2:
+            if clear:
+                self.plib.destroy_namespace(region=region, force=True)
+            for _ in range(2):
+                self.plib.create_namespace(region=region, size=size, **kwargs)
+            self.region_ns[region] = self.plib.run_ndctl_list(
+                '-N -r %s' % region)
+            namespaces = [ns for ns in self.region_ns[region]
+                          if ns.get('mode') == mode]
+        else:
+            self.log.info("Reusing %s namespaces on %s", mode, region)
+        return ["/dev/%s" % self.plib.run_ndctl_list_val(ns, 'blockdev')
+                for ns in namespaces[:2]]
+
     def setup_nvdimm(self):
         self.plib = pmem.PMem()
         self.plib.enable_region()
-        regions = sorted(self.plib.run_ndctl_list('-R'),
+        # one listing of the regions along with their namespaces
+        regions = sorted(self.plib.run_ndctl_list('-R -N'),
                          key=lambda i: i['size'], reverse=True)
         if not regions:
             self.cancel("Nvdimm test with no region support")
+        self.region_json = {}
+        self.region_ns = {}
+        for val in regions:
+            name = self.plib.run_ndctl_list_val(val, 'dev')
+            self.region_json[name] = val
+            self.region_ns[name] = val.get('namespaces', [])
 
         self.region = self.plib.run_ndctl_list_val(regions[0], 'dev')
         if self.plib.is_region_legacy(self.region):
@@ -78,21 +108,22 @@ class Xfstests(Test):
                 self._create_loop_device('2038M', mount)
                 self.log_test = self.devices.pop()
                 self.log_scratch = self.devices.pop()
-            namespaces = self.plib.run_ndctl_list('-N -r %s' % self.region)
+            namespaces = self.region_ns[self.region]
             pmem_dev = self.plib.run_ndctl_list_val(namespaces[0], 'blockdev')
             self.test_dev = "/dev/%s" % pmem_dev
             region_2 = self.plib.run_ndctl_list_val(regions[1], 'dev')
-            namespaces = self.plib.run_ndctl_list('-N -r %s' % region_2)
+            namespaces = self.region_ns[region_2]
             pmem_dev = self.plib.run_ndctl_list_val(namespaces[0], 'blockdev')
             self.scratch_dev = "/dev/%s" % pmem_dev
             self.devices.extend([self.test_dev, self.scratch_dev])
         else:
+            clear = True
             if self.logflag:
                 if not len(regions) > 1:
                     self.log.info('Using 10% space of device for logdev')
                     self.region_ldev = self.region
                     region_size = self.plib.run_ndctl_list_val(
-                        self.plib.run_ndctl_list('-r %s' % self.region_ldev)[0], 'size')
+                        self.region_json[self.region_ldev], 'size')
                     logdev_size = int(region_size * 0.10)
                     dev_size = region_size - logdev_size
                     size_align = self.get_size_alignval()
@@ -100,46 +131,28 @@ class Xfstests(Test):
                     dev_size = (dev_size // size_align) * size_align
                     logdev_size = logdev_size // 2
                     logdev_size = (logdev_size // size_align) * size_align
+                    # data namespaces share the region with the log ones
+                    clear = False
                 else:
                     dev_size = self.get_half_region_size(self.region)
                     self.region_ldev = self.plib.run_ndctl_list_val(
                         regions[1], 'dev')
                     logdev_size = self.get_half_region_size(
                         region=self.region_ldev)
-                    self.plib.destroy_namespace(region=self.region, force=True)
-                self.plib.destroy_namespace(
-                    region=self.region_ldev, force=True)
                 # XFS restrict max log size to 2136997888, which is 10M less
                 # than 2GB, not 16M page-aligned, hence rounding-off to nearest
                 # 16M align value 2130706432, which is 16M less than 2GiB
                 logdev_size = min(logdev_size, 2130706432)
                 # log device to be created in sector mode
-                self.plib.create_namespace(region=self.region_ldev, mode='sector',
-                                           sector_size='512', size=logdev_size)
-                self.plib.create_namespace(region=self.region_ldev, mode='sector',
-                                           sector_size='512', size=logdev_size)
-
-                namespaces = self.plib.run_ndctl_list(
-                    '-N -r %s -m sector' % self.region_ldev)
-                log_dev = self.plib.run_ndctl_list_val(
-                    namespaces[0], 'blockdev')
-                self.log_test = "/dev/%s" % log_dev
-                log_dev = self.plib.run_ndctl_list_val(
-                    namespaces[1], 'blockdev')
-                self.log_scratch = "/dev/%s" % log_dev
+                self.log_test, self.log_scratch = self.setup_pmem_namespaces(
+                    self.region_ldev, logdev_size, mode='sector',
+                    sector_size='512')
             else:
-                self.plib.destroy_namespace(region=self.region, force=True)
                 dev_size = self.get_half_region_size(self.region)
                 self.log_test = None
                 self.log_scratch = None
-            self.plib.create_namespace(region=self.region, size=dev_size)
-            self.plib.create_namespace(region=self.region, size=dev_size)
-            namespaces = self.plib.run_ndctl_list(
-                '-N -r %s -m fsdax' % self.region)
-            pmem_dev = self.plib.run_ndctl_list_val(namespaces[0], 'blockdev')
-            self.test_dev = "/dev/%s" % pmem_dev
-            pmem_dev = self.plib.run_ndctl_list_val(namespaces[1], 'blockdev')
-            self.scratch_dev = "/dev/%s" % pmem_dev
+            self.test_dev, self.scratch_dev = self.setup_pmem_namespaces(
+                self.region, dev_size, clear=clear)
             self.devices.extend([self.test_dev, self.scratch_dev])
 
     def __setUp_packages(self):
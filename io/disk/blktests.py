@@ -15,8 +15,11 @@
 
 import os
 import re
+import glob
+import json
 
 from avocado import Test
+from avocado.core import data_dir
 from avocado.utils import process, build, archive, genio, distro
 from avocado.utils.software_manager.manager import SoftwareManager
 
@@ -36,6 +39,25 @@ class Blktests(Test):
         self.disk = self.params.get('disk', default='')
         self.dev_type = self.params.get('type', default='')
         self.disk = self.disk.split(' ')
+        self.parallel = self.params.get('parallel', default=False)
+        self.lane_groups = self.params.get(
+            'lane_groups', default=['block', 'loop', 'nvme', 'scsi'])
+        # groups proven not to share modules or CPU hotplug with others
+        self.independent_groups = self.params.get('independent_groups',
+                                                  default=[])
+        self.history_file = self.params.get(
+            'history_file', default=os.path.join(data_dir.get_data_dir(),
+                                                 'blktests_runtime.json'))
+        self.history_len = self.params.get('history_len', default=10)
+        self.runtime_tolerance = self.params.get('runtime_tolerance',
+                                                 default=0.5)
+        self.min_regression = self.params.get('min_regression_sec',
+                                              default=5)
+        self.default_runtime = self.params.get('default_runtime', default=30)
+        self.history = {}
+        if os.path.exists(self.history_file):
+            with open(self.history_file) as history:
+                self.history = json.load(history)
         smm = SoftwareManager()
         dist = distro.detect()
 
@@ -75,6 +97,117 @@ class Blktests(Test):
         self.sourcedir = os.path.join(self.workdir, 'blktests-master')
         build.make(self.sourcedir)
 
+    def expected_runtime(self, test):
+        """
+        Returns the median of the recorded runtimes of the test on any
+        device, default_runtime when it has no history.
+        """
+        medians = []
+        for key, runtimes in self.history.items():
+            if key.split(':')[0] == test and runtimes:
+                medians.append(sorted(runtimes)[len(runtimes) // 2])
+        return max(medians) if medians else self.default_runtime
+
+    def group_tests(self, group):
+        """
+        Returns the tests of a group, slowest first as per history.
+        """
+        tests = sorted('%s/%s' % (group, os.path.basename(path)) for path in
+                       glob.glob(os.path.join(self.sourcedir, 'tests', group,
+                                              '[0-9][0-9][0-9]')))
+        return sorted(tests, key=self.expected_runtime, reverse=True)
+
+    def plan_lanes(self, groups, independent):
+        """
+        Returns the lanes of device-independent tests: one lane per group
+        of the independent allow-list, and the tests of every other group
+        to be run serially in a shared lane, as those share kernel modules
+        (null_blk, loop, nvme-loop, scsi_debug) or hotplug CPUs.
+
+        :returns: list of independent lanes and the shared lane tests
+        """
+        lanes = [self.group_tests(group) for group in groups
+                 if group in independent]
+        shared = [group for group in groups if group not in independent]
+        # longest group first so its runtime overlaps the other lanes
+        shared.sort(key=lambda group: -sum(map(self.expected_runtime,
+                                               self.group_tests(group))))
+        return ([lane for lane in lanes if lane],
+                [test for group in shared for test in self.group_tests(group)])
+
+    def run_lanes(self, lanes):
+        """
+        Runs the lanes concurrently, each lane runs its tests in order
+        into its own results directory.
+
+        :param lanes: list of (name, steps), steps being a list of
+                      (test, test_devs, check_args)
+        :returns: combined stdout of the lanes and the results directories
+        """
+        procs = []
+        for name, steps in lanes:
+            out_dir = os.path.join(self.outputdir, 'results-%s' % name)
+            cmd = '; '.join("TEST_DEVS='%s' ./check %s -o %s %s"
+                            % (devs, args, out_dir, test)
+                            for test, devs, args in steps)
+            self.log.info("Lane %s: %s", name,
+                          ' '.join(step[0] for step in steps))
+            proc = process.SubProcess(cmd, shell=True)
+            proc.start()
+            procs.append((proc, out_dir))
+        stdout = ''
+        for proc, _ in procs:
+            proc.wait()
+            stdout += proc.get_stdout().decode(errors="ignore")
+        return stdout, [out_dir for _, out_dir in procs]
+
+    @staticmethod
+    def parse_results(results_dir):
+        """
+        Parses the per-test result files (results/<dev>/<group>/<test>,
+        "key value" lines) of a blktests results directory.
+
+        :returns: dict of "group/test:dev" to the status and runtime
+        """
+        results = {}
+        for path in glob.glob(os.path.join(results_dir, '*', '*', '*')):
+            if not re.match(r'^\d{3}$', os.path.basename(path)):
+                continue
+            fields = {}
+            for line in genio.read_all_lines(path):
+                key, _, val = line.strip().partition('\t')
+                fields[key] = val.strip()
+            dev, group, test = path.split(os.sep)[-3:]
+            runtime = re.match(r'^([\d.]+)s?$', fields.get('runtime', ''))
+            results['%s/%s:%s' % (group, test, dev)] = {
+                'status': fields.get('status'),
+                'runtime': float(runtime.group(1)) if runtime else None}
+        return results
+
+    def update_history(self, results):
+        """
+        Flags the tests whose runtime grew over the history median by more
+        than runtime_tolerance and min_regression_sec, then records the
+        new runtimes and saves the history.
+        """
+        regressions = {}
+        for key, result in results.items():
+            runtime = result['runtime']
+            if runtime is None or result['status'] != 'pass':
+                continue
+            past = self.history.get(key, [])
+            if past:
+                median = sorted(past)[len(past) // 2]
+                if runtime > median * (1 + self.runtime_tolerance) and \
+                        runtime - median > self.min_regression:
+                    regressions[key] = {'runtime': runtime,
+                                        'median': median}
+            self.history[key] = (past + [runtime])[-self.history_len:]
+        os.makedirs(os.path.dirname(self.history_file), exist_ok=True)
+        with open(self.history_file, 'w') as history:
+            json.dump(self.history, history, indent=2)
+        return regressions
+
     def test(self):
         self.clear_dmesg()
         os.chdir(self.sourcedir)
@@ -82,19 +215,56 @@ class Blktests(Test):
         genio.write_one_line("/proc/sys/kernel/hung_task_timeout_secs", "0")
         for disk in self.disk:
             os.environ['TEST_DEVS'] = ' '.join(self.disk)
-        cmd = './check %s' % self.dev_type
-        result = process.run(cmd, ignore_status=True, verbose=True)
+        if self.parallel:
+            devs = ' '.join(self.disk).strip()
+            independent, shared = self.plan_lanes(self.lane_groups,
+                                                  self.independent_groups)
+            lanes = [('nodev%s' % idx, [(test, '', '') for test in tests])
+                     for idx, tests in enumerate(independent)]
+            # the device tests load the same modules as the shared groups,
+            # run them first in the shared lane rather than alongside it
+            steps = []
+            if devs:
+                for group in self.dev_type.split():
+                    steps.extend((test, devs, '-d')
+                                 for test in self.group_tests(group))
+            steps.extend((test, '', '') for test in shared)
+            if steps:
+                lanes.append(('shared', steps))
+            stdout, results_dirs = self.run_lanes(lanes)
+        else:
+            results_dirs = [os.path.join(self.outputdir, 'results')]
+            cmd = './check -o %s %s' % (results_dirs[0], self.dev_type)
+            result = process.run(cmd, ignore_status=True, verbose=True)
+            stdout = result.stdout.decode(errors="ignore")
+            exit_status = result.exit_status
+
+        results = {}
+        for results_dir in results_dirs:
+            results.update(self.parse_results(results_dir))
+        if self.parallel:
+            # lanes chain ./check runs, their exit codes are meaningless
+            exit_status = 0 if results and all(
+                val['status'] != 'fail' for val in results.values()) else 1
+        regressions = self.update_history(results)
+        for key, val in regressions.items():
+            self.log.warn("%s runtime regressed: %ss, median %ss", key,
+                          val['runtime'], val['median'])
+        self.whiteboard = json.dumps({'results': results,
+                                      'runtime_regressions': regressions})
 
-        stdout = result.stdout.decode(errors="ignore")
         fail_pattern = re.compile(r'^(\S+/\S+).*?\[failed\]', re.MULTILINE)
         failed_tests = [m.group(1).strip() for m in fail_pattern.finditer(stdout)]
+        failed_tests += [key for key, val in results.items()
+                         if val['status'] == 'fail' and
+                         key.split(':')[0] not in failed_tests]
 
-        if result.exit_status != 0 or failed_tests:
+        if exit_status != 0 or failed_tests:
             if failed_tests:
                 failed_list = ", ".join(failed_tests)
                 summary = f"{len(failed_tests)} test(s) failed: {failed_list}"
             else:
-                summary = f"blktests exited with code {result.exit_status}"
+                summary = f"blktests exited with code {exit_status}"
             self.fail(summary)
 
         dmesg = process.system_output('dmesg')
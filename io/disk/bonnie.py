@@ -23,6 +23,8 @@ Bonnie test
 """
 
 import os
+import re
+import json
 import time
 import getpass
 from avocado import Test
@@ -327,19 +329,109 @@ class Bonnie(Test):
             self.log.info(f'No fs detected on {self.disk}')
         self.log.info("Running dd...")
 
-    def test(self):
+    @staticmethod
+    def parse_csv(output):
         """
-        Run 'bonnie' with its arguments
+        Parses the bonnie++ CSV result line, in the 1.0x layout or the
+        1.9x/2.x layout which starts with the format and bonnie versions.
+        Rates are per second, latencies in usec, "+++++" (too fast to
+        measure) and empty columns give None.
+
+        :param output: bonnie++ stdout
+        :returns: dict of typed metrics
+        """
+        tests = ['putc', 'put_block', 'rewrite', 'getc', 'get_block',
+                 'seeks']
+        file_tests = ['seq_create', 'seq_stat', 'seq_del', 'ran_create',
+                      'ran_stat', 'ran_del']
+        old_fields = ['name', 'file_size'] + [
+            val for test in tests for val in (test, test + '_cpu')] + \
+            ['num_files'] + [
+            val for test in file_tests for val in (test, test + '_cpu')]
+        new_fields = ['format_version', 'bonnie_version', 'name',
+                      'concurrency', 'seed', 'file_size', 'chunk_size'] + [
+            val for test in tests for val in (test, test + '_cpu')] + \
+            ['num_files', 'max_size', 'min_size', 'num_dirs',
+             'file_chunk_size'] + [
+            val for test in file_tests for val in (test, test + '_cpu')] + [
+            test + '_latency' for test in tests + file_tests]
+        lines = [line for line in output.splitlines() if line.count(',') > 20]
+        if not lines:
+            return {}
+        values = lines[-1].strip().split(',')
+        fields = old_fields
+        if re.match(r'^\d+\.\d+$', values[0]) and \
+                re.match(r'^\d+\.\d+', values[1]):
+            fields = new_fields
+        units = {'ns': 0.001, 'us': 1, 'ms': 1000, 's': 1000000}
+        metrics = {}
+        for name, val in zip(fields, values):
+            match = re.match(r'^([\d.]+)(ns|us|ms|s)$', val)
+            if name.endswith('_latency') and match:
+                metrics[name + '_us'] = float(match.group(1)) * \
+                    units[match.group(2)]
+            elif re.match(r'^\d+$', val):
+                metrics[name] = int(val)
+            elif re.match(r'^\d*\.\d+$', val) and name not in [
+                    'format_version', 'bonnie_version']:
+                metrics[name] = float(val)
+            elif not val or val.startswith('+'):
+                metrics[name] = None
+            else:
+                metrics[name] = val
+        return metrics
+
+    def run_bonnie(self, number_to_stat, concurrency=None):
+        """
+        Runs bonnie++ and returns the parsed CSV metrics.
         """
         args = []
         args.append('-d %s' % self.dir)
-        args.append('-n %s' % self.number_to_stat)
+        args.append('-n %s' % number_to_stat)
         args.append('-s %s' % self.data_size)
         args.append('-u %s' % self.uid_to_use)
+        if concurrency:
+            args.append('-c %s' % concurrency)
 
         cmd = ('bonnie++ %s' % " ".join(args))
-        if process.system(cmd, shell=True, ignore_status=True):
+        result = process.run(cmd, shell=True, ignore_status=True)
+        if result.exit_status:
             self.fail("test failed")
+        metrics = self.parse_csv(result.stdout_text)
+        if not metrics:
+            self.fail("No CSV result line in the bonnie++ output")
+        return metrics
+
+    def test(self):
+        """
+        Run 'bonnie' with its arguments
+        """
+        self.whiteboard = json.dumps(self.run_bonnie(self.number_to_stat))
+
+    def test_metadata_sweep(self):
+        """
+        Runs bonnie++ file tests for every file count, directory fan-out
+        and concurrency of the sweep, to see where file create/stat/delete
+        rates stop scaling on the filesystem.
+        """
+        files = self.params.get('sweep_files', default=[16, 64, 256])
+        dirs = self.params.get('sweep_dirs', default=[1, 16, 128])
+        concurrency = self.params.get('sweep_concurrency', default=[1])
+        results = []
+        for count in files:
+            for num_dirs in dirs:
+                for conc in concurrency:
+                    # -n number(*1024):max_size:min_size:num_dirs
+                    metrics = self.run_bonnie('%s:0:0:%s' % (count, num_dirs),
+                                              conc if conc > 1 else None)
+                    result = {'fs': self.fstype, 'files_k': count,
+                              'dirs': num_dirs, 'concurrency': conc}
+                    for key in ['seq_create', 'seq_stat', 'seq_del',
+                                'ran_create', 'ran_stat', 'ran_del']:
+                        result[key] = metrics.get(key)
+                    self.log.info("%s", result)
+                    results.append(result)
+        self.whiteboard = json.dumps(results)
 
     def tearDown(self):
         '''
@@ -22,6 +22,7 @@ import os
 import re
 import multiprocessing
 import json
+import statistics
 
 from avocado import Test
 from avocado.utils import archive
@@ -177,7 +178,10 @@ class Dbench(Test):
 
     def test(self):
         '''
-        Test Execution with necessary args
+        Test Execution with necessary args, after a warm up run dbench
+        runs at least min_iter times and until the coefficient of
+        variation of the throughput falls under target_cv or max_iter
+        runs are done.
         '''
         nprocs = self.params.get('nprocs', default=None)
         seconds = self.params.get('seconds', default=60)
@@ -188,13 +192,40 @@ class Dbench(Test):
         cmd = '%s/dbench %s %s -D %s -c %s -t %d' % (self.sourcedir, nprocs,
                                                      args, self.mountpoint, loadfile,
                                                      seconds)
+        min_iter = self.params.get('min_iter', default=3)
+        max_iter = self.params.get('max_iter', default=10)
+        target_cv = self.params.get('target_cv', default=0.05)
+        trim = self.params.get('trim', default=0.1)
         process.run(cmd)
 
-        self.results = process.system_output(cmd).decode("utf-8")
         pattern = re.compile(r"Throughput (.*?) MB/sec (.*?) procs")
-        (throughput, procs) = pattern.findall(self.results)[0]
-        self.whiteboard = json.dumps({'throughput': throughput,
-                                      'procs': procs})
+        samples = []
+        cv = 0.0
+        while len(samples) < max_iter:
+            self.results = process.system_output(cmd).decode("utf-8")
+            matches = pattern.findall(self.results)
+            if not matches:
+                self.fail("No throughput found in dbench output")
+            (throughput, procs) = matches[-1]
+            samples.append(float(throughput))
+            self.log.info("Iteration %s: %s MB/sec", len(samples), throughput)
+            if len(samples) > 1:
+                cv = statistics.stdev(samples) / statistics.mean(samples)
+                if len(samples) >= min_iter and cv <= target_cv:
+                    break
+        # mean without the trim fraction of lowest and highest samples
+        cut = int(len(samples) * trim)
+        kept = sorted(samples)[cut:len(samples) - cut] or samples
+        stdev = statistics.stdev(samples) if len(samples) > 1 else 0.0
+        stats = {'samples': samples, 'mean': statistics.mean(samples),
+                 'median': statistics.median(samples), 'stdev': stdev,
+                 'cv': cv, 'trimmed_mean': statistics.mean(kept)}
+        if cv > target_cv:
+            self.log.warn("CV %.3f still above %s after %s iterations",
+                          cv, target_cv, len(samples))
+        self.whiteboard = json.dumps({'throughput': stats['median'],
+                                      'procs': procs,
+                                      'throughput_stats': stats})
 
     def tearDown(self):
         '''
@@ -183,28 +183,35 @@ class FioTest(Test):
     def setup_pmem_disk(self, mnt_args):
         if not self.disk:
             self.plib = pmem.PMem()
-            regions = sorted(self.plib.run_ndctl_list(
-                '-R'), key=lambda i: i['size'], reverse=True)
+            # one listing of the regions along with their namespaces
+            regions = self.plib.run_ndctl_list('-R -N')
             if not regions:
                 self.plib.enable_region()
-                regions = sorted(self.plib.run_ndctl_list(
-                    '-R'), key=lambda i: i['size'], reverse=True)
+                regions = self.plib.run_ndctl_list('-R -N')
                 if not regions:
                     self.cancel("There are no pmem devices to test")
-            region = self.plib.run_ndctl_list_val(regions[0], 'dev')
-            if self.plib.run_ndctl_list("-N -r %s" % region):
-                self.plib.destroy_namespace(region=region, force=True)
-            if 'dax' in mnt_args:
-                self.plib.create_namespace(region=region)
+            region_json = sorted(regions, key=lambda i: i['size'],
+                                 reverse=True)[0]
+            region = self.plib.run_ndctl_list_val(region_json, 'dev')
+            mode = 'fsdax' if 'dax' in mnt_args else 'devdax'
+            namespaces = region_json.get('namespaces', [])
+            # Reuse a namespace of the needed mode spanning the whole region
+            if len(namespaces) != 1 or \
+                    namespaces[0].get('mode') != mode or \
+                    region_json.get('available_size'):
+                if namespaces:
+                    self.plib.destroy_namespace(region=region, force=True)
+                self.plib.create_namespace(region=region, mode=mode)
+                namespaces = self.plib.run_ndctl_list('-N -r %s' % region)
+            else:
+                self.log.info("Reusing %s namespace %s", mode,
+                              namespaces[0]['dev'])
+            if mode == 'fsdax':
                 self.disk = "/dev/%s" % self.plib.run_ndctl_list_val(
-                    self.plib.run_ndctl_list('-N -r %s' % region)[0],
-                    'blockdev')
+                    namespaces[0], 'blockdev')
             else:
-                self.plib.create_namespace(
-                    region=region, mode='devdax')
                 self.devdax_file = "/dev/%s" % self.plib.run_ndctl_list_val(
-                    self.plib.run_ndctl_list('-N -r %s' % region)[0],
-                    'chardev')
+                    namespaces[0], 'chardev')
 
     def pre_cleanup(self):
         """
@@ -25,6 +25,8 @@ fs_mark: Benchmark synchronous/async file creation
 
 import time
 import os
+import re
+import json
 from avocado import Test
 from avocado.utils import archive
 from avocado.utils import build
@@ -307,13 +309,84 @@ class FSMark(Test):
             self.log.info(f'No fs detected on {self.disk}')
         self.log.info("Running dd...")
 
+    @staticmethod
+    def parse_results(output):
+        """
+        Parses the fs_mark result rows, keyed by the column names of the
+        "FSUse%  Count  Size  Files/sec  App Overhead" header.
+
+        :param output: fs_mark stdout
+        :returns: list of dicts, one per loop
+        """
+        header = None
+        rows = []
+        for line in output.splitlines():
+            if line.strip().startswith('FSUse%'):
+                header = re.split(r'\s{2,}', line.strip())
+                continue
+            values = line.split()
+            if not header or len(values) != len(header) or not all(
+                    re.match(r'^[\d.]+$', val) for val in values):
+                continue
+            rows.append({name: float(val) if '.' in val else int(val)
+                         for name, val in zip(header, values)})
+        return rows
+
+    def run_fs_mark(self, num=None, extra_args=''):
+        """
+        Runs fs_mark on a clean directory and returns the parsed rows.
+        """
+        os.chdir(self.sourcedir)
+        test_dir = os.path.join(self.dir, 'fs_mark')
+        process.run('rm -rf %s' % test_dir, ignore_status=True)
+        os.makedirs(test_dir)
+        cmd = "./fs_mark -d %s -s %s -n %s %s" % (test_dir, self.size,
+                                                  num or self.num, extra_args)
+        rows = self.parse_results(process.run(cmd).stdout_text)
+        if not rows:
+            self.fail("No result rows in the fs_mark output")
+        return rows
+
     def test(self):
         """
         Run fs_mark
         """
-        os.chdir(self.sourcedir)
-        cmd = "./fs_mark -d %s -s %s -n %s" % (self.dir, self.size, self.num)
-        process.run(cmd)
+        self.whiteboard = json.dumps(self.run_fs_mark())
+
+    def test_scaling_sweep(self):
+        """
+        Runs fs_mark for every thread count, files per thread and
+        directory fan-out of the sweep and reports the thread count where
+        files/sec stops scaling for each files/dirs combination.
+        """
+        threads = self.params.get('sweep_threads', default=[1, 2, 4, 8])
+        files = self.params.get('sweep_files', default=[self.num])
+        dirs = self.params.get('sweep_dirs', default=[0, 16, 256])
+        min_gain = self.params.get('scaling_min_gain', default=0.1)
+        results = []
+        for num_files in files:
+            for num_dirs in dirs:
+                points = []
+                for thread in threads:
+                    args = '-t %s' % thread
+                    if num_dirs:
+                        per_dir = max(1, int(num_files) // num_dirs)
+                        args += ' -D %s -N %s' % (num_dirs, per_dir)
+                    rows = self.run_fs_mark(num_files, args)
+                    rate = sum(row['Files/sec'] for row in rows) / len(rows)
+                    points.append((thread, rate))
+                    results.append({'fs': self.fstype, 'threads': thread,
+                                    'files': num_files, 'dirs': num_dirs,
+                                    'files_per_sec': round(rate, 1),
+                                    'rows': rows})
+                # first thread count gaining less than min_gain over the
+                # previous one
+                knee = next((thread for (_, prev), (thread, cur)
+                             in zip(points, points[1:])
+                             if cur < prev * (1 + min_gain)), None)
+                self.log.info("%s files, %s dirs: files/sec stops scaling "
+                              "at %s threads", num_files, num_dirs, knee)
+        self.whiteboard = json.dumps(results)
 
     def tearDown(self):
         '''
@@ -17,9 +17,11 @@
 
 
 import os
+import re
+import json
 
 from avocado import Test
-from avocado.utils import process, archive, build, disk
+from avocado.utils import process, archive, build, disk, genio
 from avocado.utils.software_manager.manager import SoftwareManager
 
 
@@ -44,8 +46,12 @@ class Ioping(Test):
         self.interval = self.params.get('interval', default='1s')
         self.size = self.params.get('size', default='4k')
         self.wsize = self.params.get('wsize', default='10m')
+        self.schedulers = self.params.get('schedulers', default=[])
+        self.nr_requests = self.params.get('nr_requests', default=[])
+        self.queue_depths = self.params.get('queue_depths', default=[])
         device = self.params.get('disk', default='/home')
         self.disk = disk.get_absolute_disk_path(device)
+        self.orig_knobs = {}
 
         for package in ['gcc', 'make']:
             if not smm.check_installed(package) and not smm.install(package):
@@ -59,14 +65,149 @@ class Ioping(Test):
         self.sourcedir = os.path.join(self.workdir, 'ioping-master')
 
         build.make(self.sourcedir)
+        # ioping 1.x reports raw times in nsec, older releases in usec
+        version = process.system_output('%s/ioping -v' % self.sourcedir,
+                                        ignore_status=True).decode()
+        major = re.search(r'(\d+)\.\d+', version)
+        self.time_scale = 1000.0
+        if major and int(major.group(1)) < 1:
+            self.time_scale = 1.0
+
+    @staticmethod
+    def parse_raw(output, time_scale=1000.0):
+        """
+        Parses ioping -p/-B raw output, returns the per-period average
+        request times in usec, which are per-request times with period 1,
+        and the final statistics line.
+        """
+        lines = [line.split() for line in output.splitlines()
+                 if re.match(r'^\d+(\s+[\d.]+){7}', line)]
+        if not lines:
+            return [], {}
+        fields = ['requests', 'time', 'iops', 'bps', 'min', 'avg', 'max',
+                  'mdev']
+        summary = dict(zip(fields, [float(val) for val in lines[-1][:8]]))
+        for key in ['time', 'min', 'avg', 'max', 'mdev']:
+            summary[key] = round(summary[key] / time_scale, 2)
+        samples = [float(line[5]) / time_scale for line in lines[:-1]]
+        return samples, summary
+
+    @staticmethod
+    def latency_stats(samples):
+        """
+        Returns p50/p90/p99/p99.9/max of the latency samples in usec and a
+        power of two histogram, keyed by the bucket upper bound in usec.
+        """
+        if not samples:
+            return {}
+        ordered = sorted(samples)
+        stats = {'samples': len(ordered), 'min_us': round(ordered[0], 2),
+                 'mean_us': round(sum(ordered) / len(ordered), 2),
+                 'max_us': round(ordered[-1], 2)}
+        for pct in [50, 90, 99, 99.9]:
+            idx = min(len(ordered) - 1, int(len(ordered) * pct / 100.0))
+            stats['p%s_us' % pct] = round(ordered[idx], 2)
+        histogram = {}
+        for val in ordered:
+            bucket = 1
+            while bucket < val:
+                bucket *= 2
+            histogram[bucket] = histogram.get(bucket, 0) + 1
+        stats['histogram'] = histogram
+        return stats
+
+    def run_ioping(self):
+        """
+        Runs ioping with raw output and returns its latency stats.
+        """
+        cmd = '%s -c %s -w %s -p %s -i %s -s %s -S %s -B -q %s' % (
+            self.mode, self.count, self.deadline, self.period, self.interval,
+            self.size, self.wsize, self.disk)
+        result = process.run('./ioping %s' % cmd, ignore_status=True,
+                             shell=True)
+        if result.exit_status:
+            self.fail("test run fails of  %s" % cmd)
+        samples, summary = self.parse_raw(result.stdout_text,
+                                          self.time_scale)
+        stats = self.latency_stats(samples)
+        stats['summary'] = summary
+        return stats
+
+    def get_queue_dir(self):
+        """
+        Returns the sysfs queue directory of the whole block device
+        backing the disk, which may be a device, file or directory.
+        """
+        stat = os.stat(self.disk)
+        st_dev = stat.st_rdev if self.disk.startswith('/dev/') else \
+            stat.st_dev
+        sysdir = os.path.realpath('/sys/dev/block/%s:%s' % (
+            os.major(st_dev), os.minor(st_dev)))
+        if os.path.exists(os.path.join(sysdir, 'partition')):
+            sysdir = os.path.dirname(sysdir)
+        return sysdir
+
+    def save_knobs(self, paths):
+        """
+        Remembers the original value of every sysfs knob, before any of
+        them is written: changing the scheduler resets nr_requests.
+        """
+        for path in paths:
+            orig = genio.read_one_line(path)
+            match = re.search(r'\[(\S+)\]', orig)
+            self.orig_knobs[path] = match.group(1) if match else orig
 
     def test(self):
 
         os.chdir(self.sourcedir)
-
-        cmd = '%s -c %s -w %s -p %s -i %s -s %s -S %s %s' % (
-            self.mode, self.count, self.deadline, self.period, self.interval,
-            self.size, self.wsize, self.disk)
-
-        if process.system('./ioping %s' % cmd, ignore_status=True, shell=True):
-            self.fail("test run fails of  %s" % cmd)
+        stats = self.run_ioping()
+        self.log.info("ioping latency: %s", stats)
+        self.whiteboard = json.dumps(stats)
+
+    def test_latency_sweep(self):
+        """
+        Captures the latency distribution for every combination of the
+        I/O scheduler, nr_requests and queue_depth of the device.
+        """
+        os.chdir(self.sourcedir)
+        sysdir = self.get_queue_dir()
+        sched_file = os.path.join(sysdir, 'queue', 'scheduler')
+        schedulers = self.schedulers or re.sub(
+            r'[\[\]]', '', genio.read_one_line(sched_file)).split()
+        knobs = [(os.path.join(sysdir, 'queue', 'nr_requests'),
+                  self.nr_requests),
+                 (os.path.join(sysdir, 'device', 'queue_depth'),
+                  self.queue_depths)]
+        grid = [{}]
+        for path, values in knobs:
+            if not values:
+                continue
+            if not os.path.exists(path):
+                self.log.warn("%s not present, not sweeping it", path)
+                continue
+            grid = [dict(cfg, **{path: val}) for cfg in grid
+                    for val in values]
+        # the scheduler comes first so it is restored first
+        self.save_knobs([sched_file] + [path for path, _ in knobs
+                                        if os.path.exists(path)])
+        results = []
+        for sched in schedulers:
+            genio.write_one_line(sched_file, sched)
+            for cfg in grid:
+                for path, value in cfg.items():
+                    genio.write_one_line(path, str(value))
+                stats = self.run_ioping()
+                stats['scheduler'] = sched
+                for path, value in cfg.items():
+                    stats[os.path.basename(path)] = value
+                self.log.info("%s %s: p50 %s us, p99 %s us", sched, cfg,
+                              stats.get('p50_us'), stats.get('p99_us'))
+                results.append(stats)
+        self.whiteboard = json.dumps(results)
+
+    def tearDown(self):
+        '''
+        Restores the sysfs knobs changed by the sweep
+        '''
+        for path, value in self.orig_knobs.items():
+            genio.write_one_line(path, value)
@@ -21,6 +21,8 @@ Needs to be run as root.
 """
 
 import os
+import glob
+import json
 import shutil
 import time
 from pprint import pprint
@@ -68,6 +70,18 @@ class MultipathTest(Test):
         smm = SoftwareManager()
         if not smm.check_installed(pkg_name) and not smm.install(pkg_name):
             self.cancel("Can not install %s" % pkg_name)
+        if 'io_stall' in str(self.name.name):
+            if not smm.check_installed('fio') and not smm.install('fio'):
+                self.cancel("Can not install fio")
+        self.iodepths = self.params.get('iodepths', default=[1, 16, 64])
+        self.io_rw = self.params.get('io_rw', default='randread')
+        self.io_events = self.params.get('io_events',
+                                         default=['fail_path', 'fail_n-1',
+                                                  'fail_all', 'suspend',
+                                                  'remove_path'])
+        self.event_hold = int(self.params.get('event_hold', default=10))
+        self.io_settle = int(self.params.get('io_settle', default=10))
+        self.log_msec = int(self.params.get('log_msec', default=100))
 
         # Check if given multipath devices are present in system
         self.wwids = self.params.get('wwids', default='').split(' ')
@@ -358,6 +372,144 @@ class MultipathTest(Test):
         if err_mpaths:
             self.fail("error mpaths in remove_add mpaths: %s" % err_mpaths)
 
+    def test_path_events_io_stall(self):
+        '''
+        Keeps a timestamped direct-I/O stream running on every mpath
+        device while paths are failed, reinstated, suspended and removed,
+        and reports per event the I/O stall, max completion latency and
+        IOPS dip, for each path_selector policy and queue depth.
+        '''
+        results = []
+        for policy in self.policies:
+            plcy = "path_selector \"%s 0\"" % policy
+            multipath.form_conf_mpath_file(defaults_extra=plcy)
+            time.sleep(5)
+            for iodepth in self.iodepths:
+                for dic_path in self.mpath_list:
+                    for event, down, up in self.path_events(dic_path):
+                        stats = self.run_event_with_io(iodepth, down, up)
+                        stats.update({'policy': policy, 'iodepth': iodepth,
+                                      'mpath': dic_path['name'],
+                                      'event': event})
+                        self.log.info("%s", stats)
+                        results.append(stats)
+        multipath.form_conf_mpath_file(
+            defaults_extra="path_selector \"%s 0\"" % self.policy)
+        summary = {}
+        for policy in self.policies:
+            events = [res for res in results if res['policy'] == policy]
+            summary[policy] = {
+                key: round(sum(res[key] for res in events) /
+                           max(len(events), 1), 3)
+                for key in ['stall_sec', 'max_clat_ms', 'iops_dip_pct']}
+        self.log.info("Per policy summary: %s", summary)
+        self.whiteboard = json.dumps({'summary': summary,
+                                      'events': results})
+        if [res for res in results if res['errors']]:
+            self.fail("Path events failed: %s" %
+                      [res for res in results if res['errors']])
+
+    def path_events(self, dic_path):
+        '''
+        Returns (event, down operation, up operation) of io_events
+        for the given mpath, each operation returning False on failure.
+        '''
+        paths = dic_path["paths"]
+        name = dic_path["name"]
+
+        def on_paths(func, targets):
+            return lambda: all([func(path) is not False
+                                for path in targets])
+        return [event for event in [
+            ('fail_path', on_paths(multipath.fail_path, paths[:1]),
+             on_paths(multipath.reinstate_path, paths[:1])),
+            ('fail_n-1', on_paths(multipath.fail_path, paths[:-1]),
+             on_paths(multipath.reinstate_path, paths[:-1])),
+            ('fail_all', on_paths(multipath.fail_path, paths),
+             on_paths(multipath.reinstate_path, paths)),
+            ('suspend', lambda: multipath.suspend_mpath(name) is not False,
+             lambda: multipath.resume_mpath(name) is not False),
+            ('remove_path', on_paths(multipath.remove_path, paths[:1]),
+             on_paths(multipath.add_path, paths[:1]))]
+            if event[0] in self.io_events]
+
+    def run_event_with_io(self, iodepth, down, up):
+        '''
+        Runs fio with iops and max latency logs on all mpath devices,
+        performs the down operation after io_settle seconds, holds it for
+        event_hold seconds, performs the up operation and analyses the
+        logs of the event window.
+        '''
+        prefix = os.path.join(self.logdir, 'mpath_io')
+        for log in glob.glob('%s_*.log' % prefix):
+            os.remove(log)
+        runtime = 2 * self.io_settle + self.event_hold
+        job = ("--ioengine=libaio --direct=1 --rw=%s --bs=4k --iodepth=%s "
+               "--time_based --runtime=%s --continue_on_error=all "
+               "--log_avg_msec=%s --log_max_value=1 --write_iops_log=%s "
+               "--write_lat_log=%s" % (self.io_rw, iodepth, runtime,
+                                       self.log_msec, prefix, prefix))
+        for dic_path in self.mpath_list:
+            job += " --name=%s --filename=/dev/mapper/%s" % (
+                dic_path['name'], dic_path['name'])
+        fio = process.SubProcess("fio %s" % job, shell=True, verbose=False)
+        start = time.time()
+        fio.start()
+        time.sleep(self.io_settle)
+        down_at = time.time() - start
+        errors = []
+        if not down():
+            errors.append('down')
+        time.sleep(self.event_hold)
+        if not up():
+            errors.append('up')
+        up_at = time.time() - start
+        fio.wait(timeout=runtime + 60)
+        stats = self.io_event_stats(prefix, down_at * 1000, up_at * 1000)
+        stats['errors'] = errors
+        return stats
+
+    def io_event_stats(self, prefix, down_ms, up_ms):
+        '''
+        Summarizes the fio logs: baseline IOPS before the event, longest
+        run of zero IOPS intervals (stall), IOPS dip and max completion
+        latency from the event start until io_settle after recovery.
+        '''
+        def read_log(name, combine):
+            samples = {}
+            for log in glob.glob('%s_%s.*.log' % (prefix, name)):
+                with open(log) as log_file:
+                    for line in log_file:
+                        fields = line.split(',')
+                        if len(fields) < 2:
+                            continue
+                        stamp = int(fields[0]) // self.log_msec
+                        samples[stamp] = combine(samples.get(stamp, 0),
+                                                 int(fields[1]))
+            return samples
+        # iops of all the mpath jobs add up, latency keeps the worst
+        iops = read_log('iops', lambda old, new: old + new)
+        clat = read_log('clat', max)
+        first = int(down_ms) // self.log_msec
+        last = int(up_ms + self.io_settle * 1000) // self.log_msec
+        baseline = [iops.get(idx, 0) for idx in range(first)][1:]
+        baseline = sum(baseline) / max(len(baseline), 1)
+        window = [iops.get(idx, 0) for idx in range(first, last)]
+        stall = longest = 0
+        for value in window:
+            longest = longest + 1 if not value else 0
+            stall = max(stall, longest)
+        # lat logs are in nsec
+        max_clat = max([clat.get(idx, 0) for idx in range(first, last)] +
+                       [0]) / 10 ** 6
+        dip = 0
+        if baseline and window:
+            dip = max(0, 100 * (1 - min(window) / baseline))
+        return {'baseline_iops': round(baseline, 1),
+                'stall_sec': round(stall * self.log_msec / 1000, 3),
+                'max_clat_ms': round(max_clat, 3),
+                'iops_dip_pct': round(dip, 2)}
+
     def tearDown(self):
         """
         Restore config file, if existed, and restart services
@@ -0,0 +1,262 @@
+#!/usr/bin/env python
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+# See LICENSE for more details.
+#
+# Copyright: 2024 IBM
+# Block queue tuning explorer for the io/disk workloads
+
+"""
+Walks a grid of block queue settings (scheduler, nr_requests,
+read_ahead_kb, max_sectors_kb, rq_affinity) on a device, runs a short fio
+probe modelled on one of the io/disk workloads for each setting and
+reports the best throughput and the best p99 latency configurations.
+"""
+
+import os
+import json
+import time
+import itertools
+
+from avocado import Test
+from avocado.utils import disk
+from avocado.utils import genio
+from avocado.utils import process
+from avocado.utils.software_manager.manager import SoftwareManager
+
+# fio options approximating the I/O pattern of each io/disk workload
+PROFILES = {
+    'fiotest': '--rw=randrw --bs=4k --iodepth=32 --numjobs=4',
+    'iozone': '--rw=rw --bs=64k --iodepth=1 --numjobs=1',
+    'disktest': '--rw=randrw --bs=512k --iodepth=4 --numjobs=2',
+    'parallel_dd': '--rw=write --bs=1M --iodepth=1 --numjobs=4 '
+                   '--offset_increment=20%',
+    'tiobench': '--rw=randread --bs=4k --iodepth=1 --numjobs=8',
+}
+
+# order matters, a scheduler switch resets nr_requests
+KNOBS = ['scheduler', 'nr_requests', 'read_ahead_kb', 'max_sectors_kb',
+         'rq_affinity']
+
+
+class QueueTuning(Test):
+
+    '''
+    Block queue tuning explorer.
+    1. Builds the grid of the queue attributes given in the yaml, the
+       scheduler defaults to every scheduler the device offers.
+    2. Runs a time based fio probe with the workload profile for each
+       combination, combinations clearly worse than the best one so far
+       after early_stop_sec are pruned.
+    3. Reports the best throughput and best p99 configurations and
+       restores the original queue attributes.
+
+    :avocado: tags=disk,privileged
+    '''
+
+    def setUp(self):
+        '''
+        Set up
+        '''
+        smm = SoftwareManager()
+        if not smm.check_installed('fio') and not smm.install('fio'):
+            self.cancel("fio is needed for this test.")
+        device = self.params.get('disk', default=None)
+        if not device:
+            self.cancel("Test requires disk parameter, Please check README")
+        self.disk = disk.get_absolute_disk_path(device)
+        workload = self.params.get('workload', default='fiotest')
+        if workload not in PROFILES:
+            self.cancel("Unknown workload %s, expected one of %s"
+                        % (workload, sorted(PROFILES)))
+        self.fio_args = self.params.get('fio_args',
+                                        default=PROFILES[workload])
+        self.workload = workload
+        self.probe_runtime = self.params.get('probe_runtime', default=20)
+        self.early_stop_sec = self.params.get('early_stop_sec', default=5)
+        self.early_stop_ratio = self.params.get('early_stop_ratio',
+                                                default=0.7)
+        self.queue_dir = self.get_queue_dir()
+        self.orig_knobs = {}
+        for knob in KNOBS:
+            path = os.path.join(self.queue_dir, knob)
+            if os.path.exists(path):
+                self.orig_knobs[knob] = self.read_knob(knob)
+
+    def get_queue_dir(self):
+        '''
+        Returns the sysfs queue directory of the whole device.
+        '''
+        st_rdev = os.stat(self.disk).st_rdev
+        sysdir = os.path.realpath('/sys/dev/block/%s:%s' % (
+            os.major(st_rdev), os.minor(st_rdev)))
+        if os.path.exists(os.path.join(sysdir, 'partition')):
+            sysdir = os.path.dirname(sysdir)
+        return os.path.join(sysdir, 'queue')
+
+    def read_knob(self, knob):
+        '''
+        Reads a queue attribute, the active one for the scheduler.
+        '''
+        value = genio.read_one_line(os.path.join(self.queue_dir, knob))
+        if knob == 'scheduler' and '[' in value:
+            return value.split('[')[1].split(']')[0]
+        return value
+
+    def write_knob(self, knob, value):
+        '''
+        Writes a queue attribute, returns False if the kernel rejects it.
+        '''
+        try:
+            genio.write_one_line(os.path.join(self.queue_dir, knob),
+                                 str(value))
+        except OSError as details:
+            self.log.warn("Cannot set %s to %s: %s", knob, value, details)
+            return False
+        return True
+
+    def build_grid(self):
+        '''
+        Returns the list of {knob: value} combinations to probe.
+        '''
+        values = {}
+        available = genio.read_one_line(
+            os.path.join(self.queue_dir, 'scheduler'))
+        values['scheduler'] = self.params.get(
+            'schedulers', default=None) or available.replace(
+                '[', '').replace(']', '').split()
+        max_hw = int(genio.read_one_line(
+            os.path.join(self.queue_dir, 'max_hw_sectors_kb')))
+        defaults = {'nr_requests': [64, 256],
+                    'read_ahead_kb': [128, 1024],
+                    'max_sectors_kb': [128, max_hw],
+                    'rq_affinity': [1, 2]}
+        for knob, default in defaults.items():
+            values[knob] = self.params.get(knob, default=default)
+            if knob == 'max_sectors_kb':
+                values[knob] = sorted(set(
+                    max_hw if val == 'max' else min(int(val), max_hw)
+                    for val in values[knob]))
+        knobs = [knob for knob in KNOBS if knob in self.orig_knobs]
+        return [dict(zip(knobs, combo)) for combo in
+                itertools.product(*[values[knob] for knob in knobs])]
+
+    @staticmethod
+    def parse_status(output):
+        '''
+        Returns the last complete json report of fio output, which holds
+        one report per --status-interval.
+        '''
+        decoder = json.JSONDecoder()
+        report = None
+        idx = output.find('{')
+        while idx != -1:
+            try:
+                report, end = decoder.raw_decode(output, idx)
+            except ValueError:
+                break
+            idx = output.find('{', end)
+        return report
+
+    @staticmethod
+    def probe_metrics(report):
+        '''
+        Returns the bandwidth in MB/s, IOPS and p99 completion latency in
+        usec (worst of read and write) of a fio json report.
+        '''
+        job = report['jobs'][0]
+        metrics = {'bw_mbs': 0, 'iops': 0, 'p99_us': 0}
+        for ddir in ['read', 'write']:
+            stats = job[ddir]
+            if not stats.get('io_bytes'):
+                continue
+            metrics['bw_mbs'] += stats['bw'] / 1024.0
+            metrics['iops'] += stats['iops']
+            pct = stats.get('clat_ns', {}).get('percentile', {})
+            metrics['p99_us'] = max(metrics['p99_us'],
+                                    pct.get('99.000000', 0) / 1000.0)
+        return {key: round(val, 1) for key, val in metrics.items()}
+
+    def run_probe(self, best):
+        '''
+        Runs the fio probe, stops it after early_stop_sec if both its
+        throughput and p99 are clearly worse than the best so far.
+        Returns the metrics and whether the probe was pruned.
+        '''
+        cmd = ('fio --name=probe --filename=%s --direct=1 --ioengine=libaio '
+               '--time_based --runtime=%s --group_reporting '
+               '--output-format=json --status-interval=1 %s'
+               % (self.disk, self.probe_runtime, self.fio_args))
+        fio = process.SubProcess(cmd, verbose=False, sudo=True)
+        fio.start()
+        start = time.monotonic()
+        pruned = False
+        while fio.poll() is None:
+            time.sleep(1)
+            if not best or time.monotonic() - start < self.early_stop_sec:
+                continue
+            report = self.parse_status(fio.get_stdout().decode())
+            if not report:
+                continue
+            metrics = self.probe_metrics(report)
+            ratio = self.early_stop_ratio
+            if metrics['bw_mbs'] < best['bw_mbs'] * ratio and \
+                    metrics['p99_us'] * ratio > best['p99_us']:
+                fio.terminate()
+                pruned = True
+                break
+            # passed the early check, let it run to the end
+            best = None
+        fio.wait()
+        report = self.parse_status(fio.get_stdout().decode())
+        if not report:
+            self.fail("fio probe failed: %s" % fio.get_stderr().decode())
+        return self.probe_metrics(report), pruned
+
+    def test(self):
+        '''
+        Probes every queue setting of the grid with the workload.
+        '''
+        results = []
+        best = None
+        for config in self.build_grid():
+            if not all(self.write_knob(knob, val)
+                       for knob, val in config.items()):
+                continue
+            metrics, pruned = self.run_probe(best)
+            result = dict(config, pruned=pruned, **metrics)
+            self.log.info("%s", result)
+            results.append(result)
+            if not pruned and (not best or
+                               metrics['bw_mbs'] > best['bw_mbs']):
+                best = metrics
+        complete = [result for result in results if not result['pruned']]
+        if not complete:
+            self.fail("No queue setting could be probed")
+        best_bw = max(complete, key=lambda result: result['bw_mbs'])
+        best_p99 = min(complete, key=lambda result: result['p99_us'])
+        self.log.info("Best throughput: %s", best_bw)
+        self.log.info("Best p99: %s", best_p99)
+        self.whiteboard = json.dumps({'workload': self.workload,
+                                      'disk': self.disk,
+                                      'original': self.orig_knobs,
+                                      'best_throughput': best_bw,
+                                      'best_p99': best_p99,
+                                      'results': results})
+
+    def tearDown(self):
+        '''
+        Restores the original queue attributes
+        '''
+        if hasattr(self, 'orig_knobs'):
+            for knob in KNOBS:
+                if knob in self.orig_knobs:
+                    self.write_knob(knob, self.orig_knobs[knob])
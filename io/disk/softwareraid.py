@@ -25,9 +25,17 @@ Some RAID levels include redundancy and so can survive some degree of device
 failure.
 """
 
+import os
+import re
+import json
+import time
+
 from avocado import Test
 from avocado.utils.software_manager.manager import SoftwareManager
 from avocado.utils import disk
+from avocado.utils import genio
+from avocado.utils import linux_modules
+from avocado.utils import process
 from avocado.utils import softwareraid
 
 
@@ -44,11 +52,15 @@ class SoftwareRaid(Test):
         """
         self.disks = []
         self.spare_disks = []
+        self.backing = []
         smm = SoftwareManager()
         if not smm.check_installed("mdadm"):
             self.log.info("Mdadm must be installed before continuing the test")
             if SoftwareManager().install("mdadm") is False:
                 self.cancel("Unable to install mdadm")
+        if 'benchmark' in str(self.name.name):
+            self.setup_benchmark(smm)
+            return
         disks = (self.params.get('disks', default='').strip()).split()
         if not disks:
             self.cancel('No disks given')
@@ -72,6 +84,237 @@ class SoftwareRaid(Test):
         self.sraid = softwareraid.SoftwareRaid(raid, raidlevel, self.disks,
                                                metadata, self.spare_disks)
 
+    def setup_benchmark(self, smm):
+        """
+        Reads the benchmark parameters and sets up the member devices, on
+        loop devices or null_blk when no disks are given.
+        """
+        if not smm.check_installed("fio") and not smm.install("fio"):
+            self.cancel("fio is needed for the benchmark")
+        self.bench_levels = [str(level) for level in self.params.get(
+            'bench_levels', default=[0, 1, 5, 6, 10])]
+        self.bench_chunks = self.params.get('bench_chunks',
+                                            default=[64, 512])
+        self.reshape_levels = [str(level) for level in self.params.get(
+            'reshape_levels', default=[5, 6])]
+        self.speed_limits = self.params.get(
+            'speed_limits', default=['1000:200000', '50000:200000'])
+        self.sample_interval = self.params.get('sample_interval', default=1)
+        self.sync_timeout = self.params.get('sync_timeout', default=3600)
+        self.fg_runtime = self.params.get('fg_runtime', default=15)
+        self.raid = self.params.get('raidname', default='/dev/md/sraid')
+        self.metadata = str(self.params.get('metadata', default='1.2'))
+        self.orig_limits = {}
+        for limit in ['speed_limit_min', 'speed_limit_max']:
+            self.orig_limits[limit] = genio.read_one_line(
+                '/proc/sys/dev/raid/%s' % limit)
+        disks = (self.params.get('disks', default='').strip()).split()
+        if disks:
+            self.disks = [disk.get_absolute_disk_path(dev) for dev in disks]
+        else:
+            self.disks = self.setup_backing()
+        if len(self.disks) < 5:
+            self.cancel("Benchmark needs 5 member devices, 4 for the array "
+                        "and one for rebuild/reshape")
+        self.sraid = None
+
+    def setup_backing(self):
+        """
+        Creates the member devices, sparse files on loop devices with
+        direct I/O or null_blk devices, as per bench_backing.
+        """
+        backing = self.params.get('bench_backing', default='loop')
+        count = self.params.get('bench_disk_count', default=5)
+        size_mb = self.params.get('bench_disk_size_mb', default=2048)
+        if backing == 'null_blk':
+            if linux_modules.module_is_loaded("null_blk"):
+                if process.system("rmmod null_blk", ignore_status=True):
+                    self.cancel("null_blk in use, cannot reconfigure it")
+            if process.system("modprobe null_blk nr_devices=%s gb=%s"
+                              % (count, max(1, size_mb // 1024)),
+                              ignore_status=True):
+                self.cancel("null_blk module not loadable")
+            self.backing = ['null_blk']
+            return ["/dev/nullb%s" % idx for idx in range(count)]
+        devices = []
+        for idx in range(count):
+            img = os.path.join(self.workdir, 'member%s.img' % idx)
+            process.run('truncate -s %sM %s' % (size_mb, img))
+            dev = process.system_output('losetup -f --show --direct-io=on %s'
+                                        % img, sudo=True).decode().strip()
+            self.backing.append(dev)
+            devices.append(dev)
+        return devices
+
+    def md_sysfs(self, attr):
+        """
+        Returns the md sysfs attribute of the benchmark array.
+        """
+        mdname = os.path.basename(os.path.realpath(self.raid))
+        return genio.read_one_line('/sys/block/%s/md/%s' % (mdname, attr))
+
+    def set_speed_limits(self, limits):
+        """
+        Sets speed_limit_min/max, given as "min:max" in KB/s.
+        """
+        for name, value in zip(['speed_limit_min', 'speed_limit_max'],
+                               str(limits).split(':')):
+            genio.write_one_line('/proc/sys/dev/raid/%s' % name, value)
+
+    def sample_sync(self, stop=None):
+        """
+        Samples sync_action, sync_speed, sync_completed and the mdstat
+        progress until the sync finishes, or until stop() returns True.
+        Returns the elapsed seconds and the time series.
+        """
+        series = []
+        start = time.monotonic()
+        # md may hold the sync back for a moment after the trigger
+        while self.md_sysfs('sync_action') == 'idle':
+            if time.monotonic() - start > 10:
+                return 0, series
+            time.sleep(0.1)
+        while True:
+            action = self.md_sysfs('sync_action')
+            if action == 'idle' or (stop and stop()):
+                break
+            sample = {'time': round(time.monotonic() - start, 2),
+                      'action': action,
+                      'sync_completed': self.md_sysfs('sync_completed')}
+            speed = self.md_sysfs('sync_speed')
+            sample['sync_speed_kbs'] = int(speed) if speed.isdigit() else 0
+            match = re.search(r'(\w+)\s*=\s*([\d.]+)%.*finish=([\d.]+)min',
+                              genio.read_file('/proc/mdstat'))
+            if match:
+                sample['mdstat_pct'] = float(match.group(2))
+                sample['mdstat_finish_min'] = float(match.group(3))
+            series.append(sample)
+            if time.monotonic() - start > self.sync_timeout:
+                self.fail("md %s did not finish in %ss"
+                          % (action, self.sync_timeout))
+            time.sleep(self.sample_interval)
+        return round(time.monotonic() - start, 2), series
+
+    def save_series(self, name, series):
+        """
+        Writes the time series to the test output directory.
+        """
+        with open(os.path.join(self.outputdir, '%s.json' % name),
+                  'w') as series_file:
+            json.dump(series, series_file, indent=2)
+
+    def create_bench_raid(self, level, chunk, members):
+        """
+        Creates the array without --assume-clean, so the initial resync
+        runs, and returns the SoftwareRaid object.
+        """
+        cmd = "yes | mdadm --create %s --level=%s --raid-devices=%s %s " \
+              "--metadata=%s --verbose --force" % (
+                  self.raid, level, len(members), ' '.join(members),
+                  self.metadata)
+        if chunk:
+            cmd += " --chunk=%s" % chunk
+        if process.system(cmd, shell=True, ignore_status=True):
+            self.fail("Failed to create raid%s with chunk %s" % (level, chunk))
+        self.sraid = softwareraid.SoftwareRaid(self.raid, level, members,
+                                               self.metadata)
+        return self.sraid
+
+    def rebuild(self, sraid, member):
+        """
+        Fails and removes a member, then adds it back to start a rebuild.
+        """
+        if not sraid.remove_disk(member):
+            self.fail("Failed to remove %s" % member)
+        process.system("mdadm --zero-superblock %s" % member,
+                       ignore_status=True)
+        if not sraid.add_disk(member):
+            self.fail("Failed to add %s" % member)
+
+    def foreground_io(self, sraid, member, limits):
+        """
+        Runs direct random read/write fio on the array during a rebuild
+        with the given speed limits. Returns the fio bandwidth and the
+        sync speed seen while fio was running.
+        """
+        self.set_speed_limits(limits)
+        self.rebuild(sraid, member)
+        cmd = "fio --name=fg --filename=%s --direct=1 --rw=randrw " \
+              "--bs=64k --ioengine=libaio --iodepth=16 --time_based " \
+              "--runtime=%s --output-format=json" % (self.raid,
+                                                     self.fg_runtime)
+        fio = process.SubProcess(cmd, sudo=True)
+        fio.start()
+        _, series = self.sample_sync(stop=lambda: fio.poll() is not None)
+        fio.wait(timeout=self.fg_runtime + 60)
+        output = fio.get_stdout().decode()
+        try:
+            job = json.loads(output[output.find('{'):])['jobs'][0]
+        except (ValueError, KeyError, IndexError):
+            self.fail("fio during rebuild failed")
+        speeds = [sample['sync_speed_kbs'] for sample in series]
+        result = {'speed_limits': limits,
+                  'fg_read_mbs': round(job['read']['bw'] / 1024.0, 1),
+                  'fg_write_mbs': round(job['write']['bw'] / 1024.0, 1),
+                  'sync_speed_kbs': sum(speeds) // len(speeds)
+                  if speeds else 0}
+        self.sample_sync()
+        return result, series
+
+    def test_resync_benchmark(self):
+        """
+        Times the initial resync, the rebuild of a failed member and the
+        reshape to one more member for every level and chunk size, and
+        measures foreground I/O during rebuild at each speed limit.
+        """
+        members, spare = self.disks[:4], self.disks[4]
+        default_limits = '%s:%s' % (self.orig_limits['speed_limit_min'],
+                                    self.orig_limits['speed_limit_max'])
+        results = []
+        for level in self.bench_levels:
+            chunks = self.bench_chunks
+            if level == '1':
+                chunks = ['']
+            for chunk in chunks:
+                name = 'raid%s_chunk%s' % (level, chunk or 'none')
+                self.set_speed_limits(default_limits)
+                sraid = self.create_bench_raid(level, chunk, members)
+                result = {'level': level, 'chunk_kb': chunk}
+                if level != '0':
+                    result['resync_sec'], series = self.sample_sync()
+                    self.save_series('%s_resync' % name, series)
+                    self.rebuild(sraid, members[-1])
+                    result['rebuild_sec'], series = self.sample_sync()
+                    self.save_series('%s_rebuild' % name, series)
+                    result['foreground'] = []
+                    for limits in self.speed_limits:
+                        fg_result, series = self.foreground_io(
+                            sraid, members[-1], limits)
+                        self.save_series('%s_fg_%s' % (
+                            name, limits.replace(':', '_')), series)
+                        result['foreground'].append(fg_result)
+                if level in self.reshape_levels:
+                    self.set_speed_limits(default_limits)
+                    if not sraid.add_disk(spare):
+                        self.fail("Failed to add %s for reshape" % spare)
+                    if process.system(
+                            "mdadm --grow %s --raid-devices=%s "
+                            "--backup-file=%s" % (
+                                self.raid, len(members) + 1,
+                                os.path.join(self.workdir, 'reshape.bak')),
+                            ignore_status=True):
+                        self.fail("Failed to reshape %s" % name)
+                    sraid.disks = members + [spare]
+                    result['reshape_sec'], series = self.sample_sync()
+                    self.save_series('%s_reshape' % name, series)
+                self.log.info("%s", result)
+                results.append(result)
+                sraid.stop()
+                sraid.disks = members + [spare]
+                sraid.clear_superblock()
+                self.sraid = None
+        self.whiteboard = json.dumps(results)
+
     def test(self):
         """
         Decides which functions to be run for a particular raid level, and runs
@@ -94,6 +337,15 @@ class SoftwareRaid(Test):
         """
         Stop/Remove the raid device.
         """
-        if hasattr(self, "sraid"):
+        if hasattr(self, "sraid") and self.sraid:
             self.sraid.stop()
             self.sraid.clear_superblock()
+        if hasattr(self, "orig_limits") and self.orig_limits:
+            for name, value in self.orig_limits.items():
+                genio.write_one_line('/proc/sys/dev/raid/%s' % name, value)
+        for dev in self.backing:
+            if dev == 'null_blk':
+                process.system("rmmod null_blk", ignore_status=True)
+            else:
+                process.system('losetup -d %s' % dev, sudo=True,
+                               ignore_status=True)
@@ -21,6 +21,9 @@ using nvme cli.
 """
 
 import os
+import re
+import json
+import time
 from avocado import Test
 from avocado.utils import disk
 from avocado.utils import process
@@ -86,6 +89,16 @@ class NVMeTest(Test):
         if 'firmware_upgrade' in str(self.name) and not self.firmware_url:
             self.cancel("firmware url not given")
 
+        self.bench_block_sizes = self.params.get(
+            'bench_block_sizes', default=['4k', '16k', '64k', '256k', '1m'])
+        self.bench_queue_depths = self.params.get(
+            'bench_queue_depths', default=[1, 4, 16, 32, 128])
+        self.bench_runtime = int(self.params.get('bench_runtime', default=10))
+        self.bench_rw = self.params.get('bench_rw', default='randread')
+        if 'benchmark' in str(self.name):
+            if not smm.check_installed("fio") and not smm.install("fio"):
+                self.cancel('fio is needed for the benchmark tests')
+
         cmd = "%s id-ctrl %s -H" % (self.binary, self.device)
         self.id_ctrl = process.system_output(cmd, shell=True).decode("utf-8")
 
@@ -295,6 +308,162 @@ class NVMeTest(Test):
             self.binary, self.device, ns_id, controller)
         process.system(cmd, shell=True, ignore_status=True)
 
+    def get_lba_formats(self):
+        """
+        Returns the LBA formats of the first namespace as a list of
+        (format index, data size in bytes, metadata size, in use)
+        """
+        formats = []
+        namespace = self.ns_list()
+        if not namespace:
+            return formats
+        cmd = "%s id-ns %sn%s" % (self.binary, self.device, namespace[0])
+        for line in self.run_cmd_return_output_list(cmd):
+            match = re.match(r'lbaf\s+(\d+)\s*:\s*ms:(\d+)\s+lbads:(\d+)',
+                             line)
+            if match:
+                formats.append((int(match.group(1)),
+                                pow(2, int(match.group(3))),
+                                int(match.group(2)), 'in use' in line))
+        return formats
+
+    def timed_cmd(self, cmd):
+        """
+        Runs the nvme command and returns the time it took, None if it
+        failed
+        """
+        start = time.monotonic()
+        if process.system(cmd, shell=True, ignore_status=True):
+            return None
+        return time.monotonic() - start
+
+    @staticmethod
+    def time_stats(timings):
+        """
+        Returns count, mean, max and total in msec of the timings
+        """
+        timings = [timing * 1000 for timing in timings if timing is not None]
+        if not timings:
+            return {'count': 0}
+        return {'count': len(timings),
+                'mean_ms': round(sum(timings) / len(timings), 2),
+                'max_ms': round(max(timings), 2),
+                'total_ms': round(sum(timings), 2)}
+
+    def run_fio(self, block_size, iodepth):
+        """
+        Runs a short direct I/O load on the namespace and returns IOPS and
+        completion latency
+        """
+        cmd = ("fio --name=nvme --filename=%s --ioengine=libaio --direct=1 "
+               "--rw=%s --bs=%s --iodepth=%s --time_based --runtime=%s "
+               "--output-format=json" % (self.id_ns, self.bench_rw,
+                                         block_size, iodepth,
+                                         self.bench_runtime))
+        output = process.system_output(cmd, shell=True, ignore_status=True)
+        try:
+            job = json.loads(output.decode("utf-8"))['jobs'][0]
+        except (ValueError, KeyError, IndexError):
+            self.fail("fio failed on %s" % self.id_ns)
+        result = job['write' if 'write' in self.bench_rw else 'read']
+        return {'iops': round(result['iops']),
+                'bw_mbs': round(result['bw'] / 1024.0, 1),
+                'clat_mean_us': round(result['clat_ns']['mean'] / 1000, 1),
+                'clat_p99_us': round(result['clat_ns'].get('percentile', {})
+                                     .get('99.000000', 0) / 1000, 1)}
+
+    def test_ns_mgmt_benchmark(self):
+        """
+        Times namespace create/attach/detach/delete at the maximum
+        namespace count, with a single rescan for the whole batch.
+        """
+        self.delete_all_ns()
+        max_ns = self.get_max_ns_count()
+        block_size = self.get_block_size()
+        per_ns_blocks = int(60 * self.get_total_capacity() / 100 //
+                            block_size // max_ns)
+        controller = self.get_ns_controller()
+        timings = {'create': [], 'attach': [], 'detach': [], 'delete': []}
+        for ns_id in range(1, max_ns + 1):
+            timings['create'].append(self.timed_cmd(
+                "%s create-ns %s --nsze=%s --ncap=%s --flbas=0 -dps=0" % (
+                    self.binary, self.device, per_ns_blocks,
+                    per_ns_blocks)))
+            timings['attach'].append(self.timed_cmd(
+                "%s attach-ns %s --namespace-id=%s -controllers=%s" % (
+                    self.binary, self.device, ns_id, controller)))
+        rescan = self.timed_cmd("%s ns-rescan %s" % (self.binary,
+                                                     self.device))
+        created = len(self.ns_list())
+        for ns_id in self.ns_list():
+            timings['detach'].append(self.timed_cmd(
+                "%s detach-ns %s --namespace-id=%s -controllers=%s" % (
+                    self.binary, self.device, ns_id, controller)))
+            timings['delete'].append(self.timed_cmd(
+                "%s delete-ns %s -n %s" % (self.binary, self.device, ns_id)))
+        rescan_after_delete = self.timed_cmd("%s ns-rescan %s" % (
+            self.binary, self.device))
+        results = {op: self.time_stats(values)
+                   for op, values in timings.items()}
+        results.update({'max_ns': max_ns, 'created': created,
+                        'rescan': self.time_stats([rescan,
+                                                   rescan_after_delete])})
+        self.log.info("Namespace management timings: %s", results)
+        self.whiteboard = json.dumps(results)
+        self.create_full_capacity_ns()
+        self.list_ns()
+        failed = [op for op, values in timings.items() if None in values]
+        if created != max_ns or failed:
+            self.fail("Created %s of %s namespaces, failed operations: %s"
+                      % (created, max_ns, failed))
+
+    def test_lba_format_benchmark(self):
+        """
+        Formats the namespace with every supported LBA format and runs a
+        short direct I/O sweep over block sizes and queue depths on each,
+        reporting IOPS and latency per format.
+        """
+        formats = self.get_lba_formats()
+        if not formats:
+            self.cancel("No LBA format found on %s" % self.device)
+        original = [fmt[0] for fmt in formats if fmt[3]]
+        results = []
+        for index, data_size, meta_size, _ in formats:
+            if meta_size:
+                self.log.info("Skipping LBA format %s with %s bytes of "
+                              "metadata", index, meta_size)
+                continue
+            if process.system("%s format %s -l %s -f" % (
+                    self.binary, self.id_ns, index), shell=True,
+                    ignore_status=True):
+                self.fail("Format with LBA format %s failed" % index)
+            self.list_ns()
+            for block_size in self.bench_block_sizes:
+                size = int(block_size[:-1]) * 1024
+                if block_size.endswith('m'):
+                    size *= 1024
+                if size < data_size:
+                    continue
+                for iodepth in self.bench_queue_depths:
+                    result = self.run_fio(block_size, iodepth)
+                    result.update({'lbaf': index, 'lba_size': data_size,
+                                   'bs': block_size, 'iodepth': iodepth})
+                    self.log.info("%s", result)
+                    results.append(result)
+        if original:
+            process.system("%s format %s -l %s -f" % (
+                self.binary, self.id_ns, original[0]), shell=True,
+                ignore_status=True)
+            self.list_ns()
+        best = {}
+        for result in results:
+            key = "%s_qd%s" % (result['bs'], result['iodepth'])
+            if key not in best or result['iops'] > best[key]['iops']:
+                best[key] = {'lbaf': result['lbaf'], 'iops': result['iops']}
+        self.log.info("Best LBA format per block size and queue depth: %s",
+                      best)
+        self.whiteboard = json.dumps({'results': results, 'best': best})
+
     def test_firmware_upgrade(self):
         """
         Updates firmware of the device.
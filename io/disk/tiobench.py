@@ -25,6 +25,8 @@ to measure file system performance.
 """
 
 import os
+import re
+import json
 import time
 from avocado import Test
 from avocado.utils import wait
@@ -298,6 +300,61 @@ class Tiobench(Test):
         else:
             self.log.info(f'No fs detected on {self.disk}')
 
+    @staticmethod
+    def parse_results(output):
+        """
+        Parses the tiobench.pl report tables into one dict per row.
+
+        :param output: tiobench.pl stdout
+        :returns: list of dicts with the test name and the typed columns
+        """
+        fields = [('file_size_mb', int), ('block_size', int),
+                  ('threads', int), ('rate_mbs', float),
+                  ('cpu_pct', float), ('avg_lat_ms', float),
+                  ('max_lat_ms', float), ('lat_gt_2s_pct', float),
+                  ('lat_gt_10s_pct', float), ('cpu_eff', float)]
+        row = re.compile(r'^\S+\s+(\d+)\s+(\d+)\s+(\d+)\s+([\d.]+)\s+'
+                         r'([\d.]+)%\s+([\d.]+)\s+([\d.]+)\s+([\d.]+)\s+'
+                         r'([\d.]+)\s+(\S+)')
+        results = []
+        test_name = None
+        for line in output.splitlines():
+            if re.match(r'^(Sequential|Random) (Reads|Writes)', line):
+                test_name = line.strip()
+                continue
+            match = row.match(line)
+            if not match or not test_name:
+                continue
+            result = {'test': test_name}
+            for (name, conv), val in zip(fields, match.groups()):
+                try:
+                    result[name] = conv(val)
+                except ValueError:
+                    result[name] = None
+            results.append(result)
+        return results
+
+    def run_tiobench(self, threads):
+        """
+        Runs tiobench.pl with the given thread count and returns the
+        parsed rows.
+        """
+        blocks = self.params.get('blocks', default=4096)
+        size = self.params.get('size', default=1024)
+        num_runs = self.params.get('numruns', default=2)
+        output = process.system_output('perl ./tiobench.pl '
+                                       '--target {} --block={} '
+                                       '--threads={} --numruns={} '
+                                       '-size={}'
+                                       .format(self.dir, blocks,
+                                               threads, num_runs,
+                                               size)).decode("utf-8")
+        self.log.info(output)
+        results = self.parse_results(output)
+        if not results:
+            self.fail("No results found in the tiobench report")
+        return results
+
     def test(self):
         """
         Test execution with necessary arguments.
@@ -308,19 +365,36 @@ class Tiobench(Test):
         :params num_runs: This number specifies over how many runs
                           each test should be averaged.
         """
-        blocks = self.params.get('blocks', default=4096)
         threads = self.params.get('threads', default=10)
-        size = self.params.get('size', default=1024)
-        num_runs = self.params.get('numruns', default=2)
 
         self.log.info("Test will run on %s and %s", self.target, self.dir)
-        self.whiteboard = process.system_output('perl ./tiobench.pl '
-                                                '--target {} --block={} '
-                                                '--threads={} --numruns={} '
-                                                '-size={}'
-                                                .format(self.dir, blocks,
-                                                        threads, num_runs,
-                                                        size)).decode("utf-8")
+        self.whiteboard = json.dumps(self.run_tiobench(threads))
+
+    def test_thread_sweep(self):
+        """
+        Runs tiobench for every thread count of sweep_threads and reports
+        where the rate of each test stops scaling.
+        """
+        sweep = self.params.get('sweep_threads', default=[1, 2, 4, 8, 16])
+        min_gain = self.params.get('scaling_min_gain', default=0.1)
+        results = []
+        for threads in sweep:
+            results.extend(self.run_tiobench(threads))
+        knees = {}
+        for test_name in sorted(set(row['test'] for row in results)):
+            points = [(row['threads'], row['rate_mbs']) for row in results
+                      if row['test'] == test_name]
+            # first thread count gaining less than min_gain over the
+            # previous one
+            knees[test_name] = next(
+                (threads for (_, prev), (threads, cur)
+                 in zip(points, points[1:])
+                 if cur < prev * (1 + min_gain)), None)
+            self.log.info("%s on %s stops scaling at %s threads",
+                          test_name, self.fstype or 'raw dir',
+                          knees[test_name])
+        self.whiteboard = json.dumps({'fs': self.fstype, 'results': results,
+                                      'scaling_knee_threads': knees})
 
     def tearDown(self):
         """
@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+# See LICENSE for more details.
+#
+# Copyright: 2024 IBM
+# Bridge and VLAN scale test on a local veth/netns fabric
+
+"""
+Builds hundreds of veth ports or thousands of VLAN subinterfaces on a
+Linux bridge inside network namespaces, and measures creation/deletion
+time, FDB learning time and forwarding throughput as port count grows.
+"""
+
+import os
+import json
+import time
+
+from avocado import Test
+from avocado.utils import process
+from avocado.utils.software_manager.manager import SoftwareManager
+
+# Sends one broadcast frame from every port so the bridge learns its MAC
+FDB_STIMULUS = '''
+import socket, sys
+for idx in range(int(sys.argv[1])):
+    sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW)
+    sock.bind(("ep%d" % idx, 0))
+    sock.send(b"\\xff" * 6 + sock.getsockname()[4] + b"\\x88\\xb5" +
+              b"\\x00" * 46)
+    sock.close()
+'''
+
+
+class BridgeScale(Test):
+
+    '''
+    Bridge and VLAN scale test, runs on a single box.
+    1. Creates port_counts veth ports attached to a bridge with batched
+       "ip -batch" netlink operations and times creation/deletion.
+    2. Measures the FDB learning time of all the ports.
+    3. Measures forwarding throughput between two namespaces through the
+       bridge holding all the ports.
+    4. Creates/deletes vlan_counts VLAN subinterfaces enslaved to the
+       bridge and times them.
+
+    :avocado: tags=net,privileged
+    '''
+
+    def setUp(self):
+        '''
+        Set up
+        '''
+        smm = SoftwareManager()
+        if not smm.check_installed('iperf3') and not smm.install('iperf3'):
+            self.cancel("iperf3 is needed for this test.")
+        self.port_counts = self.params.get("port_counts",
+                                           default=[16, 64, 256])
+        self.vlan_counts = self.params.get("vlan_counts",
+                                           default=[256, 1024, 4000])
+        self.iperf_time = self.params.get("iperf_time", default=10)
+        self.fdb_timeout = self.params.get("fdb_timeout", default=60)
+        self.bridge = "br-scale"
+        self.ns_br = "brscale-br"
+        self.ns_ports = "brscale-ports"
+        self.ns_src = "brscale-src"
+        self.ns_dst = "brscale-dst"
+        self.namespaces = [self.ns_br, self.ns_ports, self.ns_src,
+                           self.ns_dst]
+        self.cleanup_fabric()
+        self.ip_batch(['netns add %s' % name for name in self.namespaces])
+        self.ip_batch(['link add %s type bridge' % self.bridge,
+                       'link set %s up' % self.bridge], self.ns_br)
+        # no IPv6 DAD/MLD traffic, only the stimulus teaches the FDB
+        for name in [self.ns_br, self.ns_ports]:
+            for sysctl in ['all', 'default']:
+                process.run('ip netns exec %s sysctl -qw net.ipv6.conf.%s.'
+                            'disable_ipv6=1' % (name, sysctl), sudo=True)
+        self.ip_batch(['link add vsrc type veth peer name eth0 netns %s'
+                       % self.ns_src,
+                       'link add vdst type veth peer name eth0 netns %s'
+                       % self.ns_dst,
+                       'link set vsrc master %s' % self.bridge,
+                       'link set vdst master %s' % self.bridge,
+                       'link set vsrc up', 'link set vdst up'], self.ns_br)
+        for name, addr in [(self.ns_src, '192.168.250.1/24'),
+                           (self.ns_dst, '192.168.250.2/24')]:
+            self.ip_batch(['addr add %s dev eth0' % addr,
+                           'link set eth0 up', 'link set lo up'], name)
+
+    def ip_batch(self, commands, netns=None):
+        '''
+        Runs the ip commands in one "ip -batch" call, inside netns if
+        given, and returns the elapsed time in seconds.
+        '''
+        batch_file = os.path.join(self.workdir, 'ip.batch')
+        with open(batch_file, 'w') as batch:
+            batch.write('\n'.join(commands) + '\n')
+        cmd = 'ip -batch %s' % batch_file
+        if netns:
+            cmd = 'ip -n %s -batch %s' % (netns, batch_file)
+        start = time.monotonic()
+        if process.system(cmd, sudo=True, ignore_status=True):
+            self.fail("ip -batch failed, Please check the logs")
+        return time.monotonic() - start
+
+    def learned_macs(self):
+        '''
+        Returns the MACs the bridge learned on the scale ports.
+        '''
+        output = process.system_output('bridge -n %s -j fdb show br %s'
+                                       % (self.ns_br, self.bridge),
+                                       sudo=True).decode()
+        return set(entry['mac'] for entry in json.loads(output or '[]')
+                   if entry.get('ifname', '').startswith('vp') and
+                   'permanent' not in entry.get('state', ''))
+
+    def fdb_learning_time(self, count):
+        '''
+        Sends one frame from every port and returns the time until all
+        the port MACs show up in the bridge FDB, None on timeout.
+        '''
+        start = time.monotonic()
+        process.run('ip netns exec %s python3 -c \'%s\' %s'
+                    % (self.ns_ports, FDB_STIMULUS, count), sudo=True,
+                    shell=True)
+        while time.monotonic() - start < self.fdb_timeout:
+            if len(self.learned_macs()) >= count:
+                return time.monotonic() - start
+            time.sleep(0.05)
+        return None
+
+    def forwarding_throughput(self):
+        '''
+        Runs iperf3 from the source to the destination namespace through
+        the bridge and returns the received throughput in Gb/s.
+        '''
+        process.run('ip netns exec %s iperf3 -s -D -1' % self.ns_dst,
+                    sudo=True)
+        time.sleep(1)
+        output = process.system_output('ip netns exec %s iperf3 -J -c '
+                                       '192.168.250.2 -t %s'
+                                       % (self.ns_src, self.iperf_time),
+                                       sudo=True, ignore_status=True)
+        try:
+            result = json.loads(output.decode())
+            bps = result['end']['sum_received']['bits_per_second']
+        except (ValueError, KeyError):
+            self.fail("iperf3 through the bridge failed")
+        return round(bps / 10 ** 9, 3)
+
+    def test_bridge_ports_scale(self):
+        '''
+        Creates port_counts veth ports on the bridge, measures FDB
+        learning time and forwarding throughput, then deletes them.
+        '''
+        results = []
+        for count in self.port_counts:
+            count = int(count)
+            create = self.ip_batch(
+                ['link add vp%s type veth peer name ep%s netns %s'
+                 % (idx, idx, self.ns_ports) for idx in range(count)] +
+                ['link set vp%s master %s' % (idx, self.bridge)
+                 for idx in range(count)] +
+                ['link set vp%s up' % idx for idx in range(count)],
+                self.ns_br)
+            create += self.ip_batch(['link set ep%s up' % idx
+                                     for idx in range(count)], self.ns_ports)
+            learn = self.fdb_learning_time(count)
+            if learn is None:
+                self.fail("Bridge learned only %s of %s MACs in %ss"
+                          % (len(self.learned_macs()), count,
+                             self.fdb_timeout))
+            throughput = self.forwarding_throughput()
+            delete = self.ip_batch(['link del vp%s' % idx
+                                    for idx in range(count)], self.ns_br)
+            result = {'ports': count,
+                      'create_sec': round(create, 3),
+                      'delete_sec': round(delete, 3),
+                      'fdb_learn_sec': round(learn, 3),
+                      'throughput_gbps': throughput}
+            self.log.info("%s", result)
+            results.append(result)
+        self.whiteboard = json.dumps(results)
+
+    def test_vlan_scale(self):
+        '''
+        Creates vlan_counts VLAN subinterfaces on a trunk veth, enslaves
+        them to the bridge and times creation and deletion.
+        '''
+        self.ip_batch(['link add vtrunk type veth peer name eptrunk netns %s'
+                       % self.ns_ports, 'link set vtrunk up'], self.ns_br)
+        results = []
+        for count in self.vlan_counts:
+            vids = range(1, min(int(count), 4094) + 1)
+            create = self.ip_batch(
+                ['link add link vtrunk name vt.%s type vlan id %s'
+                 % (vid, vid) for vid in vids] +
+                ['link set vt.%s master %s' % (vid, self.bridge)
+                 for vid in vids] +
+                ['link set vt.%s up' % vid for vid in vids], self.ns_br)
+            delete = self.ip_batch(['link del vt.%s' % vid for vid in vids],
+                                   self.ns_br)
+            result = {'vlans': len(vids),
+                      'create_sec': round(create, 3),
+                      'delete_sec': round(delete, 3)}
+            self.log.info("%s", result)
+            results.append(result)
+        self.whiteboard = json.dumps(results)
+
+    def cleanup_fabric(self):
+        '''
+        Deletes the namespaces, and with them every port of the fabric.
+        '''
+        process.run('pkill -f "iperf3 -s -D -1"', sudo=True,
+                    ignore_status=True)
+        for name in self.namespaces:
+            if os.path.exists('/var/run/netns/%s' % name):
+                process.run('ip netns del %s' % name, sudo=True,
+                            ignore_status=True)
+
+    def tearDown(self):
+        '''
+        Removes the veth/netns fabric
+        '''
+        if hasattr(self, 'namespaces'):
+            self.cleanup_fabric()
@@ -20,6 +20,7 @@ Irq-balance and CPU affinity test for IO subsystem.
 
 import re
 import os
+import json
 from avocado import Test
 from avocado.utils import process, cpu, wait, dmesg, genio
 from avocado.utils.network.interfaces import NetworkInterface
@@ -57,6 +58,7 @@ class irq_balance(Test):
         Set up
         '''
         self.interface = None
+        self.io_procs = []
         device = self.params.get("interface", default=None)
         self.disk = self.params.get("disk", default=None)
         if device:
@@ -103,6 +105,14 @@ class irq_balance(Test):
         if self.disk:
             self.interface_type = self.get_disk_IPI_name()
 
+        self.irq_sampling = self.params.get("irq_sampling", default=False)
+        self.sample_interval = float(self.params.get("sample_interval",
+                                                     default=0.1))
+        self.sample_duration = float(self.params.get("sample_duration",
+                                                     default=30))
+        self.max_imbalance = self.params.get("max_imbalance", default=None)
+        self.max_gini = self.params.get("max_gini", default=None)
+
         self.check_current_smt()
         self.set_max_smt_values()
         self.cpu_list = cpu.online_list()
@@ -138,13 +148,179 @@ class irq_balance(Test):
         '''
         Function to get all the interrupts device_IPI of given device.
         '''
-        cmd = f"grep {self.interface_type} /proc/interrupts"
-        self.device_interrupts = process.run(cmd,
-                                             shell=True,
-                                             ignore_status=True
-                                             ).stdout.decode().strip()
+        self.device_interrupts = '\n'.join(
+            line.strip() for line in genio.read_all_lines('/proc/interrupts')
+            if self.interface_type in line)
         return self.device_interrupts
 
+    def parse_proc_interrupts(self):
+        '''
+        Function to parse "/proc/interrupts" in-process and return the
+        per-CPU counters of every IRQ line belonging to the device.
+        :rtype : dict of {irq: {cpu: count}}
+        '''
+        lines = genio.read_all_lines('/proc/interrupts')
+        cpus = [int(col[3:]) for col in lines[0].split()]
+        counters = {}
+        for line in lines[1:]:
+            fields = line.split()
+            if not fields or not fields[0][:-1].isdigit():
+                continue
+            if self.interface_type not in ' '.join(fields[len(cpus) + 1:]):
+                continue
+            counters[int(fields[0][:-1])] = dict(
+                zip(cpus, [int(val) for val in fields[1:len(cpus) + 1]]))
+        return counters
+
+    @staticmethod
+    def get_effective_affinity(irq):
+        '''
+        Function to read the effective affinity list of an IRQ, falls back
+        to smp_affinity_list on kernels not exposing effective affinity.
+        :rtype : str
+        '''
+        for name in ['effective_affinity_list', 'smp_affinity_list']:
+            path = f'/proc/irq/{irq}/{name}'
+            if os.path.exists(path):
+                return genio.read_file(path).strip()
+        return ''
+
+    def sample_irq_rates(self, duration, interval):
+        '''
+        Function to sample device interrupts at a fixed interval and
+        convert the counter deltas into per-IRQ x per-CPU rates.
+        :param duration: sampling time in seconds
+        :param interval: sampling interval in seconds
+        :rtype : list of dict with time, rates and affinity per sample
+        '''
+        samples = []
+        start = prev_time = time.monotonic()
+        prev = self.parse_proc_interrupts()
+        while time.monotonic() - start < duration:
+            time.sleep(interval)
+            now = time.monotonic()
+            curr = self.parse_proc_interrupts()
+            elapsed = now - prev_time
+            rates = {}
+            for irq, counts in curr.items():
+                # CPUs going offline (SMT changes) vanish from the header,
+                # only the CPUs present in both samples give a valid delta
+                rates[irq] = {cpu_id: (val - prev[irq][cpu_id]) / elapsed
+                              for cpu_id, val in counts.items()
+                              if cpu_id in prev.get(irq, {})}
+            samples.append({'time': round(now - start, 3),
+                            'rates': rates,
+                            'affinity': {irq: self.get_effective_affinity(irq)
+                                         for irq in curr}})
+            prev, prev_time = curr, now
+        return samples
+
+    @staticmethod
+    def irq_load_imbalance(samples):
+        '''
+        Function to compute the interrupt load imbalance of every sample.
+        The per-CPU load is the sum of the rates of all device IRQs, the
+        imbalance is reported as max/mean ratio and Gini coefficient
+        (0 means evenly spread, close to 1 means a single CPU gets all).
+        :rtype : list of dict with time, max_mean and gini per sample
+        '''
+        imbalance = []
+        for sample in samples:
+            load = {}
+            for rates in sample['rates'].values():
+                for cpu_id, rate in rates.items():
+                    load[cpu_id] = load.get(cpu_id, 0) + rate
+            values = sorted(load.values())
+            total = sum(values)
+            if not total:
+                continue
+            count = len(values)
+            gini = sum((2 * idx - count - 1) * val
+                       for idx, val in enumerate(values, 1)) / (count * total)
+            imbalance.append({'time': sample['time'],
+                              'irq_per_sec': round(total, 2),
+                              'max_mean': round(values[-1] * count / total, 3),
+                              'gini': round(gini, 3)})
+        return imbalance
+
+    def check_irq_distribution(self, imbalance, label):
+        '''
+        Function to summarize the imbalance time series and validate it
+        against the max_imbalance and max_gini thresholds, if given.
+        :rtype : dict
+        '''
+        if not imbalance:
+            self.fail(f"No {self.interface_type} interrupts seen during "
+                      f"{label}, Please check the logs")
+        summary = {'samples': len(imbalance),
+                   'avg_max_mean': round(sum(val['max_mean']
+                                             for val in imbalance) /
+                                         len(imbalance), 3),
+                   'avg_gini': round(sum(val['gini'] for val in imbalance) /
+                                     len(imbalance), 3),
+                   'series': imbalance}
+        self.log.info("%s: irq imbalance max/mean %s, gini %s", label,
+                      summary['avg_max_mean'], summary['avg_gini'])
+        if self.max_imbalance and \
+                summary['avg_max_mean'] > float(self.max_imbalance):
+            self.fail(f"{label}: interrupt imbalance "
+                      f"{summary['avg_max_mean']} is above "
+                      f"{self.max_imbalance}")
+        if self.max_gini and summary['avg_gini'] > float(self.max_gini):
+            self.fail(f"{label}: interrupt gini {summary['avg_gini']} is "
+                      f"above {self.max_gini}")
+        return summary
+
+    def start_io_load(self):
+        '''
+        Function to start the IO load on the device in the background,
+        ping flood for network and dd for disk, keeping the handles of
+        the processes started. The load lasts a few seconds longer than
+        one sampling window.
+        '''
+        duration = int(self.sample_duration) + 5
+        cmds = []
+        if self.interface:
+            cmds.append(f"ping -I {self.interface} {self.peer_ip} -f "
+                        f"-w {duration}")
+        if self.disk:
+            # direct IO, rewriting the first GiB until the timeout
+            cmds.append(f"timeout {duration} sh -c 'while :; do "
+                        f"dd if=/dev/urandom of={self.disk} bs=1M "
+                        f"count=1024 oflag=direct 2>/dev/null || exit 1; "
+                        f"done'")
+        for cmd in cmds:
+            proc = process.SubProcess(cmd, sudo=True, shell=True)
+            proc.start()
+            self.io_procs.append(proc)
+        time.sleep(1)
+        for proc in self.io_procs:
+            if proc.poll() is not None:
+                self.fail(f"{proc.cmd} is not running, Please check "
+                          f"the logs")
+
+    def sample_under_load(self):
+        '''
+        Starts the IO load, samples the IRQ rates for one window and
+        stops the load.
+        '''
+        try:
+            self.start_io_load()
+            return self.sample_irq_rates(self.sample_duration,
+                                         self.sample_interval)
+        finally:
+            self.stop_io_load()
+
+    def stop_io_load(self):
+        '''
+        Function to stop the IO load started by start_io_load.
+        '''
+        while self.io_procs:
+            proc = self.io_procs.pop()
+            if proc.poll() is None:
+                proc.terminate()
+            proc.wait()
+
     def get_irq_numbers(self):
         '''
         Function to get all IRQ numbers associated for given device.
@@ -161,17 +337,32 @@ class irq_balance(Test):
         :returns : Process PID number that initiated by ping flood command.
         :rtype : int
         """
-        cmd = (
-            f"ps -ef | grep '[p]ing -I "
-            f"{self.interface} {self.peer_ip} -c {self.ping_count} -f' "
-            f"| awk '{{print $2}}' | head -1"
-        )
-        process_pid = process.system_output(cmd, shell=True,
-                                            ignore_status=True,
-                                            sudo=True).decode("utf-8")
-        if not process_pid:
-            self.cancel(f"No process PID of ping command available")
-        return process_pid
+        pids = self.find_process_pids(f"ping -I {self.interface} "
+                                      f"{self.peer_ip} -c {self.ping_count}"
+                                      f" -f")
+        if not pids:
+            self.cancel("No process PID of ping command available")
+        return pids[0]
+
+    @staticmethod
+    def find_process_pids(pattern):
+        """
+        Function to find processes whose command line contains pattern,
+        by walking /proc instead of forking ps/grep/awk.
+
+        :rtype : list of int
+        """
+        pids = []
+        for pid in sorted(int(entry) for entry in os.listdir('/proc')
+                          if entry.isdigit()):
+            try:
+                with open(f'/proc/{pid}/cmdline', 'rb') as cmdline:
+                    cmd = cmdline.read().replace(b'\0', b' ').decode()
+            except (IOError, OSError):
+                continue
+            if pattern in cmd and pid != os.getpid():
+                pids.append(pid)
+        return pids
 
     def compare_range_strings(self, range_str1, range_str2):
         '''
@@ -374,8 +565,29 @@ class irq_balance(Test):
         4. makes all cpu online.
 
         '''
+        smt_summary = {}
         for i in ['off', *range(1, 9), 'off', 'on']:
             wait.wait_for(self.set_smt_values, args=(i,), timeout=300)
+            if self.irq_sampling:
+                # a fresh load for every level, it outlasts the window
+                samples = self.sample_under_load()
+                smt_summary[f'smt={i}'] = self.check_irq_distribution(
+                    self.irq_load_imbalance(samples), f'smt={i}')
+        if self.irq_sampling:
+            self.whiteboard = json.dumps(smt_summary)
+
+    def test_irq_distribution(self):
+        '''
+        Samples /proc/interrupts and IRQ effective affinity at a fixed
+        interval while ping flood (network) or dd (disk) runs, and checks
+        the interrupt load imbalance (max/mean and Gini) over time.
+        '''
+        samples = self.sample_under_load()
+        summary = self.check_irq_distribution(
+            self.irq_load_imbalance(samples), 'io load')
+        summary['affinity'] = samples[-1]['affinity'] if samples else {}
+        self.whiteboard = json.dumps(summary)
+        dmesg.collect_errors_dmesg(errorlog)
 
     def test_taskset(self):
         '''
@@ -442,6 +654,8 @@ class irq_balance(Test):
         Sets back SMT to original value as was before the test.
         Sets back cpu states to online
         """
+        if hasattr(self, 'io_procs'):
+            self.stop_io_load()
         if hasattr(self, 'curr_smt'):
             process.system_output(f"ppc64_cpu "
                                   f"--smt={self.check_current_smt()}",
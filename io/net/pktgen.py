@@ -19,9 +19,11 @@
 # https://github.com/autotest/autotest-client-tests/tree/master/pktgen
 
 import os
+import re
+import json
 import shutil
 from avocado import Test
-from avocado.utils import process
+from avocado.utils import process, cpu, genio
 
 
 class Pktgen(Test):
@@ -40,6 +42,10 @@ class Pktgen(Test):
         self.dst_ip = self.params.get("peer_ip", default="")
         self.dst_mac = self.params.get("peer_mac", default="")
         self.results = self.params.get("resultsdir", default="/tmp/")
+        self.pkt_sizes = self.params.get("pkt_sizes",
+                                         default=[64, 128, 256, 512, 1024,
+                                                  1500])
+        self.queue_counts = self.params.get("queue_counts", default=None)
         if not os.path.exists('/proc/net/pktgen'):
             process.system("modprobe pktgen", ignore_status=True, shell=True)
         if not os.path.exists('/proc/net/pktgen'):
@@ -76,6 +82,114 @@ class Pktgen(Test):
         output = os.path.join(self.results, self.eth)
         shutil.copyfile(self.pgdev, output)
 
+    def test_pktgen_multiqueue(self):
+        '''
+        Spreads the flows across the TX queues of the interface, with one
+        kpktgend thread per queue (add_device dev@N) pinned to its own
+        queue, and sweeps the packet size from 64B up to the MTU for
+        each queue count. Per thread pps and Mb/s are read back from
+        /proc/net/pktgen and aggregated into line rate percentages.
+        '''
+        tx_queues = len([queue for queue in
+                         os.listdir('/sys/class/net/%s/queues' % self.eth)
+                         if queue.startswith('tx-')])
+        max_threads = min(tx_queues, len(cpu.online_list()))
+        if self.queue_counts:
+            queue_counts = [int(count) for count in self.queue_counts
+                            if int(count) <= max_threads]
+        else:
+            queue_counts = sorted(set([2 ** exp for exp in
+                                       range(max_threads.bit_length())] +
+                                      [max_threads]))
+        max_frame = int(genio.read_file(
+            '/sys/class/net/%s/mtu' % self.eth)) + 18
+        pkt_sizes = sorted(set(min(int(size), max_frame)
+                               for size in self.pkt_sizes))
+        speed = self.get_link_speed()
+        results = []
+        for nr_queues in queue_counts:
+            for pkt_size in pkt_sizes:
+                self.configure_threads(nr_queues, pkt_size)
+                self.pgdev = '/proc/net/pktgen/pgctrl'
+                self.start_flag = True
+                self.pgset('start')
+                self.start_flag = False
+                result = self.get_thread_results(nr_queues)
+                result.update({'queues': nr_queues, 'pkt_size': pkt_size})
+                if speed:
+                    # 20 bytes of preamble and inter frame gap on the wire
+                    line_pps = speed * 10 ** 6 / ((pkt_size + 20) * 8)
+                    result['line_rate_pct'] = round(
+                        100.0 * result['pps'] / line_pps, 2)
+                self.log.info("queues %s pkt_size %s: %s pps, %s Mb/s, "
+                              "%s%% of line rate", nr_queues, pkt_size,
+                              result['pps'], result['mbps'],
+                              result.get('line_rate_pct', 'NA'))
+                results.append(result)
+        self.whiteboard = json.dumps(results)
+        with open(os.path.join(self.results,
+                               '%s_multiqueue.json' % self.eth), 'w') as out:
+            json.dump(results, out, indent=1)
+        if not [result for result in results if result['pps']]:
+            self.fail("pktgen did not transmit any packet")
+
+    def configure_threads(self, nr_queues, pkt_size):
+        '''
+        Binds queue N of the interface to kpktgend_N, every thread
+        transmitting count packets of pkt_size bytes (FCS included).
+        '''
+        for thread in cpu.online_list():
+            self.pgdev = '/proc/net/pktgen/kpktgend_%s' % thread
+            if os.path.exists(self.pgdev):
+                self.pgset('rem_device_all')
+        for queue in range(nr_queues):
+            thread = cpu.online_list()[queue]
+            self.pgdev = '/proc/net/pktgen/kpktgend_%s' % thread
+            self.pgset('add_device %s@%s' % (self.eth, queue))
+            self.pgset('max_before_softirq 10000')
+            self.pgdev = '/proc/net/pktgen/%s@%s' % (self.eth, queue)
+            if self.clone_skb:
+                self.pgset('clone_skb %s' % (self.count))
+            self.pgset('pkt_size %s' % (pkt_size - 4))
+            self.pgset('dst %s' % self.dst_ip)
+            self.pgset('dst_mac %s' % self.dst_mac)
+            self.pgset('count %s' % (self.count))
+            self.pgset('queue_map_min %s' % queue)
+            self.pgset('queue_map_max %s' % queue)
+
+    def get_thread_results(self, nr_queues):
+        '''
+        Parses the Result lines of every dev@N and sums pps and Mb/s.
+        '''
+        threads = []
+        for queue in range(nr_queues):
+            output = genio.read_file('/proc/net/pktgen/%s@%s' %
+                                     (self.eth, queue))
+            match = re.search(r'(\d+)pps (\d+)Mb/sec \((\d+)bps\) '
+                              r'errors: (\d+)', output)
+            if not match:
+                self.fail("No pktgen result for %s@%s" % (self.eth, queue))
+            threads.append({'queue': queue,
+                            'pps': int(match.group(1)),
+                            'mbps': int(match.group(2)),
+                            'errors': int(match.group(4))})
+        return {'pps': sum(thread['pps'] for thread in threads),
+                'mbps': sum(thread['mbps'] for thread in threads),
+                'errors': sum(thread['errors'] for thread in threads),
+                'threads': threads}
+
+    def get_link_speed(self):
+        '''
+        Returns the link speed in Mb/s, 0 when the driver does not
+        report it (virtual devices).
+        '''
+        try:
+            speed = int(genio.read_file('/sys/class/net/%s/speed' %
+                                        self.eth))
+        except (OSError, ValueError):
+            return 0
+        return max(speed, 0)
+
     def pgset(self, command):
         file_name = open(self.pgdev, 'w')
         file_name.write(command + '\n')
@@ -105,3 +219,8 @@ class Pktgen(Test):
         self.log.info("Ping response value is %d" % ping_response)
         if ping_response != 0:
             self.cancel("Host not reachable")
+
+    def tearDown(self):
+        if os.path.exists('/proc/net/pktgen/pgctrl'):
+            with open('/proc/net/pktgen/pgctrl', 'w') as pgctrl:
+                pgctrl.write('reset\n')
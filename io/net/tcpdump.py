@@ -19,6 +19,9 @@ Tcpdump Test.
 """
 
 import os
+import re
+import json
+import time
 from avocado import Test
 from avocado.utils import process
 from avocado.utils import distro
@@ -56,6 +59,16 @@ class TcpdumpTest(Test):
         self.host_ip = self.params.get("host_ip", default="")
         self.option = self.params.get("option", default='')
         self.hbond = self.params.get("hbond", default=False)
+        self.rates = self.params.get("rates",
+                                     default=[1000, 10000, 50000, 100000,
+                                              200000])
+        self.rate_duration = int(self.params.get("rate_duration",
+                                                 default=10))
+        self.buffer_sizes = self.params.get("buffer_sizes",
+                                            default=[2048, 32768])
+        self.snaplens = self.params.get("snaplens", default=[96, 262144])
+        self.immediate_modes = self.params.get("immediate_modes",
+                                               default=[False, True])
         # Check if interface exists in the system
         if not self.peer_ip:
             self.cancel("peer ip should specify in input")
@@ -145,20 +158,110 @@ class TcpdumpTest(Test):
         else:
             cmd = "%s %s" % (cmd, self.option)
         cmd = "%s -w '%s'" % (cmd, output_file)
-        for line in process.run(cmd, shell=True,
-                                ignore_status=True).stderr.decode("utf-8") \
-                                                   .splitlines():
-            if "packets dropped by kernel" in line:
-                self.log.info(line)
-                if int(line[0]) >= (int(self.drop) * int(self.count) / 100):
-                    self.fail("%s, more than %s percent" % (line, self.drop))
+        stats = self.parse_capture_stats(process.run(
+            cmd, shell=True, ignore_status=True).stderr.decode("utf-8"))
+        self.log.info("tcpdump summary: %s", stats)
+        if stats['dropped_kernel'] >= (int(self.drop) * int(self.count) / 100):
+            self.fail("%s packets dropped by kernel, more than %s percent"
+                      % (stats['dropped_kernel'], self.drop))
         obj.stop()
 
-    def nping(self, param):
+    def test_capture_rate(self):
+        """
+        Ramps the offered UDP load with nping and finds, for every
+        combination of capture buffer size (-B), snaplen (-s) and
+        --immediate-mode, the maximum achieved capture rate without kernel
+        or interface drops.
+        libpcap uses a TPACKET_V3 PACKET_MMAP ring sized by -B and falls
+        back to TPACKET_V2 in immediate mode, so the immediate mode
+        results compare the two ring layouts.
+        """
+        output_file = os.path.join(self.outputdir, 'tcpdump_rate')
+        results = []
+        for buf_size in self.buffer_sizes:
+            for snaplen in self.snaplens:
+                for immediate in self.immediate_modes:
+                    config = {'buffer_kb': int(buf_size),
+                              'snaplen': int(snaplen),
+                              'immediate_mode': bool(immediate),
+                              'max_rate_no_drop': 0, 'steps': []}
+                    opts = "-B %s -s %s" % (buf_size, snaplen)
+                    if immediate:
+                        opts = "%s --immediate-mode" % opts
+                    for rate in sorted(int(rate) for rate in self.rates):
+                        step = self.capture_at_rate(rate, opts, output_file)
+                        config['steps'].append(step)
+                        self.log.info("%s rate %s: %s", opts, rate, step)
+                        if step['dropped_kernel'] or \
+                                step.get('dropped_interface'):
+                            break
+                        config['max_rate_no_drop'] = max(
+                            config['max_rate_no_drop'], step['achieved_rate'])
+                    results.append(config)
+        if os.path.exists(output_file):
+            os.remove(output_file)
+        self.whiteboard = json.dumps(results)
+        if not [config for config in results if config['max_rate_no_drop']]:
+            self.fail("tcpdump dropped packets at every offered rate")
+
+    def capture_at_rate(self, rate, opts, output_file):
+        """
+        Captures the UDP packets nping sends at rate packets/sec for
+        rate_duration seconds and returns the tcpdump summary counters
+        with the packet rate nping actually achieved.
+        """
+        obj = self.nping('udp', count=rate * self.rate_duration, rate=rate)
+        cmd = "timeout %s tcpdump -i %s -n %s -w '%s' udp and dst host %s" % (
+            self.rate_duration + 2, self.iface, opts, output_file,
+            self.peer_ip)
+        tcpdump = process.SubProcess(cmd, verbose=False, shell=True)
+        tcpdump.start()
+        # let tcpdump open the capture ring before the load starts
+        wait.wait_for(lambda: "listening on" in tcpdump.get_stderr().decode(),
+                      timeout=5)
+        start = time.monotonic()
+        obj.start()
+        # nping may not keep up with the offered rate, so the achieved
+        # rate is what it sent over the time it took to send it
+        wait.wait_for(lambda: obj.poll() is not None,
+                      timeout=self.rate_duration + 2)
+        elapsed = time.monotonic() - start
+        tcpdump.wait()
+        if obj.poll() is None:
+            obj.stop()
+        stats = self.parse_capture_stats(tcpdump.get_stderr().decode())
+        match = re.search(r'packets sent: (\d+)',
+                          obj.get_stdout().decode())
+        sent = int(match.group(1)) if match else stats['received_filter']
+        stats['offered_rate'] = rate
+        stats['sent'] = sent
+        stats['achieved_rate'] = round(sent / elapsed)
+        return stats
+
+    @staticmethod
+    def parse_capture_stats(output):
+        """
+        Parses the packet counters tcpdump prints on exit.
+        """
+        stats = {'captured': 0, 'received_filter': 0, 'dropped_kernel': 0}
+        patterns = {'captured': r'(\d+) packets? captured',
+                    'received_filter': r'(\d+) packets? received by filter',
+                    'dropped_kernel': r'(\d+) packets? dropped by kernel',
+                    'dropped_interface': r'(\d+) packets? dropped by '
+                                         r'interface'}
+        for key, pattern in patterns.items():
+            match = re.search(pattern, output)
+            if match:
+                stats[key] = int(match.group(1))
+        return stats
+
+    def nping(self, param, count=None, rate=None):
         """
         perform nping
         """
-        if self.count <= 10:
+        if count:
+            nping_count = count
+        elif self.count <= 10:
             nping_count = round((200 * int(self.count)) / 100)
         else:
             nping_count = round((120 * int(self.count)) / 100)
@@ -166,10 +269,11 @@ class TcpdumpTest(Test):
         if detected_distro.name == "SuSE":
             cmd = "./nping/nping --%s %s -c %s" % (param,
                                                    self.peer_ip, nping_count)
-            return process.SubProcess(cmd, verbose=False, shell=True)
         else:
             cmd = "nping --%s %s -c %s" % (param, self.peer_ip, nping_count)
-            return process.SubProcess(cmd, verbose=False, shell=True)
+        if rate:
+            cmd = "%s --rate %s -N -H" % (cmd, rate)
+        return process.SubProcess(cmd, verbose=False, shell=True)
 
     def tearDown(self):
         '''
@@ -21,6 +21,7 @@ Tests for Network virtualized device
 
 import os
 import time
+import json
 import shutil
 import netifaces
 from avocado import Test
@@ -131,6 +132,13 @@ class NetworkVirtualization(Test):
         self.is_mlx_driver = self.params.get('is_mlx_driver', default=True)
         self.tx_channel = self.params.get('tx_channel', default=10)
         self.rx_channel = self.params.get('rx_channel', default=10)
+        self.probe_interval = self.params.get('probe_interval',
+                                              default=0.01)
+        self.probe_settle = int(self.params.get('probe_settle', default=10))
+        self.failover_timeout = int(self.params.get('failover_timeout',
+                                                    default=60))
+        self.max_outage = self.params.get('max_outage', default=None)
+        self.failover_stats = []
         dmesg.clear_dmesg()
         self.session_hmc.cmd("uname -a")
         cmd = 'lssyscfg -m ' + self.server + \
@@ -423,9 +431,9 @@ class NetworkVirtualization(Test):
         original = self.get_active_device_logport(self.slot_num[0])
         for _ in range(self.count):
             before = self.get_active_device_logport(self.slot_num[0])
-            self.trigger_failover(self.get_backing_device_logport
-                                  (self.slot_num[0]))
-            time.sleep(60)
+            self.measure_failover('hmc_failover', self.trigger_failover,
+                                  self.get_backing_device_logport(
+                                      self.slot_num[0]))
             after = self.get_active_device_logport(self.slot_num[0])
             self.log.debug("Active backing device: %s", after)
             if before == after:
@@ -438,6 +446,7 @@ class NetworkVirtualization(Test):
             self.trigger_failover(original)
         if original != self.get_active_device_logport(self.slot_num[0]):
             self.log.warn("Fail: Activating Initial backing dev %s" % original)
+        self.check_failover_outage()
         self.check_dmesg_error()
 
     def test_clientfailover(self):
@@ -451,9 +460,10 @@ class NetworkVirtualization(Test):
                 for val in range(int(self.backing_dev_count())):
                     self.log.info("Performing Client initiated\
                                   failover - Attempt %s", int(val + 1))
-                    genio.write_file_or_fail("/sys/devices/vio/%s/failover"
-                                             % device_id, "1")
-                    time.sleep(60)
+                    self.measure_failover('client_failover',
+                                          genio.write_file_or_fail,
+                                          "/sys/devices/vio/%s/failover"
+                                          % device_id, "1")
                     self.log.info("Running a ping test to check if failover \
                                     affected Network connectivity")
                     device = self.find_device(self.mac_id[0])
@@ -465,6 +475,7 @@ class NetworkVirtualization(Test):
             self.log.debug(str(details))
             self.fail("Client initiated Failover for Network virtualized \
                       device has failed")
+        self.check_failover_outage()
         self.check_dmesg_error()
 
     def test_vnic_auto_failover(self):
@@ -481,13 +492,12 @@ class NetworkVirtualization(Test):
                 backing_dev_priority = self.get_backing_device_priority(
                     self.slot_num[0])
                 if self.enable_auto_failover():
-                    if not self.change_failover_priority(backing_logport, '1'):
-                        self.fail(
-                            "Fail to change the priority for backing device %s", backing_logport)
-                    if not self.change_failover_priority(active_logport, '100'):
-                        self.fail(
-                            "Fail to change the priority for active device %s", active_logport)
-                    time.sleep(60)
+                    self.measure_failover('priority_change',
+                                          self.set_failover_priorities,
+                                          [(backing_logport, '1'),
+                                           (active_logport, '100')],
+                                          "Fail to change the priority for "
+                                          "device %s")
                     if backing_logport != self.get_active_device_logport(self.slot_num[0]):
                         self.fail("Auto failover of backing device failed")
                     device = self.find_device(self.mac_id[0])
@@ -495,18 +505,21 @@ class NetworkVirtualization(Test):
                     if networkinterface.ping_check(self.peer_ip[0], count=5) is not None:
                         self.fail("Auto failover has effected connectivity")
                     # set back the priority
-                    if not self.change_failover_priority(active_logport, self.vnic_priority[0]):
-                        self.fail(
-                            "Auto failover tested successfully but fail to set back\
-                             original priority")
-                    if not self.change_failover_priority(backing_logport, backing_dev_priority):
-                        self.fail(
-                            "Auto failover tested successfully but fail to set back\
-                             original priority")
+                    self.measure_failover('priority_restore',
+                                          self.set_failover_priorities,
+                                          [(active_logport,
+                                            self.vnic_priority[0]),
+                                           (backing_logport,
+                                            backing_dev_priority)],
+                                          "Auto failover tested successfully "
+                                          "but fail to set back original "
+                                          "priority of %s",
+                                          wait_switch=False)
                 else:
                     self.fail("Could not enable auto failover")
         else:
             self.cancel("Provide more backing device, only 1 given")
+        self.check_failover_outage()
         self.check_dmesg_error()
 
     def test_rmdev_viosfailover(self):
@@ -1021,6 +1034,90 @@ class NetworkVirtualization(Test):
             return False
         return True
 
+    def set_failover_priorities(self, priorities, fail_msg):
+        """
+        Change the fail over priority of every (logport, priority) pair
+        """
+        for logport, priority in priorities:
+            if not self.change_failover_priority(logport, priority):
+                self.fail(fail_msg % logport)
+
+    def measure_failover(self, event, action, *args, wait_switch=True):
+        """
+        Runs action(*args) while a timestamped ping stream probes the
+        peer, waits until backing_dev_list reports a new active device
+        and records the traffic outage of the switch.
+        """
+        device = self.find_device(self.mac_id[0])
+        before = self.get_active_device_logport(self.slot_num[0])
+        cmd = "ping -D -n -i %s -I %s %s" % (self.probe_interval, device,
+                                             self.peer_ip[0])
+        probe = process.SubProcess(cmd, shell=True, verbose=False)
+        probe.start()
+        try:
+            time.sleep(2)
+            trigger = time.time()
+            action(*args)
+            switch_time = None
+            if wait_switch:
+                if wait.wait_for(lambda: self.get_active_device_logport(
+                        self.slot_num[0]) != before,
+                        timeout=self.failover_timeout, step=1):
+                    switch_time = round(time.time() - trigger, 3)
+            time.sleep(self.probe_settle)
+            end = time.time()
+        finally:
+            probe.terminate()
+            probe.wait()
+        stats = self.probe_outage(probe.get_stdout().decode("utf-8"),
+                                  trigger, end)
+        stats.update({'event': event, 'from': before,
+                      'to': self.get_active_device_logport(self.slot_num[0]),
+                      'switch_sec': switch_time})
+        self.log.info("Failover %s: %s", event, stats)
+        self.failover_stats.append(stats)
+        return stats
+
+    def probe_outage(self, output, trigger, end):
+        """
+        Finds the longest gap between ping replies around the trigger
+        time, the traffic outage is the gap minus one probe interval.
+        """
+        replies = [(float(match.group(1)), int(match.group(2)))
+                   for match in re.finditer(r'^\[(\d+\.\d+)\].*'
+                                            r'icmp_seq=(\d+)', output,
+                                            re.MULTILINE)]
+        stamps = [stamp for stamp, _ in replies]
+        before = [stamp for stamp in stamps if stamp < trigger]
+        after = [stamp for stamp in stamps if stamp >= trigger]
+        if not after:
+            outage = end - trigger
+        else:
+            points = before[-1:] + after
+            if not before:
+                points = [trigger] + after
+            outage = max(nxt - prev for prev, nxt in zip(points, points[1:]))
+            outage = max(outage - float(self.probe_interval), 0)
+        lost = 0
+        if replies:
+            seqs = [seq for _, seq in replies]
+            lost = max(seqs) - min(seqs) + 1 - len(set(seqs))
+        return {'outage_sec': round(outage, 3), 'lost_probes': lost,
+                'recovered': bool(after)}
+
+    def check_failover_outage(self):
+        """
+        Stores the failover outages in the whiteboard and compares them
+        with max_outage, if given
+        """
+        self.whiteboard = json.dumps(self.failover_stats)
+        if not self.max_outage:
+            return
+        for stats in self.failover_stats:
+            if stats['outage_sec'] > float(self.max_outage):
+                self.fail("%s outage %ss is above %ss" % (
+                    stats['event'], stats['outage_sec'], self.max_outage))
+
     def find_device_id(self, mac):
         """
         Finds the device id needed to trigger failover
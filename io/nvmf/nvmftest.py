@@ -21,11 +21,13 @@ a storage networking fabric.
 """
 
 import os
+import re
+import glob
 import json
 import copy
 import time
 from avocado import Test
-from avocado.utils import process, linux_modules, genio
+from avocado.utils import process, linux_modules, genio, wait
 from avocado.utils.software_manager.manager import SoftwareManager
 from avocado.utils.ssh import Session
 from avocado.utils.process import CmdError
@@ -41,31 +43,101 @@ class NVMfTest(Test):
         """
         Sets up NVMf configuration
         """
-        self.nss = self.params.get('namespaces', default='')
-        self.peer_ips = self.params.get('peer_ips', default='')
-        if not self.nss or not self.peer_ips:
-            self.cancel("No inputs provided")
+        self.transport = self.params.get('local_transport', default='')
+        self.local = self.transport in ['loop', 'tcp']
+        self.backing = self.params.get('backing', default='null_blk')
+        self.subsys_count = int(self.params.get('subsys_count', default=1))
+        self.backing_size = int(self.params.get('backing_size_gb',
+                                                default=4))
+        self.queue_counts = self.params.get('queue_counts',
+                                            default=[1, 4, 16])
+        self.queue_depths = self.params.get('queue_depths',
+                                            default=[1, 16, 128])
+        self.block_sizes = self.params.get('block_sizes',
+                                           default=['4k', '64k', '1m'])
+        self.runtime = int(self.params.get('runtime', default=30))
         self.peer_user = self.params.get("peer_user", default="root")
         self.peer_password = self.params.get("peer_password", default=None)
-        self.nss = self.nss.split(' ')
-        self.peer_ips = self.peer_ips.split(' ')
-        self.ids = range(1, len(self.peer_ips) + 1)
-        if len(self.nss) != len(self.peer_ips):
-            self.cancel("Count of namespace and peer ips mismatch")
         smm = SoftwareManager()
         if not smm.check_installed("nvme-cli") and not \
                 smm.install("nvme-cli"):
             self.cancel('nvme-cli is needed for the test to be run')
-        try:
-            if not linux_modules.module_is_loaded("nvme-rdma"):
-                linux_modules.load_module("nvme-rdma")
-        except CmdError:
-            self.cancel("nvme-rdma module not loadable")
+        if self.local:
+            for pkg in ['nvmetcli', 'fio']:
+                if not smm.check_installed(pkg) and not smm.install(pkg):
+                    self.cancel('%s is needed for the local target' % pkg)
+            self.setup_local_backing()
+            self.set_local_addr()
+        else:
+            self.transport = 'rdma'
+            self.nss = self.params.get('namespaces', default='')
+            self.peer_ips = self.params.get('peer_ips', default='')
+            if not self.nss or not self.peer_ips:
+                self.cancel("No inputs provided")
+            self.nss = self.nss.split(' ')
+            self.peer_ips = self.peer_ips.split(' ')
+        self.ids = range(1, len(self.peer_ips) + 1)
+        if len(self.nss) != len(self.peer_ips):
+            self.cancel("Count of namespace and peer ips mismatch")
+        modules = ["nvme-%s" % self.transport]
+        if self.local and self.transport == 'loop':
+            # nvme-loop provides both the loop target and host
+            modules = ["nvmet", "nvme-loop"]
+        elif self.local:
+            modules = ["nvmet", "nvmet-%s" % self.transport,
+                       "nvme-%s" % self.transport]
+        for mdl in modules:
+            try:
+                if not linux_modules.module_is_loaded(mdl):
+                    linux_modules.load_module(mdl)
+            except CmdError:
+                self.cancel("%s module not loadable" % mdl)
         self.cfg_tmpl = self.get_data("nvmf_template.cfg")
         dirname = os.path.dirname(os.path.abspath(self.cfg_tmpl))
         self.cfg_file = os.path.join(dirname, "nvmf.cfg")
         self.nvmf_discovery_file = "/etc/nvme/discovery.conf"
 
+    def setup_local_backing(self):
+        """
+        Creates subsys_count backing devices for the local target, null_blk
+        devices or sparse files in the test workdir
+        """
+        if self.backing == 'null_blk':
+            self.nss = ["/dev/nullb%s" % i for i in range(self.subsys_count)]
+            # the devices stay across the tests of the target sequence
+            if all(os.path.exists(dev) for dev in self.nss):
+                return
+            if linux_modules.module_is_loaded("null_blk"):
+                if process.system("rmmod null_blk", ignore_status=True):
+                    self.cancel("null_blk in use, cannot reconfigure it")
+            if process.system("modprobe null_blk nr_devices=%s gb=%s"
+                              % (self.subsys_count, self.backing_size),
+                              ignore_status=True):
+                self.cancel("null_blk module not loadable")
+        else:
+            self.nss = []
+            for i in range(self.subsys_count):
+                image = os.path.join(self.teststmpdir, "nvmf_ns%s.img" % i)
+                if not os.path.exists(image):
+                    with open(image, "w") as img:
+                        img.truncate(self.backing_size * 1024 ** 3)
+                self.nss.append(image)
+
+    def set_local_addr(self):
+        """
+        Local target address, one per subsystem like the peer_ips input
+        """
+        addr = "127.0.0.1" if self.transport == 'tcp' else ''
+        self.peer_ips = [addr] * self.subsys_count
+
+    def fabric_args(self, index):
+        """
+        Returns the transport options of nvme discover/connect
+        """
+        if self.transport == 'loop':
+            return "-t loop"
+        return "-t %s -a %s -s 4420" % (self.transport, self.peer_ips[index])
+
     def create_cfg_file(self):
         """
         Creates the config file for nvmetcli to use in the target
@@ -91,6 +163,17 @@ class NVMfTest(Test):
             cfg["ports"][i]["subsystems"][0] = "mysubsys%s" % str(i + 1)
             cfg["ports"][i]["portid"] = str(i + 1)
 
+        if self.local:
+            # a single local port exporting all the subsystems
+            port = cfg["ports"][0]
+            port["subsystems"] = [subsys["nqn"]
+                                  for subsys in cfg["subsystems"]]
+            port["addr"]["trtype"] = self.transport
+            if self.transport == 'loop':
+                port["addr"].update({"adrfam": "", "traddr": "",
+                                     "trsvcid": ""})
+            cfg["ports"] = [port]
+
         with open(self.cfg_file, "w") as cfg_fp:
             json.dump(cfg, cfg_fp, indent=2)
 
@@ -108,6 +191,12 @@ class NVMfTest(Test):
         """
         Configures the peer NVMf.
         """
+        if self.local:
+            self.create_cfg_file()
+            if process.system("nvmetcli restore %s" % self.cfg_file,
+                              ignore_status=True):
+                self.fail("nvmetcli setup config fails locally")
+            return
         self.session = Session(self.peer_ips[0], user=self.peer_user,
                                password=self.peer_password)
         if not self.session.connect():
@@ -136,8 +225,8 @@ class NVMfTest(Test):
         Discovers NVMf subsystems on the initiator
         """
         for i in range(len(self.ids)):
-            cmd = "nvme discover -t rdma -a %s -s 4420 -q mysubsys%s" % (
-                self.peer_ips[i], str(i + 1))
+            cmd = "nvme discover %s -q mysubsys%s" % (
+                self.fabric_args(i), str(i + 1))
             if process.system(cmd, shell=True, ignore_status=True) != 0:
                 self.fail("Discover of mysubsys%s fails" % str(i + 1))
 
@@ -147,8 +236,8 @@ class NVMfTest(Test):
         """
         pre_count = self.nvme_devs_count()
         for i in range(len(self.ids)):
-            cmd = "nvme connect -t rdma -n mysubsys%s -a %s -s 4420" % (
-                str(i + 1), self.peer_ips[i])
+            cmd = "nvme connect %s -n mysubsys%s" % (
+                self.fabric_args(i), str(i + 1))
             if process.system(cmd, shell=True, ignore_status=True) != 0:
                 self.fail("Connect to mysubsys%s fails" % str(i + 1))
             # Time needed to populate the device in nvme list command
@@ -176,8 +265,8 @@ class NVMfTest(Test):
             os.makedirs(os.path.dirname(self.nvmf_discovery_file))
         msg = []
         for i in range(len(self.ids)):
-            msg.append("-t rdma -a %s -s 4420 -q mysubsys%s" %
-                       (self.peer_ips[i], str(i + 1)))
+            msg.append("%s -q mysubsys%s" %
+                       (self.fabric_args(i), str(i + 1)))
         genio.write_file(self.nvmf_discovery_file, "\n".join(msg))
         process.system("cat %s" % self.nvmf_discovery_file)
         pre_count = self.nvme_devs_count()
@@ -204,6 +293,12 @@ class NVMfTest(Test):
         """
         Clears the peer NVMf
         """
+        if self.local:
+            if process.system("nvmetcli clear", ignore_status=True):
+                self.fail("nvmetcli clear config fails locally")
+            if self.backing == 'null_blk':
+                process.system("rmmod null_blk", ignore_status=True)
+            return
         self.session = Session(self.peer_ips[0], user=self.peer_user,
                                password=self.peer_password)
         if not self.session.connect():
@@ -216,3 +311,120 @@ class NVMfTest(Test):
         output = self.session.cmd(msg)
         if output.exit_status:
             self.log.warn("removing config file on peer failed")
+
+    @staticmethod
+    def fabric_block_dev(nqn):
+        """
+        Returns the block device of the first namespace of the connected
+        subsystem nqn, '' if it is not connected
+        """
+        for sysdir in glob.glob("/sys/class/nvme-subsystem/*") + \
+                glob.glob("/sys/class/nvme/*"):
+            nqn_file = os.path.join(sysdir, "subsysnqn")
+            if not os.path.exists(nqn_file) or \
+                    genio.read_file(nqn_file).strip() != nqn:
+                continue
+            for entry in sorted(os.listdir(sysdir)):
+                if re.match(r"nvme\d+n\d+$", entry):
+                    return "/dev/%s" % entry
+        return ''
+
+    def run_fio(self, device, iodepth, block_size, numjobs):
+        """
+        Runs a direct I/O random read load on device and returns IOPS,
+        bandwidth and completion latency
+        """
+        cmd = ("fio --name=nvmf --filename=%s --ioengine=libaio --direct=1 "
+               "--rw=randread --bs=%s --iodepth=%s --numjobs=%s "
+               "--group_reporting --time_based --runtime=%s "
+               "--output-format=json" % (device, block_size, iodepth,
+                                         numjobs, self.runtime))
+        output = process.system_output(cmd, ignore_status=True)
+        try:
+            read = json.loads(output.decode())['jobs'][0]['read']
+        except (ValueError, KeyError, IndexError):
+            self.fail("fio failed on %s" % device)
+        return {'iops': round(read['iops']),
+                'bw_mbs': round(read['bw'] / 1024.0, 1),
+                'clat_mean_us': round(read['clat_ns']['mean'] / 1000, 1),
+                'clat_p99_us': round(read['clat_ns'].get('percentile', {})
+                                     .get('99.000000', 0) / 1000, 1)}
+
+    def test_fabric_perf(self):
+        """
+        Local target only: measures the connect/disconnect latency of all
+        the subsystems, then sweeps queue count, queue depth and I/O size
+        on the first subsystem and on its raw backing device to measure
+        the fabric overhead.
+        """
+        if not self.local:
+            self.cancel("fabric performance sweep needs local_transport")
+        self.test_targetconfig()
+        results = {'connect': [], 'sweep': []}
+        for i in range(len(self.ids)):
+            nqn = "mysubsys%s" % str(i + 1)
+            start = time.monotonic()
+            if process.system("nvme connect %s -n %s" % (self.fabric_args(i),
+                                                         nqn),
+                              ignore_status=True):
+                self.fail("Connect to %s fails" % nqn)
+            if not wait.wait_for(lambda: self.fabric_block_dev(nqn),
+                                 timeout=30, step=0.01):
+                self.fail("No block device for %s" % nqn)
+            connect = time.monotonic() - start
+            start = time.monotonic()
+            if process.system("nvme disconnect -n %s" % nqn,
+                              ignore_status=True):
+                self.fail("Disconnect to %s fails" % nqn)
+            wait.wait_for(lambda: not self.fabric_block_dev(nqn),
+                          timeout=30, step=0.01)
+            results['connect'].append({
+                'nqn': nqn, 'connect_ms': round(connect * 1000, 2),
+                'disconnect_ms': round((time.monotonic() - start) * 1000,
+                                       2)})
+        connect_ms = [res['connect_ms'] for res in results['connect']]
+        self.log.info("connect latency avg %.2f ms, max %.2f ms",
+                      sum(connect_ms) / len(connect_ms), max(connect_ms))
+        for queues in self.queue_counts:
+            process.system("nvme connect %s -n mysubsys1 --nr-io-queues=%s "
+                           "--queue-size=%s" % (self.fabric_args(0), queues,
+                                                max(self.queue_depths)),
+                           ignore_status=True)
+            if not wait.wait_for(lambda: self.fabric_block_dev("mysubsys1"),
+                                 timeout=30):
+                self.fail("Connect to mysubsys1 with %s queues fails"
+                          % queues)
+            device = self.fabric_block_dev("mysubsys1")
+            for iodepth in self.queue_depths:
+                for block_size in self.block_sizes:
+                    raw = self.run_fio(self.nss[0], iodepth, block_size,
+                                       queues)
+                    fabric = self.run_fio(device, iodepth, block_size,
+                                          queues)
+                    overhead = 0
+                    if raw['iops']:
+                        overhead = round(100 * (1 - float(fabric['iops']) /
+                                                raw['iops']), 2)
+                    step = {'queues': queues, 'iodepth': iodepth,
+                            'bs': block_size, 'raw': raw, 'fabric': fabric,
+                            'iops_overhead_pct': overhead}
+                    self.log.info("%s", step)
+                    results['sweep'].append(step)
+            process.system("nvme disconnect -n mysubsys1", ignore_status=True)
+            wait.wait_for(lambda: not self.fabric_block_dev("mysubsys1"),
+                          timeout=30)
+        self.whiteboard = json.dumps(results)
+        self.test_cleartargetconfig()
+
+    def tearDown(self):
+        """
+        Removes the local target and its backing devices
+        """
+        if getattr(self, 'local', False) and \
+                'fabric_perf' in str(self.name.name):
+            for i in range(len(self.ids)):
+                process.system("nvme disconnect -n mysubsys%s" % str(i + 1),
+                               ignore_status=True)
+            process.system("nvmetcli clear", ignore_status=True)
+            if self.backing == 'null_blk':
+                process.system("rmmod null_blk", ignore_status=True)
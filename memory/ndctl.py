@@ -21,8 +21,10 @@ This Suite works with various options of ndctl on a NVDIMM device.
 
 import os
 import re
+import json
 import shutil
 import math
+import stat
 
 import avocado
 from avocado import Test
@@ -30,6 +32,7 @@ from avocado.utils import process
 from avocado.utils import archive
 from avocado.utils import distro
 from avocado.utils import build
+from avocado.utils import cpu
 from avocado.utils import genio
 from avocado.utils import memory
 from avocado.utils import partition
@@ -39,6 +42,169 @@ from avocado.utils.git import GitRepoHelper
 from avocado.utils.software_manager.manager import SoftwareManager
 
 
+class PMemInventory:
+
+    """
+    Buses, dimms, regions and namespaces snapshot from a single
+    'ndctl list -BDRN' call. Mutating commands go through this object,
+    which re-lists only the touched region afterwards, so lookups do not
+    fork ndctl again.
+    """
+
+    def __init__(self, plib):
+        self.plib = plib
+        self.buses = []
+        self.dimms = []
+        self.regions = {}
+        self.caps = {}
+        self.refresh()
+
+    def refresh(self):
+        """
+        Re-read the whole topology with one ndctl call
+        """
+        buses = self.plib.run_ndctl_list('-BDRN')
+        if isinstance(buses, dict):
+            buses = [buses]
+        self.buses = []
+        self.dimms = []
+        self.regions = {}
+        for bus in buses:
+            self.dimms.extend(bus.pop('dimms', []))
+            for region in bus.pop('regions', []):
+                self.regions[region['dev']] = region
+            self.buses.append(bus)
+
+    def update_region(self, region):
+        """
+        Re-read a single region and its namespaces
+        """
+        regions = self.plib.run_ndctl_list('-R -N -r %s' % region)
+        if isinstance(regions, dict):
+            regions = [regions]
+        if regions:
+            self.regions[region] = regions[0]
+        else:
+            self.regions.pop(region, None)
+
+    def _update(self, region, namespace='all'):
+        # namespaceX.Y belongs to regionX
+        match = re.match(r'namespace(\d+)\.\d+$', str(namespace))
+        if not region and match:
+            region = 'region%s' % match.group(1)
+        if region:
+            self.update_region(region)
+        else:
+            self.refresh()
+
+    def capabilities(self, region):
+        """
+        Return the mode capabilities of the region, listed once
+        """
+        if region not in self.caps:
+            regions = self.plib.run_ndctl_list('-R -C -r %s' % region)
+            if isinstance(regions, dict):
+                regions = [regions]
+            self.caps[region] = regions[0].get('capabilities', []) \
+                if regions else []
+        return self.caps[region]
+
+    def sorted_regions(self):
+        """
+        Return the enabled regions, largest first
+        """
+        return sorted(self.regions.values(), key=lambda i: i['size'],
+                      reverse=True)
+
+    def namespaces(self, region=None, mode=None):
+        """
+        Return the enabled namespaces, of one region and mode if given
+        """
+        regions = [self.regions.get(region, {})] if region else \
+            self.regions.values()
+        return [ns for reg in regions for ns in reg.get('namespaces', [])
+                if not mode or ns.get('mode') == mode]
+
+    def enable_region(self, name='all'):
+        self.plib.enable_region(name)
+        self.refresh()
+
+    def disable_region(self, name='all'):
+        self.plib.disable_region(name)
+        self.refresh()
+
+    def create_namespace(self, region, **kwargs):
+        """
+        Create a namespace and return its json
+        """
+        old = set(ns['dev'] for ns in self.namespaces(region))
+        self.plib.create_namespace(region=region, **kwargs)
+        self.update_region(region)
+        new = [ns for ns in self.namespaces(region) if ns['dev'] not in old]
+        return new[0] if new else None
+
+    def destroy_namespace(self, namespace='all', region='', force=False):
+        self.plib.destroy_namespace(namespace=namespace, region=region,
+                                    force=force)
+        self._update(region, namespace)
+
+    def disable_namespace(self, namespace='all', region=''):
+        self.plib.disable_namespace(namespace=namespace, region=region)
+        self._update(region, namespace)
+
+    def enable_namespace(self, namespace='all', region=''):
+        self.plib.enable_namespace(namespace=namespace, region=region)
+        self._update(region, namespace)
+
+    @staticmethod
+    def to_bytes(size):
+        """
+        Convert an ndctl size argument like '2g' or '64M' to bytes
+        """
+        units = {'k': 1 << 10, 'm': 1 << 20, 'g': 1 << 30, 't': 1 << 40}
+        size = str(size).strip().lower()
+        if size[-1] in units:
+            return int(float(size[:-1]) * units[size[-1]])
+        return int(size)
+
+    def is_reusable(self, region, ns_json, mode, size=None, align=None,
+                    sector_size=None):
+        """
+        Check if the namespace already has the requested mode, raw size,
+        alignment and sector size, a namespace without size spans the
+        whole region
+        """
+        if ns_json.get('mode') != mode:
+            return False
+        if align and ns_json.get('align') != self.to_bytes(align):
+            return False
+        if sector_size and ns_json.get('sector_size') != int(sector_size):
+            return False
+        if size:
+            raw_size = genio.read_one_line(
+                '/sys/bus/nd/devices/%s/size' % ns_json['dev'])
+            return int(raw_size) == self.to_bytes(size)
+        return not self.regions[region].get('available_size')
+
+    def ensure_namespace(self, region, mode='fsdax', size=None, align=None,
+                         sector_size=None):
+        """
+        Return the json of the only namespace of the region when it already
+        matches, else replace the region namespaces with a new one
+        """
+        namespaces = self.namespaces(region)
+        if self.plib.is_region_legacy(region):
+            return namespaces[0] if namespaces else None
+        if len(namespaces) == 1 and self.is_reusable(
+                region, namespaces[0], mode, size, align, sector_size):
+            return namespaces[0]
+        if namespaces:
+            self.destroy_namespace(region=region, force=True)
+        return self.create_namespace(region, mode=mode, size=size or '',
+                                     align=align or '',
+                                     sector_size=sector_size or '')
+
+
 class NdctlTest(Test):
 
     """
@@ -49,13 +215,11 @@ class NdctlTest(Test):
         """
         Get the largest region if not provided
         """
-        self.plib.enable_region()
+        self.inv.enable_region()
         region = self.params.get('region', default=None)
         if region:
             return region
-        regions = self.plib.run_ndctl_list('-R')
-        regions = sorted(regions, key=lambda i: i['size'], reverse=True)
-        return self.plib.run_ndctl_list_val(regions[0], 'dev')
+        return self.inv.sorted_regions()[0]['dev']
 
     @staticmethod
     def get_unsupported_alignval(def_align):
@@ -81,10 +245,7 @@ class NdctlTest(Test):
         idx = re.findall(r'\d+', region)[0]
         map_align = int(genio.read_one_line(
             "/sys/bus/nd/devices/pfn%s.0/align" % idx))
-        namespaces = self.plib.run_ndctl_list('-N -r %s' % region)
-        for ns in namespaces:
-            ns_name = self.plib.run_ndctl_list_val(ns, 'dev')
-            namespace = self.plib.run_ndctl_list('-n %s' % ns_name)[0]
+        for namespace in self.inv.namespaces(region):
             ndctl_align = self.plib.run_ndctl_list_val(namespace, 'align')
             if map_align != ndctl_align:
                 self.fail("Mismatch in mapping alignment and ndctl list align")
@@ -131,6 +292,103 @@ class NdctlTest(Test):
                 return os.path.join(sourcedir, "fio")
         return pkg
 
+    def get_region_alignments(self, region):
+        """
+        Return the alignments the region supports for the DAX modes
+        """
+        aligns = {}
+        for typ in self.inv.capabilities(region):
+            mode = self.plib.run_ndctl_list_val(typ, 'mode')
+            if mode in ['fsdax', 'devdax']:
+                aligns[mode] = self.plib.run_ndctl_list_val(
+                    typ, 'alignments') or []
+        return aligns
+
+    @staticmethod
+    def get_perf_nodes(ns_name):
+        """
+        Return the NUMA node with CPUs local to the namespace and a remote
+        one, remote is None on a single node system
+        """
+        nodes = sorted(cpu.numa_nodes_with_assigned_cpus().keys())
+        numa_path = '/sys/bus/nd/devices/%s/numa_node' % ns_name
+        local = None
+        if os.path.exists(numa_path):
+            local = int(genio.read_one_line(numa_path))
+        if local not in nodes:
+            local = nodes[0] if nodes else 0
+        remote = [node for node in nodes if node != local]
+        return {'local': local, 'remote': remote[0] if remote else None}
+
+    def get_perf_target(self, mode, ns_json, mnt_path, engines):
+        """
+        Return the fio target and ioengine for the namespace, a file on a
+        DAX mounted filesystem for fsdax
+        """
+        if mode == 'devdax':
+            chardev = self.plib.run_ndctl_list_val(ns_json, 'chardev')
+            engine = 'dev-dax' if 'dev-dax' in engines else 'mmap'
+            return '/dev/%s' % chardev, engine
+        self.disk = '/dev/%s' % self.plib.run_ndctl_list_val(
+            ns_json, 'blockdev')
+        if mode != 'fsdax':
+            return self.disk, 'libaio'
+        self.part = partition.Partition(
+            self.disk, mountpoint=mnt_path, mount_options='dax')
+        self.part.mkfs(fstype='xfs', args='-b size=%s -s size=512 %s' %
+                       (memory.get_page_size(), self.reflink))
+        if not os.path.exists(mnt_path):
+            os.makedirs(mnt_path)
+        self.part.mount()
+        target = os.path.join(mnt_path, 'pmem-perf')
+        process.system('fallocate -l %sM %s' % (self.perf_size_mb, target))
+        return target, 'libpmem' if 'libpmem' in engines else 'mmap'
+
+    def run_perf_fio(self, fio, target, engine, node):
+        """
+        Run the perf_workloads with fio on target bound to the NUMA node
+        and return bandwidth, IOPS and mean completion latency of each
+        """
+        results = {}
+        for workload in self.perf_workloads:
+            rw, bsize = workload.split(':')
+            cmd = ('numactl --cpunodebind=%s --localalloc %s --name=pmem-perf'
+                   ' --filename=%s --ioengine=%s --rw=%s --bs=%s --size=%sM'
+                   ' --time_based --runtime=%s --output-format=json'
+                   % (node, fio, target, engine, rw, bsize,
+                      self.perf_size_mb, self.perf_runtime))
+            if engine == 'libaio':
+                cmd += ' --direct=1 --iodepth=16'
+            result = process.run(cmd, ignore_status=True, sudo=True)
+            if result.exit_status:
+                self.fail("fio %s with %s on %s failed"
+                          % (workload, engine, target))
+            output = result.stdout_text
+            job = json.loads(output[output.find('{'):])['jobs'][0]
+            stats = job['write' if 'write' in rw else 'read']
+            name = '%s_%s' % (rw, bsize)
+            results['%s_bw_mbs' % name] = round(stats['bw'] / 1024.0, 1)
+            results['%s_iops' % name] = round(stats['iops'])
+            results['%s_lat_us' % name] = round(
+                stats.get('clat_ns', {}).get('mean', 0) / 1000.0, 2)
+        return results
+
+    def run_latency_probe(self, probe, target, node):
+        """
+        Run the mmap load/store latency probe on target bound to the NUMA
+        node, returns an empty dict if the mapping is not possible
+        """
+        result = process.run('numactl --cpunodebind=%s --localalloc %s %s %s'
+                             ' %s' % (node, probe, target, self.perf_size_mb,
+                                      self.probe_iterations),
+                             ignore_status=True, sudo=True)
+        if result.exit_status:
+            self.log.warn("Latency probe on %s failed: %s", target,
+                          result.stdout_text.strip())
+            return {}
+        return {key: float(val) for key, val in
+                re.findall(r'(\w+_ns) ([\d.]+)', result.stdout_text)}
+
     def copyutil(self, file_name, iniparser_dir):
         shutil.copy(file_name, iniparser_dir)
 
@@ -196,6 +454,17 @@ class NdctlTest(Test):
         self.preserve_setup = self.params.get('preserve_change', default=False)
         self.mode_to_use = self.params.get('modes', default='fsdax')
         self.size_1g_align = self.params.get('size_1g_align', default='2g')
+        self.perf_modes = self.params.get(
+            'perf_modes', default=['fsdax', 'devdax', 'sector', 'raw'])
+        self.perf_aligns = self.params.get('perf_aligns', default=None)
+        self.perf_ns_size = self.params.get('perf_ns_size', default='3g')
+        self.perf_size_mb = self.params.get('perf_size_mb', default=1024)
+        self.perf_runtime = self.params.get('perf_runtime', default=30)
+        self.perf_workloads = self.params.get(
+            'perf_workloads', default=['read:128k', 'write:128k',
+                                       'randread:4k', 'randwrite:4k'])
+        self.probe_iterations = self.params.get('probe_iterations',
+                                                default=1000000)
         location = self.params.get('location', default='.')
 
         ndctl_project_version = self.params.get(
@@ -283,6 +552,7 @@ class NdctlTest(Test):
         self.plib = pmem.PMem(self.ndctl, self.daxctl)
         if not self.plib.check_buses():
             self.cancel("Test needs at least one region")
+        self.inv = PMemInventory(self.plib)
 
     @avocado.fail_on(pmem.PMemException)
     def test_bus_ids(self):
@@ -351,34 +621,33 @@ class NdctlTest(Test):
         """
         Test namespace
         """
-        self.plib.enable_region()
-        regions = self.plib.run_ndctl_list('-R')
+        self.inv.enable_region()
+        regions = list(self.inv.regions.values())
         for val in regions:
             region = self.plib.run_ndctl_list_val(val, 'dev')
-            self.plib.disable_namespace(region=region)
-            self.plib.destroy_namespace(region=region)
-            self.plib.create_namespace(region=region)
+            self.inv.disable_namespace(region=region)
+            self.inv.destroy_namespace(region=region)
+            self.inv.create_namespace(region=region)
             self.check_namespace_align(region)
 
-        namespaces = self.plib.run_ndctl_list('-N')
-        self.log.info('Created namespace %s', namespaces)
+        self.log.info('Created namespace %s', self.inv.namespaces())
 
     @avocado.fail_on(pmem.PMemException)
     def test_namespace_unaligned(self):
         """
         Test namespace
         """
-        self.plib.enable_region()
+        self.inv.enable_region()
         # Use an default unaligned pagesize and make sure it fails
         align_size = memory.get_page_size()
         size = (64 * 1024 * 1024) + align_size
-        regions = self.plib.run_ndctl_list('-R')
+        regions = list(self.inv.regions.values())
         for val in regions:
             region = self.plib.run_ndctl_list_val(val, 'dev')
-            self.plib.disable_namespace(region=region)
-            self.plib.destroy_namespace(region=region)
+            self.inv.disable_namespace(region=region)
+            self.inv.destroy_namespace(region=region)
             try:
-                self.plib.create_namespace(
+                self.inv.create_namespace(
                     region=region, size=size, align=align_size)
             except pmem.PMemException:
                 self.log.info("Unaligned namespace creation failed"
@@ -393,21 +662,20 @@ class NdctlTest(Test):
         """
         region = self.get_default_region()
         if (not self.plib.is_region_legacy(region)):
-            size = self.plib.run_ndctl_list_val(self.plib.run_ndctl_list(
-                '-r %s' % region)[0], 'size')
+            size = self.inv.regions[region]['size']
             if size < (3 * 64 * 1024 * 1024):
                 self.cancel('Not enough memory to create namespaces')
             for _ in range(0, 3):
-                self.plib.create_namespace(region=region, size='64M')
-        namespaces = self.plib.run_ndctl_list('-N')
+                self.inv.create_namespace(region=region, size='64M')
+        namespaces = self.inv.namespaces()
         ns_names = []
         for ns in namespaces:
             ns_names.append(self.plib.run_ndctl_list_val(ns, 'dev'))
         ns_names.append('all')
 
         for namespace in ns_names:
-            self.plib.disable_namespace(namespace=namespace)
-            self.plib.enable_namespace(namespace=namespace)
+            self.inv.disable_namespace(namespace=namespace)
+            self.inv.enable_namespace(namespace=namespace)
 
     @avocado.fail_on(pmem.PMemException)
     def test_namespace_modes(self):
@@ -417,11 +685,11 @@ class NdctlTest(Test):
         failed_modes = []
         region = self.get_default_region()
         self.log.info("Using %s for different namespace modes", region)
-        self.plib.disable_namespace(region=region)
-        self.plib.destroy_namespace(region=region)
+        self.inv.disable_namespace(region=region)
+        self.inv.destroy_namespace(region=region)
         for mode in self.modes:
-            self.plib.create_namespace(region=region, mode=mode)
-            ns_json = self.plib.run_ndctl_list('-r %s -N' % region)[0]
+            self.inv.create_namespace(region=region, mode=mode)
+            ns_json = self.inv.namespaces(region)[0]
             created_mode = self.plib.run_ndctl_list_val(ns_json, 'mode')
             if mode != created_mode:
                 failed_modes.append(mode)
@@ -429,8 +697,8 @@ class NdctlTest(Test):
             else:
                 self.log.info("Namespace with %s mode: %s", mode, ns_json)
             ns_name = self.plib.run_ndctl_list_val(ns_json, 'dev')
-            self.plib.disable_namespace(namespace=ns_name, region=region)
-            self.plib.destroy_namespace(namespace=ns_name, region=region)
+            self.inv.disable_namespace(namespace=ns_name, region=region)
+            self.inv.destroy_namespace(namespace=ns_name, region=region)
 
         if failed_modes:
             self.fail("Namespace for %s mode failed!" % failed_modes)
@@ -443,13 +711,13 @@ class NdctlTest(Test):
         region = self.get_default_region()
         m_map = self.params.get('map', default='mem')
         self.log.info("Using %s for checking device mapping", region)
-        self.plib.disable_namespace(region=region)
-        self.plib.destroy_namespace(region=region)
-        self.plib.create_namespace(region=region, mode=self.mode_to_use,
-                                   memmap=m_map)
+        self.inv.disable_namespace(region=region)
+        self.inv.destroy_namespace(region=region)
+        self.inv.create_namespace(region=region, mode=self.mode_to_use,
+                                  memmap=m_map)
         self.log.info("Validating device mapping")
-        map_val = self.plib.run_ndctl_list_val(self.plib.run_ndctl_list(
-            '-r %s -N' % region)[0], 'map')
+        map_val = self.plib.run_ndctl_list_val(
+            self.inv.namespaces(region)[0], 'map')
         if map_val != m_map:
             self.fail("Expected map:%s, Got %s" % (m_map, map_val))
         else:
@@ -463,14 +731,13 @@ class NdctlTest(Test):
         size_align = self.get_size_alignval()
         slot_count = self.plib.get_slot_count(region)
         self.log.info("Using %s for multiple namespace regions", region)
-        self.plib.disable_namespace(region=region)
-        self.plib.destroy_namespace(region=region)
+        self.inv.disable_namespace(region=region)
+        self.inv.destroy_namespace(region=region)
         if namespace_size and ((namespace_size % size_align) != 0):
             self.cancel("Size value not %d aligned %d \n",
                         size_align, namespace_size)
 
-        region_size = self.plib.run_ndctl_list_val(self.plib.run_ndctl_list(
-            '-r %s' % region)[0], 'size')
+        region_size = self.inv.regions[region]['size']
         if not namespace_size:
             namespace_size = region_size // slot_count
             # Now align the namespace size
@@ -484,7 +751,7 @@ class NdctlTest(Test):
 
         self.log.info("Creating %s namespaces", slot_count)
         for count in range(0, slot_count):
-            self.plib.create_namespace(
+            self.inv.create_namespace(
                 region=region, mode=self.mode_to_use, size=namespace_size)
             self.log.info("Namespace %s created", count + 1)
 
@@ -504,12 +771,12 @@ class NdctlTest(Test):
         """
         Test multiple namespace with multiple region
         """
-        self.plib.enable_region()
-        if len(self.plib.run_ndctl_list('-R')) <= 1:
+        self.inv.enable_region()
+        regions = list(self.inv.regions.values())
+        if len(regions) <= 1:
             self.cancel("Test not applicable without multiple regions")
-        regions = self.plib.run_ndctl_list('-R')
-        self.plib.disable_namespace()
-        self.plib.destroy_namespace()
+        self.inv.disable_namespace()
+        self.inv.destroy_namespace()
         for val in regions:
             region = self.plib.run_ndctl_list_val(val, 'dev')
             if (self.plib.is_region_legacy(region)):
@@ -526,14 +793,13 @@ class NdctlTest(Test):
         if (self.plib.is_region_legacy(region)):
             self.cancel("Legacy config skipping the test")
         self.log.info("Using %s for multiple namespace regions", region)
-        self.plib.disable_namespace(region=region)
-        self.plib.destroy_namespace(region=region)
-        size = self.plib.run_ndctl_list_val(self.plib.run_ndctl_list(
-            '-r %s' % region)[0], 'size')
+        self.inv.disable_namespace(region=region)
+        self.inv.destroy_namespace(region=region)
+        size = self.inv.regions[region]['size']
         if size < (len(self.modes) * 64 * 1024 * 1024):
             self.cancel('Not enough memory to create namespaces')
         for mode in self.modes:
-            self.plib.create_namespace(
+            self.inv.create_namespace(
                 region=region, mode=mode, size='64M')
             self.log.info("Namespace of type %s created", mode)
 
@@ -548,18 +814,17 @@ class NdctlTest(Test):
         size_align = self.get_size_alignval()
         slot_count = self.plib.get_slot_count(region)
         self.log.info("Using %s for max namespace creation", region)
-        self.plib.disable_namespace()
-        self.plib.destroy_namespace()
-        region_size = self.plib.run_ndctl_list_val(self.plib.run_ndctl_list(
-            '-r %s' % region)[0], 'size')
+        self.inv.disable_namespace()
+        self.inv.destroy_namespace()
+        region_size = self.inv.regions[region]['size']
         namespace_size = region_size // slot_count
         # Now align the namespace size
         namespace_size = (namespace_size // size_align) * size_align
 
         self.log.info("Creating %s namespace", slot_count)
         for count in range(0, slot_count):
-            self.plib.create_namespace(region=region, mode='fsdax',
-                                       size=namespace_size)
+            self.inv.create_namespace(region=region, mode='fsdax',
+                                      size=namespace_size)
             self.log.info("Namespace %s created", count)
         self.check_namespace_align(region)
 
@@ -570,15 +835,15 @@ class NdctlTest(Test):
         """
         region = self.get_default_region()
         self.log.info("Using %s for reconfiguring namespace", region)
-        self.plib.disable_namespace()
-        self.plib.destroy_namespace()
-        self.plib.create_namespace(region=region, mode='fsdax', align='64k')
-        old_ns = self.plib.run_ndctl_list()[0]
+        self.inv.disable_namespace()
+        self.inv.destroy_namespace()
+        self.inv.create_namespace(region=region, mode='fsdax', align='64k')
+        old_ns = self.inv.namespaces()[0]
         old_ns_dev = self.plib.run_ndctl_list_val(old_ns, 'dev')
         self.log.info("Re-configuring namespace %s", old_ns_dev)
-        self.plib.create_namespace(region=region, mode='fsdax', name='test_ns',
-                                   reconfig=old_ns_dev, force=True)
-        new_ns = self.plib.run_ndctl_list()[0]
+        self.inv.create_namespace(region=region, mode='fsdax', name='test_ns',
+                                  reconfig=old_ns_dev, force=True)
+        new_ns = self.inv.namespaces(region)[0]
         self.log.info("Checking namespace changes")
         failed_vals = []
         for key, val in new_ns.items():
@@ -596,13 +861,13 @@ class NdctlTest(Test):
         Verify metadata for sector mode namespaces
         """
         region = self.get_default_region()
-        self.plib.disable_namespace()
-        self.plib.destroy_namespace()
+        self.inv.disable_namespace()
+        self.inv.destroy_namespace()
         self.log.info("Creating sector namespace using %s", region)
-        self.plib.create_namespace(region=region, mode='sector')
+        self.inv.create_namespace(region=region, mode='sector')
         ns_sec_dev = self.plib.run_ndctl_list_val(
-            self.plib.run_ndctl_list()[0], 'dev')
-        self.plib.disable_namespace(namespace=ns_sec_dev)
+            self.inv.namespaces()[0], 'dev')
+        self.inv.disable_namespace(namespace=ns_sec_dev)
         self.log.info("Checking BTT metadata")
         if process.system("%s check-namespace %s" % (self.ndctl, ns_sec_dev),
                           ignore_status=True):
@@ -610,8 +875,8 @@ class NdctlTest(Test):
 
     @avocado.fail_on(pmem.PMemException)
     def test_check_numa(self):
-        self.plib.enable_region()
-        regions = self.plib.run_ndctl_list('-R')
+        self.inv.enable_region()
+        regions = list(self.inv.regions.values())
         if not os.path.exists('/sys/bus/nd/devices/region0/numa_node'):
             self.fail("Numa node entries not found!")
         for val in regions:
@@ -625,22 +890,22 @@ class NdctlTest(Test):
 
     @avocado.fail_on(pmem.PMemException)
     def test_check_ns_numa(self):
-        self.plib.enable_region()
-        regions = self.plib.run_ndctl_list('-R')
+        self.inv.enable_region()
+        regions = list(self.inv.regions.values())
         for dev in regions:
             region = self.plib.run_ndctl_list_val(dev, 'dev')
             if not self.plib.is_region_legacy(region):
-                self.plib.disable_namespace(region=region)
-                self.plib.destroy_namespace(region=region)
+                self.inv.disable_namespace(region=region)
+                self.inv.destroy_namespace(region=region)
                 size = self.plib.run_ndctl_list_val(dev, 'size')
                 if size < (3 * 64 * 1024 * 1024):
                     self.log.warn('Skipping region due to insufficient memory')
                     continue
                 for _ in range(3):
-                    self.plib.create_namespace(
+                    self.inv.create_namespace(
                         region=region, mode='fsdax', size='64M')
 
-            namespaces = self.plib.run_ndctl_list('-N -r %s' % region)
+            namespaces = self.inv.namespaces(region)
             if not os.path.exists(
                     '/sys/bus/nd/devices/namespace0.0/numa_node'):
                 self.fail("Numa node entries not found!")
@@ -668,7 +933,8 @@ class NdctlTest(Test):
             self.fail("Label zero-fill failed")
 
         self.plib.enable_region(name=region)
-        self.plib.create_namespace(region=region, align=align)
+        self.inv.update_region(region)
+        self.inv.create_namespace(region=region, align=align)
         self.log.info("Storing labels with a namespace")
         old_op = process.system_output(
             '%s check-labels %s' % (self.ndctl, nmem), shell=True)
@@ -677,8 +943,8 @@ class NdctlTest(Test):
             self.fail("Label read failed")
 
         self.log.info("Refilling zeroes before a restore")
-        self.plib.disable_namespace(region=region)
-        self.plib.destroy_namespace(region=region)
+        self.inv.disable_namespace(region=region)
+        self.inv.destroy_namespace(region=region)
         self.plib.disable_region(name=region)
         if process.system('%s zero-labels %s'
                           % (self.ndctl, nmem), shell=True):
@@ -689,6 +955,7 @@ class NdctlTest(Test):
                           % (self.ndctl, nmem), shell=True):
             self.fail("Label write failed")
         self.plib.enable_region(name=region)
+        self.inv.update_region(region)
 
         self.log.info("Checking mismatch after restore")
         new_op = process.system_output(
@@ -697,7 +964,7 @@ class NdctlTest(Test):
             self.fail("Label read and write mismatch")
 
         self.log.info("Checking created namespace after restore")
-        if len(self.plib.run_ndctl_list('-N -r %s' % region)) != 1:
+        if len(self.inv.namespaces(region)) != 1:
             self.fail("Created namespace not found after label restore")
 
     @avocado.fail_on(pmem.PMemException)
@@ -706,9 +973,9 @@ class NdctlTest(Test):
         Test daxctl list
         """
         region = self.get_default_region()
-        self.plib.disable_namespace(region=region)
-        self.plib.destroy_namespace(region=region)
-        self.plib.create_namespace(region=region, mode='devdax')
+        self.inv.disable_namespace(region=region)
+        self.inv.destroy_namespace(region=region)
+        self.inv.create_namespace(region=region, mode='devdax')
         index = re.findall(r'\d+', region)[0]
         vals = self.plib.run_daxctl_list('-r %s' % (index))
         if len(vals) != 1:
@@ -720,12 +987,11 @@ class NdctlTest(Test):
         """
         Test region capabilities
         """
-        self.plib.enable_region()
-        self.plib.disable_namespace()
-        self.plib.destroy_namespace()
-        regions = self.plib.run_ndctl_list('-R -C')
-        for region in regions:
-            cap = self.plib.run_ndctl_list_val(region, 'capabilities')
+        self.inv.enable_region()
+        self.inv.disable_namespace()
+        self.inv.destroy_namespace()
+        for reg_name in list(self.inv.regions):
+            cap = self.inv.capabilities(reg_name)
             sec_sizes = []
             fsdax_align = []
             devdax_align = []
@@ -740,20 +1006,19 @@ class NdctlTest(Test):
                 elif mode == 'sector':
                     sec_sizes = self.plib.run_ndctl_list_val(
                         typ, 'sector_sizes')
-            reg_name = self.plib.run_ndctl_list_val(region, 'dev')
             self.log.info("Creating namespaces with possible sizes")
             for size in sec_sizes:
-                self.plib.create_namespace(
+                self.inv.create_namespace(
                     region=reg_name, mode='sector', sector_size=size)
-                self.plib.destroy_namespace(region=reg_name, force=True)
+                self.inv.destroy_namespace(region=reg_name, force=True)
             for size in fsdax_align:
-                self.plib.create_namespace(
+                self.inv.create_namespace(
                     region=reg_name, mode='fsdax', align=size)
-                self.plib.destroy_namespace(region=reg_name, force=True)
+                self.inv.destroy_namespace(region=reg_name, force=True)
             for size in devdax_align:
-                self.plib.create_namespace(
+                self.inv.create_namespace(
                     region=reg_name, mode='devdax', align=size)
-                self.plib.destroy_namespace(region=reg_name, force=True)
+                self.inv.destroy_namespace(region=reg_name, force=True)
 
     @avocado.fail_on(pmem.PMemException)
     def test_daxctl_memhotplug_unplug(self, align='2M'):
@@ -764,11 +1029,11 @@ class NdctlTest(Test):
             if not self.plib.check_daxctl_subcmd(cmd):
                 self.cancel("Binary does not support %s" % cmd)
         region = self.get_default_region()
-        self.plib.disable_namespace(region=region)
-        self.plib.destroy_namespace(region=region)
-        self.plib.create_namespace(region=region, mode='devdax', align=align)
+        self.inv.disable_namespace(region=region)
+        self.inv.destroy_namespace(region=region)
+        self.inv.create_namespace(region=region, mode='devdax', align=align)
         daxdev = self.plib.run_ndctl_list_val(
-            self.plib.run_ndctl_list("-N -r %s" % region)[0], 'chardev')
+            self.inv.namespaces(region)[0], 'chardev')
         old_mem = memory.meminfo.MemTotal.b
         dev_prop = self.plib.reconfigure_dax_device(daxdev, mode="system-ram")
         self.log.info("Reconfigured device %s", dev_prop)
@@ -812,15 +1077,15 @@ class NdctlTest(Test):
         if not self.plib.check_ndctl_subcmd("write-infoblock"):
             self.cancel("Binary does not support write-infoblock")
         region = self.get_default_region()
-        self.plib.disable_namespace(region=region)
-        self.plib.destroy_namespace(region=region)
-        self.plib.create_namespace(region=region, mode='devdax', align=align)
+        self.inv.disable_namespace(region=region)
+        self.inv.destroy_namespace(region=region)
+        self.inv.create_namespace(region=region, mode='devdax', align=align)
         ns_name = self.plib.run_ndctl_list_val(
-            self.plib.run_ndctl_list("-N -r %s" % region)[0], 'dev')
-        self.plib.disable_namespace(namespace=ns_name)
+            self.inv.namespaces(region)[0], 'dev')
+        self.inv.disable_namespace(namespace=ns_name)
         map_align = memory.get_supported_huge_pages_size()[0] * 1024
         self.write_read_infoblock(ns_name, align=map_align)
-        self.plib.enable_namespace(namespace=ns_name)
+        self.inv.enable_namespace(namespace=ns_name)
 
     @avocado.fail_on(pmem.PMemException)
     def test_write_infoblock_unalign(self, align='2M'):
@@ -830,21 +1095,21 @@ class NdctlTest(Test):
         if not self.plib.check_ndctl_subcmd("write-infoblock"):
             self.cancel("Binary does not support write-infoblock")
         region = self.get_default_region()
-        self.plib.disable_namespace(region=region)
-        self.plib.destroy_namespace(region=region)
-        self.plib.create_namespace(region=region, mode='devdax', align=align)
+        self.inv.disable_namespace(region=region)
+        self.inv.destroy_namespace(region=region)
+        self.inv.create_namespace(region=region, mode='devdax', align=align)
         ns_name = self.plib.run_ndctl_list_val(
-            self.plib.run_ndctl_list("-N -r %s" % region)[0], 'dev')
-        self.plib.disable_namespace(namespace=ns_name)
+            self.inv.namespaces(region)[0], 'dev')
+        self.inv.disable_namespace(namespace=ns_name)
         map_align = memory.get_supported_huge_pages_size()[0] * 1024
         self.write_read_infoblock(
             ns_name, align=self.get_unsupported_alignval(map_align))
         try:
-            self.plib.enable_namespace(namespace=ns_name)
+            self.inv.enable_namespace(namespace=ns_name)
         except pmem.PMemException:
             self.log.info("Failed as expected")
         else:
-            self.log.info(self.plib.run_ndctl_list())
+            self.log.info(self.inv.namespaces(region))
             self.fail("Enabling namespace must have failed")
 
         idle_ns = self.plib.run_ndctl_list('-Ni -r %s' % region)
@@ -859,7 +1124,7 @@ class NdctlTest(Test):
         if not found:
             self.fail("Namespace with infoblock written not found")
 
-        self.plib.destroy_namespace(namespace=ns_name, force=True)
+        self.inv.destroy_namespace(namespace=ns_name, force=True)
 
     @avocado.fail_on(pmem.PMemException)
     def test_write_infoblock_align_default(self, align='2M'):
@@ -869,14 +1134,13 @@ class NdctlTest(Test):
         if not self.plib.check_ndctl_subcmd("write-infoblock"):
             self.cancel("Binary does not support write-infoblock")
         region = self.get_default_region()
-        self.plib.disable_namespace(region=region)
-        self.plib.destroy_namespace(region=region)
-        self.plib.create_namespace(region=region, mode='devdax', align=align)
-        ns_name = self.plib.run_ndctl_list_val(
-            self.plib.run_ndctl_list("-N -r %s" % region)[0], 'dev')
-        align = self.plib.run_ndctl_list_val(
-            self.plib.run_ndctl_list("-N -r %s" % region)[0], 'align')
-        self.plib.disable_namespace(namespace=ns_name)
+        self.inv.disable_namespace(region=region)
+        self.inv.destroy_namespace(region=region)
+        self.inv.create_namespace(region=region, mode='devdax', align=align)
+        ns_json = self.inv.namespaces(region)[0]
+        ns_name = self.plib.run_ndctl_list_val(ns_json, 'dev')
+        align = self.plib.run_ndctl_list_val(ns_json, 'align')
+        self.inv.disable_namespace(namespace=ns_name)
         write_block = self.write_read_infoblock(ns_name)
         if align != self.plib.run_ndctl_list_val(write_block, 'align'):
             self.fail("Alignment is not same as default alignment")
@@ -889,18 +1153,17 @@ class NdctlTest(Test):
         if not self.plib.check_ndctl_subcmd("write-infoblock"):
             self.cancel("Binary does not support write-infoblock")
         region = self.get_default_region()
-        self.plib.disable_namespace(region=region)
-        self.plib.destroy_namespace(region=region)
-        self.plib.create_namespace(region=region, mode='devdax', align=align)
-        ns_name = self.plib.run_ndctl_list_val(
-            self.plib.run_ndctl_list("-N -r %s" % region)[0], 'dev')
-        size = self.plib.run_ndctl_list_val(
-            self.plib.run_ndctl_list("-N -r %s" % region)[0], 'size')
-        self.plib.disable_namespace(namespace=ns_name)
+        self.inv.disable_namespace(region=region)
+        self.inv.destroy_namespace(region=region)
+        self.inv.create_namespace(region=region, mode='devdax', align=align)
+        ns_json = self.inv.namespaces(region)[0]
+        ns_name = self.plib.run_ndctl_list_val(ns_json, 'dev')
+        size = self.plib.run_ndctl_list_val(ns_json, 'size')
+        self.inv.disable_namespace(namespace=ns_name)
         align = self.get_size_alignval()
         size = size - align
         self.write_read_infoblock(ns_name, size=size)
-        self.plib.enable_namespace(namespace=ns_name)
+        self.inv.enable_namespace(namespace=ns_name)
 
     @avocado.fail_on(pmem.PMemException)
     def test_write_infoblock_size_unaligned(self, align='2M'):
@@ -910,23 +1173,22 @@ class NdctlTest(Test):
         if not self.plib.check_ndctl_subcmd("write-infoblock"):
             self.cancel("Binary does not support write-infoblock")
         region = self.get_default_region()
-        self.plib.disable_namespace(region=region)
-        self.plib.destroy_namespace(region=region)
-        self.plib.create_namespace(region=region, mode='devdax', align=align)
-        ns_name = self.plib.run_ndctl_list_val(
-            self.plib.run_ndctl_list("-N -r %s" % region)[0], 'dev')
-        size = self.plib.run_ndctl_list_val(
-            self.plib.run_ndctl_list("-N -r %s" % region)[0], 'size')
-        self.plib.disable_namespace(namespace=ns_name)
+        self.inv.disable_namespace(region=region)
+        self.inv.destroy_namespace(region=region)
+        self.inv.create_namespace(region=region, mode='devdax', align=align)
+        ns_json = self.inv.namespaces(region)[0]
+        ns_name = self.plib.run_ndctl_list_val(ns_json, 'dev')
+        size = self.plib.run_ndctl_list_val(ns_json, 'size')
+        self.inv.disable_namespace(namespace=ns_name)
         align = memory.get_page_size()
         size = size - align
         self.write_read_infoblock(ns_name, size=size, align=align)
         try:
-            self.plib.enable_namespace(namespace=ns_name)
+            self.inv.enable_namespace(namespace=ns_name)
         except pmem.PMemException:
             self.log.info("Failed as expected")
         else:
-            self.log.info(self.plib.run_ndctl_list())
+            self.log.info(self.inv.namespaces(region))
             self.fail("Enabling namespace must have failed")
 
     @avocado.fail_on(pmem.PMemException)
@@ -935,14 +1197,10 @@ class NdctlTest(Test):
         Test write on a sector mode device
         """
         region = self.get_default_region()
-        self.plib.disable_namespace(region=region)
-        self.plib.destroy_namespace(region=region)
-        self.plib.create_namespace(region=region, mode='sector',
-                                   sector_size='512')
-        self.disk = '/dev/%s' % self.plib.run_ndctl_list_val(
-            self.plib.run_ndctl_list("-N -r %s" % region)[0], 'blockdev')
-        size = self.plib.run_ndctl_list_val(self.plib.run_ndctl_list(
-            "-N -r %s" % region)[0], 'size')
+        ns_json = self.inv.ensure_namespace(region, mode='sector',
+                                            sector_size='512')
+        self.disk = '/dev/%s' % ns_json['blockdev']
+        size = ns_json['size']
         mnt_path = self.params.get('mnt_point', default='/pmemS')
         self.part = partition.Partition(self.disk, mountpoint=mnt_path)
         self.part.mkfs(fstype='xfs', args='-b size=%s -s size=512' %
@@ -963,11 +1221,9 @@ class NdctlTest(Test):
         Test filesystem DAX with a FIO workload
         """
         region = self.get_default_region()
-        self.plib.create_namespace(region=region, mode='fsdax', align=align)
-        self.disk = '/dev/%s' % self.plib.run_ndctl_list_val(
-            self.plib.run_ndctl_list("-N -r %s" % region)[0], 'blockdev')
-        size = self.plib.run_ndctl_list_val(self.plib.run_ndctl_list(
-            "-N -r %s" % region)[0], 'size')
+        ns_json = self.inv.ensure_namespace(region, mode='fsdax', align=align)
+        self.disk = '/dev/%s' % ns_json['blockdev']
+        size = ns_json['size']
         mnt_path = self.params.get('mnt_point', default='/pmem')
         self.part = partition.Partition(
             self.disk, mountpoint=mnt_path, mount_options='dax')
@@ -989,9 +1245,8 @@ class NdctlTest(Test):
         Test MAP_SYNC flag with sample mmap write
         """
         region = self.get_default_region()
-        self.plib.create_namespace(region=region, mode='fsdax')
-        self.disk = '/dev/%s' % self.plib.run_ndctl_list_val(
-            self.plib.run_ndctl_list("-N -r %s" % region)[0], 'blockdev')
+        ns_json = self.inv.ensure_namespace(region, mode='fsdax')
+        self.disk = '/dev/%s' % ns_json['blockdev']
         mnt_path = self.params.get('mnt_point', default='/pmem_map')
         self.part = partition.Partition(
             self.disk, mountpoint=mnt_path, mount_options='dax')
@@ -1015,27 +1270,87 @@ class NdctlTest(Test):
         Test device DAX with a daxio binary
         """
         region = self.get_default_region()
-        self.plib.create_namespace(region=region, mode='devdax', align=align)
-        daxdev = "/dev/%s" % self.plib.run_ndctl_list_val(
-            self.plib.run_ndctl_list("-N -r %s" % region)[0], 'chardev')
+        ns_json = self.inv.ensure_namespace(region, mode='devdax',
+                                            align=align)
+        daxdev = "/dev/%s" % ns_json['chardev']
         if process.system(
                 "%s -b no -i /dev/urandom -o %s"
                 % (self.get_data("daxio.static"), daxdev), ignore_status=True):
             self.fail("DAXIO write on devdax failed")
 
+    @avocado.fail_on(pmem.PMemException)
+    def test_perf_mode_align_matrix(self):
+        """
+        Measure bandwidth, IOPS and load/store latency of every namespace
+        mode and alignment, bound to the local and a remote NUMA node
+        """
+        for pkg in ['numactl', 'gcc']:
+            if not self.smm.check_installed(pkg) and not self.smm.install(pkg):
+                self.cancel('%s is needed for the test to be run' % pkg)
+        region = self.get_default_region()
+        fio = self.build_fio()
+        engines = process.system_output('%s --enghelp' % fio,
+                                        ignore_status=True).decode().split()
+        src_file = os.path.join(self.teststmpdir, 'pmem_latency.c')
+        shutil.copyfile(self.get_data('pmem_latency.c'), src_file)
+        probe = os.path.join(self.teststmpdir, 'pmem_latency')
+        process.system('gcc -O2 %s -o %s' % (src_file, probe))
+        mnt_path = self.params.get('mnt_point', default='/pmem')
+        region_aligns = self.get_region_alignments(region)
+        matrix = []
+        for mode in self.perf_modes:
+            aligns = ['']
+            if mode in ['fsdax', 'devdax']:
+                aligns = self.perf_aligns or region_aligns.get(mode) or ['']
+            for align in aligns:
+                try:
+                    ns_json = self.inv.ensure_namespace(
+                        region, mode=mode, size=self.perf_ns_size,
+                        align=align)
+                except pmem.PMemException:
+                    self.log.warn("Skipping %s namespace with align %s, "
+                                  "creation failed", mode, align)
+                    continue
+                ns_name = ns_json['dev']
+                target, engine = self.get_perf_target(mode, ns_json,
+                                                      mnt_path, engines)
+                for place, node in self.get_perf_nodes(ns_name).items():
+                    if node is None:
+                        continue
+                    row = {'mode': mode, 'align': align or 'default',
+                           'node': place, 'numa_node': node,
+                           'ioengine': engine}
+                    row.update(self.run_perf_fio(fio, target, engine, node))
+                    if mode in ['fsdax', 'devdax']:
+                        row.update(self.run_latency_probe(probe, target,
+                                                          node))
+                    self.log.info("%s", row)
+                    matrix.append(row)
+                if self.part:
+                    self.part.unmount()
+                    self.part = None
+                # the next entry may replace the namespace
+                self.disk = None
+        if not matrix:
+            self.cancel("No namespace could be created for the perf matrix")
+        with open(os.path.join(self.outputdir, 'pmem_perf_matrix.json'),
+                  'w') as matrix_file:
+            json.dump(matrix, matrix_file, indent=2)
+        self.whiteboard = json.dumps(matrix)
+
     @avocado.fail_on(pmem.PMemException)
     def test_namespace_1gb_alignment(self):
         """
         Test namespace with 1GB alignment
         """
         region = self.get_default_region()
-        self.plib.disable_namespace(region=region)
-        self.plib.destroy_namespace(region=region)
+        self.inv.disable_namespace(region=region)
+        self.inv.destroy_namespace(region=region)
         try:
-            self.plib.create_namespace(
+            self.inv.create_namespace(
                 region=region, size=self.size_1g_align, align='1073741824')
             self.check_namespace_align(region)
-            ns_json = self.plib.run_ndctl_list('-r %s -N' % region)[0]
+            ns_json = self.inv.namespaces(region)[0]
             created_align = self.plib.run_ndctl_list_val(ns_json, 'align')
             if created_align != 1073741824:
                 self.fail("Expected alignment 1073741824, Got %s" %
@@ -1046,24 +1361,24 @@ class NdctlTest(Test):
             self.fail("Namespace creation with 1GB alignment"
                       "must have failed!")
         ns_name = self.plib.run_ndctl_list_val(
-            self.plib.run_ndctl_list("-N -r %s" % region)[0], 'dev')
-        self.plib.disable_namespace(namespace=ns_name)
-        self.plib.destroy_namespace(region=region)
+            self.inv.namespaces(region)[0], 'dev')
+        self.inv.disable_namespace(namespace=ns_name)
+        self.inv.destroy_namespace(region=region)
 
     def test_namespace_1gb_alignment_enable_disable(self):
         """
         Test enabling and disabling a 1GB alignment namespace
         """
         region = self.get_default_region()
-        self.plib.disable_namespace(region=region)
-        self.plib.destroy_namespace(region=region)
+        self.inv.disable_namespace(region=region)
+        self.inv.destroy_namespace(region=region)
         try:
-            self.plib.create_namespace(
+            self.inv.create_namespace(
                 region=region, size=self.size_1g_align, align='1073741824')
-            ns_name = self.plib.run_ndctl_list_val(self.plib.run_ndctl_list(
-                '-r %s -N' % region)[0], 'dev')
-            self.plib.disable_namespace(namespace=ns_name, region=region)
-            self.plib.enable_namespace(namespace=ns_name, region=region)
+            ns_name = self.plib.run_ndctl_list_val(
+                self.inv.namespaces(region)[0], 'dev')
+            self.inv.disable_namespace(namespace=ns_name, region=region)
+            self.inv.enable_namespace(namespace=ns_name, region=region)
             self.check_namespace_align(region)
         except pmem.PMemException:
             self.fail("Namespace creation or enable/disable with"
@@ -1074,22 +1389,22 @@ class NdctlTest(Test):
         Test creating and destroying 1GB alignment namespaces in 2 modes
         """
         region = self.get_default_region()
-        self.plib.disable_namespace(region=region)
-        self.plib.destroy_namespace(region=region)
+        self.inv.disable_namespace(region=region)
+        self.inv.destroy_namespace(region=region)
         modes = ['fsdax', 'devdax']
         for mode in modes:
             try:
-                self.plib.create_namespace(region=region,
-                                           size=self.size_1g_align,
-                                           align='1073741824', mode=mode)
-                ns_name = self.plib.run_ndctl_list_val(self.plib.run_ndctl_list
-                                                       ('-r %s -N' % region)[0], 'dev')
+                self.inv.create_namespace(region=region,
+                                          size=self.size_1g_align,
+                                          align='1073741824', mode=mode)
+                ns_name = self.plib.run_ndctl_list_val(
+                    self.inv.namespaces(region)[0], 'dev')
                 self.log.info("Created namespace with mode %s and 1GB alignment:"
                               " %s", mode, ns_name)
             except pmem.PMemException:
                 self.fail("Namespace creation with mode %s and 1GB alignment"
                           " must have failed!" % mode)
-        process.system('ndctl destroy-namespace all -f')
+        self.inv.destroy_namespace(force=True)
 
     @avocado.fail_on(pmem.PMemException)
     def test_daxctl_1gb_alignment_memhotplug_unplug(self):
@@ -1135,15 +1450,15 @@ class NdctlTest(Test):
         Test to verify Device memory kernel mapping optimization feature.
         """
         region = self.get_default_region()
-        self.plib.disable_namespace(region=region)
-        self.plib.destroy_namespace(region=region)
+        self.inv.disable_namespace(region=region)
+        self.inv.destroy_namespace(region=region)
         process.run('echo \"file arch/powerpc/mm/book3s64/radix_pgtable.c +p\"'
                     ' > /sys/kernel/debug/dynamic_debug/control', sudo=True, shell=True)
         init_count = process.system_output('dmesg'
                                            ' | grep -Eai "Tail page reuse" | wc -l',
                                            shell=True)
         try:
-            self.plib.create_namespace(
+            self.inv.create_namespace(
                 region=region, size=self.size_1g_align, align='1073741824',
                 memmap='mem', mode='devdax')
             final_count = process.system_output('dmesg'
@@ -1185,7 +1500,9 @@ class NdctlTest(Test):
     def tearDown(self):
         if hasattr(self, 'part') and self.part:
             self.part.unmount()
-        if hasattr(self, 'disk') and self.disk:
+        # only a live pmem block device, never a file left in /dev
+        if getattr(self, 'disk', None) and os.path.exists(self.disk) and \
+                stat.S_ISBLK(os.stat(self.disk).st_mode):
             self.log.info("Removing the FS meta created on %s", self.disk)
             delete_fs = "dd if=/dev/zero bs=1M count=1024 of=%s" % self.disk
             if process.system(delete_fs, shell=True, ignore_status=True):
@@ -1193,6 +1510,6 @@ class NdctlTest(Test):
 
         if hasattr(self, 'preserve_setup') and not self.preserve_setup:
             if hasattr(self, 'plib'):
-                if self.plib.run_ndctl_list('-N'):
-                    self.plib.destroy_namespace(force=True)
+                if self.inv.namespaces():
+                    self.inv.destroy_namespace(force=True)
                 self.plib.disable_region()
@@ -0,0 +1,138 @@
+/*
+ * This program is free software; you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation; either version 2 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+ * See LICENSE for more details.
+ * Copyright: 2024 IBM
+ *
+ * Load/store latency probe on a mmap()ed DAX file or device DAX.
+ * Usage: pmem_latency <file> <size in MB> [iterations]
+ * Prints "load_ns <val>" from a dependent pointer chase over randomly
+ * ordered cache lines and "store_ns <val>" for a random store written
+ * back from the cache (clwb, or clflush without it, on x86_64, dcbst on
+ * ppc64) followed by a full memory barrier.
+ */
+
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <stdint.h>
+#include <string.h>
+#include <errno.h>
+#include <fcntl.h>
+#include <time.h>
+#include <unistd.h>
+#include <sys/mman.h>
+#ifdef __x86_64__
+#include <cpuid.h>
+#endif
+
+#define LINE_SIZE 64
+
+static int has_clwb;
+
+/* writes the cache line back towards the media, before the fence */
+static inline void flush_line(void *addr)
+{
+#if defined(__x86_64__)
+	if (has_clwb)	/* clwb, encoded for older assemblers */
+		asm volatile(".byte 0x66; xsaveopt %0"
+			     : "+m" (*(volatile char *)addr));
+	else
+		asm volatile("clflush %0" : "+m" (*(volatile char *)addr));
+#elif defined(__powerpc64__)
+	asm volatile("dcbst 0, %0" : : "r" (addr) : "memory");
+#else
+	(void)addr;
+#endif
+}
+
+static double elapsed_ns(struct timespec *start, struct timespec *end)
+{
+	return (end->tv_sec - start->tv_sec) * 1e9 +
+		(end->tv_nsec - start->tv_nsec);
+}
+
+int main(int argc, char *argv[])
+{
+	struct timespec start, end;
+	size_t size, lines, idx, tmp, *order;
+	long iters, cnt;
+	char *base, **ptr, *line;
+	int fd;
+#ifdef __x86_64__
+	unsigned int eax, ebx, ecx, edx;
+
+	if (__get_cpuid_count(7, 0, &eax, &ebx, &ecx, &edx))
+		has_clwb = !!(ebx & (1 << 24));
+#endif
+
+	if (argc < 3) {
+		printf("Usage: %s <file> <size in MB> [iterations]\n", argv[0]);
+		return 1;
+	}
+	size = strtoull(argv[2], NULL, 0) << 20;
+	iters = argc > 3 ? atol(argv[3]) : 1000000;
+	lines = size / LINE_SIZE;
+
+	fd = open(argv[1], O_RDWR);
+	if (fd < 0) {
+		printf("open %s failed with %s\n", argv[1], strerror(errno));
+		return 1;
+	}
+	base = mmap(NULL, size, PROT_READ | PROT_WRITE, MAP_SHARED, fd, 0);
+	if (base == MAP_FAILED) {
+		printf("mmap failed with %s\n", strerror(errno));
+		return 1;
+	}
+
+	/* Sattolo shuffle, a single cycle visiting every line once */
+	order = malloc(lines * sizeof(size_t));
+	if (!order) {
+		printf("malloc failed\n");
+		return 1;
+	}
+	for (idx = 0; idx < lines; idx++)
+		order[idx] = idx;
+	srandom(time(NULL));
+	for (idx = lines - 1; idx > 0; idx--) {
+		size_t swap = random() % idx;
+
+		tmp = order[idx];
+		order[idx] = order[swap];
+		order[swap] = tmp;
+	}
+	for (idx = 0; idx < lines; idx++)
+		*(char **)(base + order[idx] * LINE_SIZE) =
+			base + order[(idx + 1) % lines] * LINE_SIZE;
+
+	ptr = (char **)base;
+	clock_gettime(CLOCK_MONOTONIC, &start);
+	for (cnt = 0; cnt < iters; cnt++)
+		ptr = (char **)*ptr;
+	clock_gettime(CLOCK_MONOTONIC, &end);
+	printf("load_ns %.2f\n", elapsed_ns(&start, &end) / iters);
+
+	clock_gettime(CLOCK_MONOTONIC, &start);
+	for (cnt = 0; cnt < iters; cnt++) {
+		line = base + order[cnt % lines] * LINE_SIZE;
+		*(volatile uint64_t *)(line + sizeof(char *)) = cnt;
+		flush_line(line);
+		__sync_synchronize();
+	}
+	clock_gettime(CLOCK_MONOTONIC, &end);
+	printf("store_ns %.2f\n", elapsed_ns(&start, &end) / iters);
+
+	/* keeps the pointer chase from being optimized out */
+	if (ptr == NULL)
+		printf("broken chain\n");
+	free(order);
+	munmap(base, size);
+	close(fd);
+	return 0;
+}
@@ -13,11 +13,16 @@
 # Author: Santhosh G <santhog4@linux.vnet.ibm.com>
 
 import os
+import json
+import statistics
 from avocado import Test
+from avocado.utils import disk
 from avocado.utils import process
 from avocado.utils import build
 from avocado.utils import archive
 from avocado.utils.software_manager.manager import SoftwareManager
+from avocado.utils.partition import Partition
+from avocado.utils.partition import PartitionError
 from avocado.core import data_dir
 
 
@@ -47,24 +52,85 @@ class Blogbench(Test):
                     self.get_data(patch), shell=True)
         process.system('./configure')
         build.make(self.blogbench_dir, extra_args='install-strip')
+        # a new filesystem is created on disk, or on a loop device over
+        # a sparse image, for every run
+        self.part = self.loop_dev = None
+        device = self.params.get('disk', default=None)
+        if device:
+            device = disk.get_absolute_disk_path(device)
+        elif self.params.get('fresh_fs', default=True):
+            image = os.path.join(self.workdir, 'fs.img')
+            process.run('truncate -s %s %s'
+                        % (self.params.get('loop_size', default='4G'), image))
+            self.loop_dev = process.system_output(
+                'losetup -f --show %s' % image, sudo=True).decode().strip()
+            device = self.loop_dev
+        if device:
+            self.part = Partition(device, mountpoint=os.path.join(
+                self.workdir, 'mnt'))
+
+    @staticmethod
+    def parse_scores(output):
+        """
+        Returns the final write and read scores of blogbench output.
+        """
+        scores = {}
+        for line in output.splitlines():
+            if 'Final score for writes:' in line:
+                scores['write'] = float(line.split()[4])
+            if 'Final score for reads :' in line:
+                scores['read'] = float(line.split()[5])
+        return scores
 
     def test(self):
         test_dir = self.params.get('test_dir', default=data_dir.get_tmp_dir())
+        if self.part:
+            self.log.info("Running on %s, test_dir %s is not used",
+                          self.part.device, test_dir)
+            test_dir = self.part.mountpoint
+        iterations = self.params.get('iterations', default=3)
         # 4 Different types of threads can be specified as an args
         # These args are given higher value to stress the system more
         # Here, test is run with default args
         args = self.params.get('args', default='')
         args = ' -d %s %s ' % (test_dir, args)
-        process.system("blogbench " + args, shell=True, sudo=True)
-        report_path = os.path.join(self.logdir, 'stdout')
-        with open(report_path, 'r') as f:
-            file_buff = f.read().splitlines()
-            for line in file_buff:
-                if 'Final score for writes:' in line:
-                    write_score = line.split()[4]
-                if 'Final score for reads :' in line:
-                    read_score = line.split()[5]
-        self.log.info("The Benchmark Scores for Write and Read are : "
-                      "%s  and %s\n " % (write_score, read_score))
+        runs = []
+        for _ in range(iterations):
+            if self.part:
+                self.part.unmount(force=True)
+                self.part.mkfs(self.params.get('fs', default='ext4'))
+                try:
+                    self.part.mount()
+                except PartitionError:
+                    self.fail("Mounting %s failed" % self.part.device)
+            process.run('sync; echo 3 > /proc/sys/vm/drop_caches',
+                        shell=True, sudo=True)
+            result = process.run("blogbench " + args, shell=True, sudo=True)
+            scores = self.parse_scores(result.stdout_text)
+            if len(scores) != 2:
+                self.fail("Blogbench final scores not found")
+            self.log.info("The Benchmark Scores for Write and Read are : "
+                          "%s  and %s\n " % (scores['write'], scores['read']))
+            runs.append(scores)
+        stats = {}
+        for kind in ['write', 'read']:
+            samples = [run[kind] for run in runs]
+            mean = statistics.mean(samples)
+            stdev = statistics.stdev(samples) if len(samples) > 1 else 0.0
+            stats[kind] = {'mean': mean, 'stdev': stdev,
+                           'median': statistics.median(samples),
+                           'cv': stdev / mean if mean else 0.0}
+        self.whiteboard = json.dumps({'runs': runs, 'stats': stats})
         self.log.info("Please Check Logfile %s for more info of benchmark"
-                      % report_path)
+                      % os.path.join(self.logdir, 'stdout'))
+
+    def tearDown(self):
+        """
+        Unmounts the filesystem created for the runs and detaches the
+        loop device
+        """
+        if getattr(self, 'part', None):
+            self.part.unmount(force=True)
+        if getattr(self, 'loop_dev', None):
+            process.run('losetup -d %s' % self.loop_dev, sudo=True,
+                        ignore_status=True)
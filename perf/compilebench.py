@@ -20,10 +20,16 @@
 
 
 import os
+import re
+import json
+import statistics
 
 from avocado import Test
 from avocado.utils import archive
+from avocado.utils import disk
 from avocado.utils import process
+from avocado.utils.partition import Partition
+from avocado.utils.partition import PartitionError
 
 
 class Compilebench(Test):
@@ -49,16 +55,62 @@ class Compilebench(Test):
         compilebench_fix_patch = 'patch -p1 < %s' % self.get_data(
             'fix_compilebench')
         process.run(compilebench_fix_patch, shell=True)
+        # a new filesystem is created on disk, or on a loop device over
+        # a sparse image, for every run
+        self.part = self.loop_dev = None
+        device = self.params.get('disk', default=None)
+        if device:
+            device = disk.get_absolute_disk_path(device)
+        elif self.params.get('fresh_fs', default=True):
+            image = os.path.join(self.workdir, 'fs.img')
+            process.run('truncate -s %s %s'
+                        % (self.params.get('loop_size', default='20G'), image))
+            self.loop_dev = process.system_output(
+                'losetup -f --show %s' % image, sudo=True).decode().strip()
+            device = self.loop_dev
+        if device:
+            self.part = Partition(device, mountpoint=os.path.join(
+                self.workdir, 'mnt'))
+
+    @staticmethod
+    def parse_results(output):
+        """
+        Parses the compilebench output into the MB/s of every
+        intermediate operation per phase and the final per phase
+        averages (MB/s, or seconds for delete and stat).
+        """
+        phases = {}
+        summary = {}
+        for line in output.splitlines():
+            match = re.match(r'(.+?) total runs (\d+) avg ([\d.]+) '
+                             r'(MB/s|seconds)', line)
+            if match:
+                summary[match.group(1)] = {'runs': int(match.group(2)),
+                                           'value': float(match.group(3)),
+                                           'unit': match.group(4)}
+                continue
+            match = re.match(r'(\D+?) (?:kernel|native)-\d+.*?'
+                             r'([\d.]+) MB/s', line)
+            if match:
+                phases.setdefault(match.group(1), []).append(
+                    float(match.group(2)))
+        return phases, summary
 
     def test(self):
         """
-        Run 'compilebench' with its arguments
+        Run 'compilebench' with its arguments, iterations times with the
+        page cache dropped, each on a fresh filesystem unless fresh_fs is
+        False and no disk is given
         """
         initial_dirs = self.params.get('INITIAL_DIRS', default=10)
         runs = self.params.get('RUNS', default=30)
+        iterations = self.params.get('iterations', default=3)
+        workdir = self.sourcedir
+        if self.part:
+            workdir = self.part.mountpoint
 
         args = []
-        args.append('-D %s ' % self.sourcedir)
+        args.append('-D %s ' % workdir)
         args.append('-s %s ' % self.sourcedir)
         args.append('-i %d ' % initial_dirs)
         args.append('-r %d ' % runs)
@@ -66,4 +118,42 @@ class Compilebench(Test):
         # Using python explicitly due to the compilebench current
         # shebang set to python2.4
         cmd = ('python %s/compilebench %s' % (self.sourcedir, " ".join(args)))
-        process.run(cmd)
+        results = []
+        for _ in range(iterations):
+            if self.part:
+                self.part.unmount(force=True)
+                self.part.mkfs(self.params.get('fs', default='ext4'))
+                try:
+                    self.part.mount()
+                except PartitionError:
+                    self.fail("Mounting %s failed" % self.part.device)
+            process.run('sync; echo 3 > /proc/sys/vm/drop_caches',
+                        shell=True, sudo=True)
+            output = process.run(cmd, sudo=bool(self.part)).stdout_text
+            phases, summary = self.parse_results(output)
+            if not summary:
+                self.fail("No compilebench results found")
+            self.log.info("%s", summary)
+            results.append({'phases': phases, 'summary': summary})
+        stats = {}
+        for phase in results[0]['summary']:
+            values = [run['summary'][phase]['value'] for run in results
+                      if phase in run['summary']]
+            mean = statistics.mean(values)
+            stdev = statistics.stdev(values) if len(values) > 1 else 0.0
+            stats[phase] = {'mean': mean, 'stdev': stdev,
+                            'median': statistics.median(values),
+                            'cv': stdev / mean if mean else 0.0,
+                            'unit': results[0]['summary'][phase]['unit']}
+        self.whiteboard = json.dumps({'runs': results, 'stats': stats})
+
+    def tearDown(self):
+        """
+        Unmounts the filesystem created for the runs and detaches the
+        loop device
+        """
+        if getattr(self, 'part', None):
+            self.part.unmount(force=True)
+        if getattr(self, 'loop_dev', None):
+            process.run('losetup -d %s' % self.loop_dev, sudo=True,
+                        ignore_status=True)
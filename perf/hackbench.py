@@ -17,6 +17,8 @@
 #
 
 import os
+import json
+import statistics
 from datetime import datetime
 from avocado import Test
 from avocado.utils import process, archive, build
@@ -85,38 +87,27 @@ class Hackbench(Test):
         self.num_groups = self.params.get("num_groups", default="10")
         self.test_type = self.params.get("test_type", default="thread")
         self.loop = self.params.get("loops", default="100000")
+        self.max_iteration = self.params.get(
+            "max_iter", default=3 * int(self.workload_iteration))
+        self.target_cv = self.params.get("target_cv", default=0.05)
+        self.trim = self.params.get("trim", default=0.1)
 
-    def parse_hackbench_data(self, file_path):
+    @staticmethod
+    def parse_hackbench_data(output):
         """
-        Parse hackbench output data to extract performance metrics.
-
-        This function reads the benchmark output and computes the following:
-        - min: Minimum time taken to run hackbench across all iterations
-        - max: Maximum time taken to run hackbench across all iterations
-        - avg: Average time across all iterations
+        Parse hackbench output data and return the "Time:" values, in
+        seconds, it holds.
         """
         hackbench_times = []
-        with open(file_path, 'r') as f:
-            for line in f:
-                line = line.strip()
-                if line.startswith("Time:"):
-                    try:
-                        time_value = float(line.split("Time:")[1].strip())
-                        hackbench_times.append(time_value)
-                    except ValueError:
-                        continue  # Skip malformed lines
-        if not hackbench_times:
-            print("No time values found.")
-            return
-
-        min_time = min(hackbench_times)
-        max_time = max(hackbench_times)
-        avg_time = sum(hackbench_times) / len(hackbench_times)
-
-        self.log.info(f"Parsed {len(hackbench_times)} iterations.")
-        self.log.info(f"Min Time: {min_time:.3f} sec")
-        self.log.info(f"Max Time: {max_time:.3f} sec")
-        self.log.info(f"Avg Time: {avg_time:.3f} sec")
+        for line in output.splitlines():
+            line = line.strip()
+            if line.startswith("Time:"):
+                try:
+                    time_value = float(line.split("Time:")[1].strip())
+                    hackbench_times.append(time_value)
+                except ValueError:
+                    continue  # Skip malformed lines
+        return hackbench_times
 
     def test(self):
         """
@@ -133,6 +124,10 @@ class Hackbench(Test):
 
         Example:
         pipe=True num_groups=25, mode='thread', loops=100000)
+
+        It runs at least workload_iter iterations and keeps going until
+        the coefficient of variation of the times falls under target_cv
+        or max_iter iterations ran.
         """
         hack_bench = self.logdir + "/hackbench_logs"
         os.makedirs(hack_bench, exist_ok=True)
@@ -145,7 +140,8 @@ class Hackbench(Test):
             cmd = "./hackbench " + self.num_groups + " " + self.test_type + \
                 " " + self.loop
 
-        for ite in range(1, int(self.workload_iteration) + 1):
+        hackbench_times = []
+        for ite in range(1, int(self.max_iteration) + 1):
             self.log.info(f"Running hackbench iteration {ite}...")
 
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -167,4 +163,33 @@ class Hackbench(Test):
                     fd.write(info)
                     fd.write("\n")
 
-        self.parse_hackbench_data(payload_file)
+            hackbench_times.extend(self.parse_hackbench_data(res.stdout_text))
+            if ite >= int(self.workload_iteration) and \
+                    len(hackbench_times) > 1 and \
+                    statistics.stdev(hackbench_times) / statistics.mean(
+                        hackbench_times) <= self.target_cv:
+                break
+
+        if not hackbench_times:
+            self.fail("No time values found in hackbench output")
+        ordered = sorted(hackbench_times)
+        mean = statistics.mean(ordered)
+        stdev = statistics.stdev(ordered) if len(ordered) > 1 else 0.0
+        # mean without the trim fraction of lowest and highest times
+        cut = int(len(ordered) * self.trim)
+        stats = {'samples': hackbench_times, 'min': ordered[0],
+                 'max': ordered[-1], 'mean': mean, 'stdev': stdev,
+                 'median': statistics.median(ordered), 'cv': stdev / mean,
+                 'trimmed_mean': statistics.mean(
+                     ordered[cut:len(ordered) - cut] or ordered)}
+        self.log.info(f"Parsed {len(ordered)} iterations.")
+        self.log.info(f"Min Time: {stats['min']:.3f} sec")
+        self.log.info(f"Max Time: {stats['max']:.3f} sec")
+        self.log.info(f"Avg Time: {stats['mean']:.3f} sec")
+        self.log.info(f"Median Time: {stats['median']:.3f} sec, "
+                      f"CV: {stats['cv']:.3f}, "
+                      f"Trimmed mean: {stats['trimmed_mean']:.3f} sec")
+        if stats['cv'] > self.target_cv:
+            self.log.warn(f"CV {stats['cv']:.3f} still above {self.target_cv}"
+                          f" after {len(ordered)} iterations")
+        self.whiteboard = json.dumps({'time_sec': stats})
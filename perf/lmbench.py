@@ -19,14 +19,27 @@
 #   https://github.com/autotest/autotest-client-tests/tree/master/lmbench
 
 import os
+import re
+import glob
+import json
+import statistics
 import tempfile
 
 from avocado import Test
+from avocado.core import data_dir
 from avocado.utils import archive
+from avocado.utils import genio
 from avocado.utils import process
 from avocado.utils import build, distro
 from avocado.utils.software_manager.manager import SoftwareManager
 
+# summary lines of the raw results, "<name>: <value> <unit>"
+SCALARS = ['Simple syscall', 'Simple read', 'Simple write', 'Simple stat',
+           'Simple fstat', 'Simple open/close', 'Signal handler overhead',
+           'Protection fault', 'Pipe latency', 'AF_UNIX sock stream latency',
+           'Process fork+exit', 'Process fork+execve', 'Pipe bandwidth',
+           'AF_UNIX sock stream bandwidth', 'Socket bandwidth using localhost']
+
 
 class Lmbench(Test):
 
@@ -34,6 +47,9 @@ class Lmbench(Test):
     lmbench is a series of micro benchmarks intended to measure basic
     operating system and hardware system metrics. The benchmarks fall
     into three general classes: bandwidth, latency, and ``other''.
+    The results are parsed, the lat_mem_rd curve is split into cache
+    level latency plateaus and compared with the previous run on the
+    same processor revision.
     """
 
     def setUp(self):
@@ -45,6 +61,15 @@ class Lmbench(Test):
         fsdir = self.params.get('fsdir', default=None)
         temp_file = self.params.get('temp_file', default=None)
         memory_size_mb = self.params.get('MB', default=125)
+        self.stride = self.params.get('stride', default=128)
+        self.plateau_tolerance = self.params.get('plateau_tolerance',
+                                                 default=0.15)
+        self.plateau_points = self.params.get('plateau_points', default=3)
+        self.latency_tolerance = self.params.get('latency_tolerance',
+                                                 default=10)
+        self.boundary_tolerance = self.params.get('boundary_tolerance',
+                                                  default=50)
+        self.fail_on_shift = self.params.get('fail_on_shift', default=True)
         self.tmpdir = tempfile.mkdtemp(prefix='avocado_' + __name__)
         smm = SoftwareManager()
         detected_distro = distro.detect()
@@ -120,9 +145,184 @@ class Lmbench(Test):
             for line in cfg_file.readlines():
                 print(line)
 
+    @staticmethod
+    def parse_results(path):
+        """
+        Parses a raw lmbench results file into its summary scalars,
+        context switch, bandwidth and memory latency curves. Curves are
+        lists of [x, y] pairs keyed by their title.
+        """
+        results = {'scalars': {}, 'ctxsw': {}, 'bandwidth': {},
+                   'lat_mem_rd': {}, 'lat_mem_rd_random': {}}
+        curve = None
+        section = 'bandwidth'
+        for line in genio.read_all_lines(path):
+            line = line.strip()
+            if not line:
+                curve = None
+                continue
+            if line == 'Memory load latency':
+                section = 'lat_mem_rd'
+                continue
+            if line == 'Random load latency':
+                section = 'lat_mem_rd_random'
+                continue
+            match = re.match(r'(.+?):\s+([\d.]+)\s+(\S+)', line)
+            if match and match.group(1) in SCALARS:
+                results['scalars'][match.group(1)] = {
+                    'value': float(match.group(2)), 'unit': match.group(3)}
+                continue
+            if line.startswith('"'):
+                title = line.strip('"')
+                if title.startswith('size='):
+                    curve = results['ctxsw'].setdefault(title.split()[0], [])
+                elif title.startswith('stride='):
+                    curve = results[section].setdefault(
+                        int(title.split('=')[1]), [])
+                else:
+                    section = 'bandwidth'
+                    curve = results['bandwidth'].setdefault(title, [])
+                continue
+            values = line.split()
+            if curve is not None and len(values) == 2:
+                try:
+                    curve.append([float(values[0]), float(values[1])])
+                except ValueError:
+                    curve = None
+        return results
+
+    @staticmethod
+    def find_plateaus(points, tolerance, min_points):
+        """
+        Splits a lat_mem_rd curve of [size MB, latency ns] into latency
+        plateaus, a point more than tolerance above the running plateau
+        mean starts a new one. Plateaus shorter than min_points are the
+        transitions between cache levels and are dropped. Returns the
+        plateaus with their latency and the last size they cover.
+        """
+        groups = []
+        for size, lat in sorted(points):
+            if groups and lat <= statistics.mean(
+                    [val for _, val in groups[-1]]) * (1 + tolerance):
+                groups[-1].append((size, lat))
+            else:
+                groups.append([(size, lat)])
+        plateaus = [group for group in groups if len(group) >= min_points]
+        levels = []
+        for idx, group in enumerate(plateaus):
+            if idx == len(plateaus) - 1:
+                name = 'DRAM'
+            else:
+                name = 'L%s' % (idx + 1)
+            levels.append({'level': name,
+                           'latency_ns': round(statistics.median(
+                               [lat for _, lat in group]), 3),
+                           'boundary_mb': group[-1][0]})
+        return levels
+
+    @staticmethod
+    def cpu_revision():
+        """
+        Returns the processor model and revision, e.g. "POWER9 2.2".
+        """
+        cpu_model = revision = ''
+        for line in genio.read_all_lines('/proc/cpuinfo'):
+            key, _, value = line.partition(':')
+            key = key.strip()
+            if key in ['cpu', 'model name'] and not cpu_model:
+                cpu_model = value.split()[0] if key == 'cpu' else \
+                    value.strip()
+            elif key == 'revision' and not revision:
+                revision = value.split()[0]
+        return ('%s %s' % (cpu_model, revision)).strip()
+
+    def compare_revision(self, levels):
+        """
+        Compares the cache levels with the ones stored for the same
+        processor revision and returns the shifts found. The first run
+        of a revision stores its levels.
+        """
+        history_file = os.path.join(data_dir.get_data_dir(),
+                                    'lmbench_hierarchy.json')
+        history = {}
+        if os.path.exists(history_file):
+            with open(history_file) as hist:
+                history = json.load(hist)
+        revision = self.cpu_revision()
+        previous = history.get(revision)
+        if previous is None:
+            history[revision] = levels
+            os.makedirs(os.path.dirname(history_file), exist_ok=True)
+            with open(history_file, 'w') as hist:
+                json.dump(history, hist, indent=2)
+            return []
+        shifts = []
+        # extra plateaus are noise, every stored level is matched with
+        # the new plateau with the nearest boundary
+        caches = [lvl for lvl in levels if lvl['level'] != 'DRAM']
+        for old in previous:
+            if old['level'] == 'DRAM':
+                matches = [lvl for lvl in levels if lvl['level'] == 'DRAM']
+            else:
+                matches = sorted(caches, key=lambda lvl: abs(
+                    lvl['boundary_mb'] - old['boundary_mb']))
+            if not matches:
+                shifts.append("%s not found" % old['level'])
+                continue
+            new = matches[0]
+            change = 100.0 * (new['boundary_mb'] - old['boundary_mb']) / \
+                old['boundary_mb']
+            if old['level'] != 'DRAM' and \
+                    abs(change) > self.boundary_tolerance:
+                shifts.append("%s boundary %sMB, was %sMB"
+                              % (old['level'], new['boundary_mb'],
+                                 old['boundary_mb']))
+                continue
+            if new in caches:
+                caches.remove(new)
+            change = 100.0 * (new['latency_ns'] - old['latency_ns']) / \
+                old['latency_ns']
+            if abs(change) > self.latency_tolerance:
+                shifts.append("%s latency %sns, was %sns"
+                              % (old['level'], new['latency_ns'],
+                                 old['latency_ns']))
+        for extra in caches:
+            self.log.info("Plateau not in the stored hierarchy: %s", extra)
+        return shifts
+
     def test(self):
 
         os.chdir(self.sourcedir)
         build.make(self.sourcedir, extra_args='rerun')
         build.make(self.sourcedir, extra_args='rerun')
         build.make(self.sourcedir, extra_args='see')
+
+        raw_files = sorted(glob.glob(os.path.join(self.sourcedir, 'results',
+                                                  '*', '*.[0-9]*')),
+                           key=os.path.getmtime)
+        if not raw_files:
+            self.fail("No lmbench results found")
+        runs = [self.parse_results(raw) for raw in raw_files]
+        results = runs[-1]
+        for name in results['scalars']:
+            vals = [run['scalars'][name]['value'] for run in runs
+                    if name in run['scalars']]
+            results['scalars'][name]['value'] = statistics.mean(vals)
+        curve = results['lat_mem_rd'].get(self.stride)
+        if not curve:
+            self.fail("No lat_mem_rd curve for stride %s, found %s"
+                      % (self.stride, list(results['lat_mem_rd'])))
+        levels = self.find_plateaus(curve, self.plateau_tolerance,
+                                    self.plateau_points)
+        for level in levels:
+            self.log.info("%s", level)
+        shifts = self.compare_revision(levels)
+        results['hierarchy'] = levels
+        results['revision'] = self.cpu_revision()
+        results['shifts'] = shifts
+        self.whiteboard = json.dumps(results)
+        for shift in shifts:
+            self.log.warn("Memory hierarchy shift: %s", shift)
+        if shifts and self.fail_on_shift:
+            self.fail("Memory hierarchy shifted on %s: %s"
+                      % (results['revision'], shifts))
@@ -14,16 +14,39 @@
 # Copyright: 2019 IBM
 # Author: Nageswara R Sastry <rnsastry@linux.vnet.ibm.com>
 
+import os
+import re
+import json
 import platform
+import statistics
 from avocado import Test
+from avocado.core import data_dir
 from avocado.utils import distro, process, dmesg
 from avocado.utils.software_manager.manager import SoftwareManager
 
+# benchmarks supporting --format=simple, which prints only the result
+SIMPLE_FORMAT = {'sched messaging': 'total_sec', 'sched pipe': 'total_sec',
+                 'syscall basic': 'total_sec', 'mem memcpy': 'bytes_per_sec',
+                 'mem memset': 'bytes_per_sec'}
+
+# metrics of the default output format, "per_sec" ones are higher-better
+PATTERNS = [('total_sec', r'Total time:\s*([\d.]+)\s*\[sec\]'),
+            ('usecs_per_op', r'([\d.]+)\s+usecs/op'),
+            ('ops_per_sec', r'([\d,]+)\s+ops/sec'),
+            ('ops_per_sec', r'Averaged\s+([\d,]+)\s+operations/sec'),
+            ('stddev_pct', r'operations/sec\s+\(\+-\s*([\d.]+)%\)'),
+            ('gb_per_sec', r'([\d.]+)\s+GB/sec'),
+            ('mb_per_sec', r'([\d.]+)\s+MB/sec'),
+            ('cycles_per_byte', r'([\d.]+)\s+cycles/Byte'),
+            ('wake_ms', r'Wokeup.*in\s+([\d.]+)\s+ms'),
+            ('requeue_ms', r'Requeued.*in\s+([\d.]+)\s+ms')]
+
 
 class perf_bench(Test):
 
     """
-    Tests perf bench and it's options
+    Tests perf bench and it's options, the results of iterations runs
+    are parsed into metrics and compared against a per host baseline
     :avocado: tags=perf,bench
     """
 
@@ -53,16 +76,28 @@ class perf_bench(Test):
         # Getting the parameters from yaml file
         self.optname = self.params.get('name', default='all')
         self.option = self.params.get('option', default='')
+        self.iterations = self.params.get('iterations', default=1)
+        self.warmup = self.params.get('warmup', default=0)
+        self.pin_cpus = self.params.get('pin_cpus', default='')
+        self.tolerance = self.params.get('regression_tolerance', default=5)
+        self.fail_on_regression = self.params.get('fail_on_regression',
+                                                  default=False)
+        self.update_baseline = self.params.get('update_baseline',
+                                               default=False)
+        self.baseline_file = self.params.get(
+            'baseline_file', default=os.path.join(
+                data_dir.get_data_dir(),
+                'perf_bench_baseline_%s.json' % platform.node()))
 
         # Clear the dmesg, by that we can capture the delta at the end of the test.
         dmesg.clear_dmesg()
 
     def verify_dmesg(self):
-        self.whiteboard = process.system_output("dmesg").decode("utf-8")
+        output = process.system_output("dmesg").decode("utf-8")
         pattern = ['WARNING: CPU:', 'Oops',
                    'Segfault', 'soft lockup', 'Unable to handle']
         for fail_pattern in pattern:
-            if fail_pattern in self.whiteboard:
+            if fail_pattern in output:
                 self.fail("Test Failed : %s in dmesg" % fail_pattern)
 
     def run_cmd(self, cmd):
@@ -74,9 +109,114 @@ class perf_bench(Test):
         output = op.stdout.decode() + op.stderr.decode()
         if err_ln in output:
             self.fail("command %s failed with assertion code" % cmd)
+        return op.stdout.decode()
+
+    @staticmethod
+    def parse_simple(output, metric):
+        """
+        Parses --format=simple output, one number per line, numbered
+        when a benchmark prints several (e.g. memcpy functions).
+        """
+        values = [float(val) for val in
+                  re.findall(r'^\s*([\d.]+)\s*$', output, re.M)]
+        if len(values) == 1:
+            return {metric: values[0]}
+        return {'%s_%s' % (metric, idx): val
+                for idx, val in enumerate(values)}
+
+    @staticmethod
+    def parse_default(output):
+        """
+        Parses the default perf bench output, metrics are prefixed with
+        the benchmark and memory function they belong to when given.
+        """
+        metrics = {}
+        prefix = ''
+        for line in output.splitlines():
+            match = re.match(r"#\s*Running\s+'?(\S+?)'?\s+benchmark", line)
+            if match:
+                prefix = match.group(1).replace('/', '_') + '.'
+                continue
+            match = re.match(r"#\s*function\s+'(\S+)'", line)
+            if match:
+                prefix = prefix.split('.')[0] + '.%s.' % match.group(1)
+                continue
+            for name, regex in PATTERNS:
+                match = re.search(regex, line)
+                if match:
+                    metrics[(prefix + name).lstrip('.')] = float(
+                        match.group(1).replace(',', ''))
+        return metrics
+
+    def run_bench(self):
+        """
+        Runs the benchmark once, with --format=simple when supported, and
+        returns its metrics.
+        """
+        key = '%s %s' % (self.optname, self.option)
+        bench_fmt = '--format=simple ' if key in SIMPLE_FORMAT else ''
+        bench_cmd = "perf bench %s%s %s" % (bench_fmt, self.optname,
+                                            self.option)
+        if self.pin_cpus:
+            bench_cmd = "taskset -c %s %s" % (self.pin_cpus, bench_cmd)
+        output = self.run_cmd(bench_cmd)
+        if bench_fmt:
+            return self.parse_simple(output, SIMPLE_FORMAT[key])
+        return self.parse_default(output)
+
+    def compare_baseline(self, summary):
+        """
+        Compares the mean of each metric with the per host baseline and
+        returns the metrics worse by more than regression_tolerance %.
+        Stores the summary as baseline when there is none yet or when
+        update_baseline is set.
+        """
+        baseline = {}
+        if os.path.exists(self.baseline_file):
+            with open(self.baseline_file) as base_file:
+                baseline = json.load(base_file)
+        key = '%s %s' % (self.optname, self.option)
+        regressions = {}
+        for metric, stats in summary.items():
+            base = baseline.get(key, {}).get(metric)
+            if not base or metric.endswith('_pct'):
+                continue
+            change = 100.0 * (stats['mean'] - base) / base
+            if 'per_sec' not in metric:
+                change = -change
+            stats['vs_baseline_pct'] = round(change, 2)
+            if change < -self.tolerance:
+                regressions[metric] = stats['vs_baseline_pct']
+        if key not in baseline or self.update_baseline:
+            baseline[key] = {metric: stats['mean']
+                             for metric, stats in summary.items()}
+            os.makedirs(os.path.dirname(self.baseline_file), exist_ok=True)
+            with open(self.baseline_file, 'w') as base_file:
+                json.dump(baseline, base_file, indent=2)
+        return regressions
 
     def test_bench(self):
-        # perf bench command
-        bench_cmd = "perf bench %s %s" % (self.optname, self.option)
-        self.run_cmd(bench_cmd)
+        # perf bench command, warm-up runs are not accounted
+        for _ in range(self.warmup):
+            self.run_bench()
+        samples = {}
+        for _ in range(self.iterations):
+            for metric, val in self.run_bench().items():
+                samples.setdefault(metric, []).append(val)
+        summary = {}
+        for metric, vals in samples.items():
+            summary[metric] = {'mean': statistics.mean(vals),
+                               'min': min(vals), 'max': max(vals),
+                               'stdev': statistics.stdev(vals)
+                               if len(vals) > 1 else 0.0,
+                               'samples': vals}
+        regressions = self.compare_baseline(summary)
+        self.whiteboard = json.dumps({'benchmark': '%s %s' % (
+            self.optname, self.option), 'metrics': summary,
+            'regressions': regressions})
         self.verify_dmesg()
+        for metric, change in regressions.items():
+            self.log.warn("%s regressed by %s%% against the baseline",
+                          metric, -change)
+        if regressions and self.fail_on_regression:
+            self.fail("Regressions against the baseline: %s" % regressions)
@@ -15,9 +15,11 @@
 # Author: Nageswara R Sastry <rnsastry@linux.vnet.ibm.com>
 
 import os
+import re
+import json
 import platform
 from avocado import Test
-from avocado.utils import distro, process, dmesg
+from avocado.utils import cpu, distro, process, dmesg
 from avocado.utils.software_manager.manager import SoftwareManager
 
 
@@ -109,6 +111,69 @@ class perf_c2c(Test):
         dmesg.collect_errors_dmesg(['WARNING: CPU:', 'Oops', 'Segfault',
                                     'soft lockup', 'Unable to handle'])
 
+    @staticmethod
+    def parse_cacheline_table(output):
+        """
+        Parses the "Shared Data Cache Line Table" of perf c2c report
+        --stdio into rows of index, cache line address and the remaining
+        columns, in report order (hottest first).
+        """
+        rows = []
+        in_table = False
+        for line in output.splitlines():
+            if 'Shared Data Cache Line Table' in line:
+                in_table = True
+                continue
+            if in_table and 'Pareto' in line:
+                break
+            match = re.match(r'\s*(\d+)\s+(0x[0-9a-fA-F]+)\s+(.*)$', line)
+            if in_table and match:
+                rows.append({'index': int(match.group(1)),
+                             'address': match.group(2),
+                             'columns': match.group(3).split()})
+        return rows
+
+    def test_false_sharing(self):
+        """
+        Records the bundled false sharing microkernel and checks that
+        its cache line is among the hottest lines perf c2c reports.
+        """
+        seconds = self.params.get('seconds', default=5)
+        top_lines = self.params.get('top_lines', default=3)
+        display = self.params.get('display', default='')
+        cpus = cpu.cpu_online_list()
+        cpu_a = self.params.get('cpu_a', default=cpus[0])
+        cpu_b = self.params.get('cpu_b', default=cpus[-1])
+        binary = os.path.join(self.workdir, 'false_sharing')
+        process.run('gcc -O2 -pthread %s -o %s'
+                    % (self.get_data('false_sharing.c'), binary))
+        output_file = os.path.join(self.workdir, 'perf.data')
+        result = process.run('perf c2c record -o %s -- %s %s %s %s'
+                             % (output_file, binary, seconds, cpu_a, cpu_b),
+                             sudo=True)
+        hot_line = re.search(r'hot_line\s+(0x[0-9a-fA-F]+)',
+                             result.stdout_text)
+        if not hot_line:
+            self.fail("false_sharing did not report its cache line")
+        report = process.run('perf c2c report -i %s --stdio %s'
+                             % (output_file, '-d %s' % display
+                                if display else ''), sudo=True)
+        rows = self.parse_cacheline_table(report.stdout_text)
+        self.whiteboard = json.dumps({'hot_line': hot_line.group(1),
+                                      'cachelines': rows})
+        if not rows:
+            self.fail("perf c2c reported no shared cache line")
+        hot = int(hot_line.group(1), 16)
+        # the counters sit at the start of a 256 bytes aligned line
+        ranks = [row['index'] for row in rows
+                 if int(row['address'], 16) == hot]
+        if not ranks or ranks[0] >= top_lines:
+            self.fail("false shared line %s not among the %s hottest: %s"
+                      % (hot_line.group(1), top_lines,
+                         [row['address'] for row in rows[:top_lines]]))
+        self.log.info("False shared line %s detected at index %s",
+                      hot_line.group(1), ranks[0])
+
     def tearDown(self):
         # Delete the temporary file
         if os.path.isfile("perf.data"):
@@ -0,0 +1,78 @@
+/*
+ * This program is free software; you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation; either version 2 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+ * See LICENSE for more details.
+ * Copyright: 2024 IBM
+ *
+ * False sharing microkernel for perf c2c.
+ * Usage: false_sharing <seconds> <cpu> <cpu>
+ * Two threads pinned on the given CPUs keep incrementing two different
+ * counters of the same cache line. Prints "hot_line <address>" with the
+ * address of that cache line.
+ */
+
+#define _GNU_SOURCE
+#include <stdio.h>
+#include <stdlib.h>
+#include <stdint.h>
+#include <pthread.h>
+#include <sched.h>
+#include <unistd.h>
+
+static struct {
+	volatile long a;
+	volatile long b;
+} shared __attribute__((aligned(256)));
+
+static volatile int stop;
+
+struct worker {
+	int cpu;
+	volatile long *counter;
+};
+
+static void *run(void *arg)
+{
+	struct worker *wrk = arg;
+	cpu_set_t set;
+
+	CPU_ZERO(&set);
+	CPU_SET(wrk->cpu, &set);
+	if (pthread_setaffinity_np(pthread_self(), sizeof(set), &set))
+		printf("cannot pin on cpu %d\n", wrk->cpu);
+	while (!stop)
+		(*wrk->counter)++;
+	return NULL;
+}
+
+int main(int argc, char *argv[])
+{
+	struct worker wrk[2];
+	pthread_t thr[2];
+	int idx;
+
+	if (argc < 4) {
+		printf("Usage: %s <seconds> <cpu> <cpu>\n", argv[0]);
+		return 1;
+	}
+	printf("hot_line %p\n", (void *)&shared);
+	fflush(stdout);
+	wrk[0].cpu = atoi(argv[2]);
+	wrk[0].counter = &shared.a;
+	wrk[1].cpu = atoi(argv[3]);
+	wrk[1].counter = &shared.b;
+	for (idx = 0; idx < 2; idx++)
+		pthread_create(&thr[idx], NULL, run, &wrk[idx]);
+	sleep(atoi(argv[1]));
+	stop = 1;
+	for (idx = 0; idx < 2; idx++)
+		pthread_join(thr[idx], NULL);
+	printf("increments %ld %ld\n", shared.a, shared.b);
+	return 0;
+}
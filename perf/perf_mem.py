@@ -15,8 +15,11 @@
 # Author: Shaik Abdulla <abdulla1@linux.vnet.ibm.com>
 
 import os
+import re
+import glob
+import json
 from avocado import Test
-from avocado.utils import distro, process, dmesg
+from avocado.utils import cpu, distro, genio, process, dmesg
 from avocado.utils.software_manager.manager import SoftwareManager
 
 
@@ -103,6 +106,97 @@ class perf_mem(Test):
         dmesg.collect_errors_dmesg(['WARNING: CPU:', 'Oops', 'Segfault',
                                     'soft lockup', 'Unable to handle'])
 
+    @staticmethod
+    def parse_mem_levels(output):
+        """
+        Parses perf mem report --stdio --sort=mem into the share of the
+        samples per memory access level.
+        """
+        levels = {}
+        for line in output.splitlines():
+            match = re.match(r'\s*([\d.]+)%\s+(?:\d+\s+)?(\S.*?)\s*$', line)
+            if match and not line.lstrip().startswith('#'):
+                levels[match.group(2)] = levels.get(match.group(2), 0) + \
+                    float(match.group(1))
+        return levels
+
+    @staticmethod
+    def parse_latency_buckets(output):
+        """
+        Parses perf mem report -D -x , raw samples into power of two
+        buckets of the load weight (latency).
+        """
+        buckets = {}
+        weight_idx = None
+        for line in output.splitlines():
+            fields = [field.strip() for field in line.lstrip('#').split(',')]
+            if line.startswith('#'):
+                for idx, field in enumerate(fields):
+                    if field in ['LOCAL WEIGHT', 'WEIGHT']:
+                        weight_idx = idx
+                        break
+                continue
+            if weight_idx is None or len(fields) <= weight_idx:
+                continue
+            try:
+                weight = int(fields[weight_idx], 0)
+            except ValueError:
+                continue
+            bucket = 1 << max(weight - 1, 0).bit_length() if weight else 0
+            buckets[bucket] = buckets.get(bucket, 0) + 1
+        return dict(sorted(buckets.items()))
+
+    def test_remote_access(self):
+        """
+        Records the bundled pointer chase microkernel running on one node
+        with its memory bound to another one, and checks that perf mem
+        attributes the loads to remote memory.
+        """
+        size_mb = self.params.get('size_mb', default=1024)
+        seconds = self.params.get('seconds', default=5)
+        min_remote = self.params.get('min_remote_pct', default=20)
+        if process.system('numactl --show', ignore_status=True):
+            self.cancel("numactl is needed for this test")
+        cpu_nodes = cpu.numa_nodes_with_assigned_cpus()
+        mem_nodes = []
+        for path in sorted(glob.glob('/sys/devices/system/node/node*/'
+                                     'meminfo')):
+            for line in genio.read_all_lines(path):
+                if 'MemTotal' in line and int(line.split()[-2]):
+                    mem_nodes.append(int(path.split('/node')[-1].split(
+                        '/')[0]))
+        local_node = min(cpu_nodes) if cpu_nodes else None
+        remote = [node for node in mem_nodes if node != local_node]
+        if local_node is None or not remote:
+            self.cancel("Test needs a CPU node and another memory node")
+        remote_node = remote[0]
+        binary = os.path.join(self.workdir, 'mem_chase')
+        process.run('gcc -O2 %s -o %s'
+                    % (self.get_data('mem_chase.c'), binary))
+        output_file = os.path.join(self.workdir, 'perf.data')
+        self.run_cmd('perf mem record -o %s -- numactl --cpunodebind=%s '
+                     '--membind=%s %s %s %s' % (output_file, local_node,
+                                                remote_node, binary, size_mb,
+                                                seconds))
+        levels = self.parse_mem_levels(process.run(
+            'perf mem report -i %s --stdio --sort=mem' % output_file,
+            sudo=True).stdout_text)
+        buckets = self.parse_latency_buckets(process.run(
+            'perf mem report -i %s -D -x ,' % output_file,
+            sudo=True).stdout_text)
+        remote_pct = sum(pct for level, pct in levels.items()
+                         if 'remote' in level.lower())
+        self.whiteboard = json.dumps({'local_node': local_node,
+                                      'remote_node': remote_node,
+                                      'levels': levels,
+                                      'remote_pct': remote_pct,
+                                      'latency_buckets': buckets})
+        self.log.info("Memory levels %s, latency buckets %s", levels,
+                      buckets)
+        if remote_pct < min_remote:
+            self.fail("Only %s%% of the loads attributed to remote memory, "
+                      "expected at least %s%%" % (remote_pct, min_remote))
+
     def tearDown(self):
         # Delete the temporary file
         if os.path.isfile("perf.data"):
@@ -0,0 +1,73 @@
+/*
+ * This program is free software; you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation; either version 2 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+ * See LICENSE for more details.
+ * Copyright: 2024 IBM
+ *
+ * Memory load microkernel for perf mem.
+ * Usage: mem_chase <size in MB> <seconds>
+ * Runs a dependent pointer chase over randomly ordered cache lines of a
+ * buffer larger than the caches, run it under numactl --membind to make
+ * the loads hit a remote node.
+ */
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <time.h>
+
+#define LINE_SIZE 128
+
+int main(int argc, char *argv[])
+{
+	size_t size, lines, idx, tmp, *order;
+	time_t end;
+	long loads = 0;
+	char *base, **ptr;
+	int cnt;
+
+	if (argc < 3) {
+		printf("Usage: %s <size in MB> <seconds>\n", argv[0]);
+		return 1;
+	}
+	size = strtoull(argv[1], NULL, 0) << 20;
+	lines = size / LINE_SIZE;
+	base = malloc(size);
+	order = malloc(lines * sizeof(size_t));
+	if (!base || !order) {
+		printf("malloc failed\n");
+		return 1;
+	}
+
+	/* Sattolo shuffle, a single cycle visiting every line once */
+	for (idx = 0; idx < lines; idx++)
+		order[idx] = idx;
+	srandom(time(NULL));
+	for (idx = lines - 1; idx > 0; idx--) {
+		size_t swap = random() % idx;
+
+		tmp = order[idx];
+		order[idx] = order[swap];
+		order[swap] = tmp;
+	}
+	for (idx = 0; idx < lines; idx++)
+		*(char **)(base + order[idx] * LINE_SIZE) =
+			base + order[(idx + 1) % lines] * LINE_SIZE;
+	free(order);
+
+	ptr = (char **)base;
+	end = time(NULL) + atoi(argv[2]);
+	while (time(NULL) < end) {
+		for (cnt = 0; cnt < 1000000; cnt++)
+			ptr = (char **)*ptr;
+		loads += cnt;
+	}
+	printf("loads %ld last %p\n", loads, (void *)ptr);
+	free(base);
+	return 0;
+}
@@ -14,6 +14,8 @@
 # Copyright: 2021 IBM
 # Author: Nageswara R Sastry <rnsastry@linux.ibm.com>
 
+import re
+import json
 import platform
 from avocado import Test
 from avocado.utils import distro, dmesg, genio, process, cpu
@@ -71,41 +73,139 @@ class perf_metric(Test):
         self._create_all_metric_events('metricgroup')
         if not self.list_of_metric_events:
             self.cancel("perf tool Metric events not found.")
+        self.batch_size = self.params.get('batch_size', default=16)
+        self.json_opt = ''
+        if not process.system('perf stat -j true', ignore_status=True,
+                              shell=True):
+            self.json_opt = '-j'
+        self.results = {}
 
         # Clear the dmesg to capture the delta at the end of the test.
         dmesg.clear_dmesg()
 
-    def _run_cmd(self, option):
-        for line in self.list_of_metric_events:
-            cmd = "perf stat %s %s -C 0 sleep 1" % (option, line)
-            op = process.run(cmd, ignore_status=True, shell=True, verbose=True)
-            output = (op.stdout + op.stderr).decode()
-            # When the command failed, checking for expected failure or not.
-            if op.exit_status:
-                found_imc = False
-                found_hv_24_7 = False
-                for ln in output.splitlines():
-                    if "hv_24x7" in ln:
-                        found_hv_24_7 = True
-                        break
-                    if "imc" in ln:
-                        found_imc = True
-                        break
-                # IMC errors in PowerVM - Expected
-                # hv_24x7 errors in PowerNV - Expected
-                # IMC failed in PowerNV environment - Fail
-                # HV_24X7 failed in PowerVM environment - Fail
-                if (found_imc and not IS_POWER_NV) or\
-                   (found_hv_24_7 and IS_POWER_NV):
-                    self.log.info("%s failed, due to non supporting"
-                                  " environment" % cmd)
-                else:
-                    self.fail_cmd.append(cmd)
-            if ("not counted" in output) or ("not supported" in output):
+    def _metric_batches(self):
+        """
+        Groups the metrics by their first metric group, as listed by
+        "perf list -j metric", in batches of at most batch_size.
+        Metric groups and metrics perf does not list in json go in
+        batch_size chunks.
+        """
+        groups = {}
+        output = process.system_output('perf list -j metric', shell=True,
+                                       ignore_status=True).decode()
+        try:
+            for entry in json.loads(output):
+                name = entry.get('MetricName')
+                if name in self.list_of_metric_events:
+                    group = (entry.get('MetricGroup') or '').split(';')[0]
+                    groups.setdefault(group, []).append(name)
+        except ValueError:
+            groups = {}
+        grouped = set(name for names in groups.values() for name in names)
+        groups[None] = [name for name in self.list_of_metric_events
+                        if name not in grouped]
+        batches = []
+        for names in groups.values():
+            for idx in range(0, len(names), self.batch_size):
+                batches.append(names[idx:idx + self.batch_size])
+        return batches
+
+    def _counted_metrics(self, output, batch):
+        """
+        Returns the metrics of the batch having a value in the perf stat
+        json output.
+        """
+        counted = set()
+        for line in output.splitlines():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if 'metric-value' in record:
+                record = {record.get('metric-unit', ''):
+                          record['metric-value']}
+            for unit, value in record.items():
+                try:
+                    float(value)
+                except (TypeError, ValueError):
+                    continue
+                counted.update(name for name in batch if re.search(
+                    r'\b%s\b' % re.escape(name), unit))
+        return counted
+
+    def _check_metric(self, option, metric):
+        """
+        Runs a single metric and records its pass/fail status.
+        """
+        cmd = "perf stat %s %s -C 0 sleep 1" % (option, metric)
+        op = process.run(cmd, ignore_status=True, shell=True, verbose=True)
+        output = (op.stdout + op.stderr).decode()
+        self.results[metric] = 'pass'
+        # When the command failed, checking for expected failure or not.
+        if op.exit_status:
+            found_imc = False
+            found_hv_24_7 = False
+            for ln in output.splitlines():
+                if "hv_24x7" in ln:
+                    found_hv_24_7 = True
+                    break
+                if "imc" in ln:
+                    found_imc = True
+                    break
+            # IMC errors in PowerVM - Expected
+            # hv_24x7 errors in PowerNV - Expected
+            # IMC failed in PowerNV environment - Fail
+            # HV_24X7 failed in PowerVM environment - Fail
+            if (found_imc and not IS_POWER_NV) or\
+               (found_hv_24_7 and IS_POWER_NV):
+                self.log.info("%s failed, due to non supporting"
+                              " environment" % cmd)
+                self.results[metric] = 'expected-fail'
+            else:
                 self.fail_cmd.append(cmd)
-            if "operations is limited" in output:
-                self.cancel("Please enable lpar to allow collecting the"
-                            " hv_24x7 counters info")
+                self.results[metric] = 'fail'
+        if ("not counted" in output) or ("not supported" in output):
+            self.fail_cmd.append(cmd)
+            self.results[metric] = 'fail'
+        if "operations is limited" in output:
+            self.cancel("Please enable lpar to allow collecting the"
+                        " hv_24x7 counters info")
+
+    def _check_batch(self, option, batch):
+        """
+        Runs the batch of metrics in one perf stat, the metrics without
+        a value when the run is not clean are bisected down to the
+        failing ones.
+        """
+        if len(batch) == 1:
+            self._check_metric(option, batch[0])
+            return
+        cmd = "perf stat %s %s %s -C 0 sleep 1" % (self.json_opt, option,
+                                                   ','.join(batch))
+        op = process.run(cmd, ignore_status=True, shell=True, verbose=True)
+        output = (op.stdout + op.stderr).decode()
+        if "operations is limited" in output:
+            self.cancel("Please enable lpar to allow collecting the"
+                        " hv_24x7 counters info")
+        if not op.exit_status and "not counted" not in output and \
+                "not supported" not in output:
+            self.results.update((metric, 'pass') for metric in batch)
+            return
+        counted = self._counted_metrics(output, batch) \
+            if self.json_opt else set()
+        self.results.update((metric, 'pass') for metric in counted)
+        failed = [metric for metric in batch if metric not in counted]
+        if len(failed) == len(batch):
+            half = len(failed) // 2
+            self._check_batch(option, failed[:half])
+            self._check_batch(option, failed[half:])
+        elif failed:
+            self._check_batch(option, failed)
+
+    def _run_cmd(self, option):
+        for batch in self._metric_batches():
+            self._check_batch(option, batch)
+        self.whiteboard = json.dumps(self.results)
         if self.fail_cmd:
             self.fail("perf_metric: commands failed are %s" % self.fail_cmd)
 
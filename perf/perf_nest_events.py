@@ -14,6 +14,7 @@
 # Copyright: 2019 IBM
 # Author: Nageswara R Sastry <rnsastry@linux.vnet.ibm.com>
 
+import json
 import platform
 from avocado import Test
 from avocado.utils import cpu, distro, genio, process
@@ -71,6 +72,11 @@ class nestEvents(Test):
             if 'pm_nest' in line:
                 continue
             self.list_of_nest_events.append(line)
+        self.json_opt = ''
+        if not process.system('perf stat -j true', ignore_status=True,
+                              shell=True):
+            self.json_opt = '-j'
+        self.results = {}
 
         # Clear the dmesg, by that we can capture the delta at the end of the
         # test.
@@ -82,17 +88,53 @@ class nestEvents(Test):
                 self.log.info("Failed command: %s" % self.fail_cmd[cmd])
             self.fail("perf_raw_events: some of the events failed, refer to log")
 
-    def run_cmd(self, cmd):
-        if process.system(cmd, shell=True, ignore_status=True):
+    def counted_events(self, output):
+        """
+        Returns the events having a counter value on any CPU in the
+        perf stat json output.
+        """
+        counted = set()
+        for line in output.splitlines():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get('counter-value', '').replace('.', '').isdigit():
+                counted.add(record.get('event', '').strip('/'))
+        return counted
+
+    def check_batch(self, events):
+        """
+        Runs the events in one perf stat, a failed run is bisected down
+        to the failing events.
+        """
+        perf_stat = "perf stat %s -e" % self.json_opt
+        perf_flags = '-a -A sleep 1'
+        cmd = "%s %s %s" % (perf_stat, ','.join(events), perf_flags)
+        result = process.run(cmd, shell=True, ignore_status=True)
+        if not result.exit_status:
+            counted = self.counted_events(result.stderr_text)
+            for event in events:
+                self.results[event] = 'counted' if \
+                    event.strip('/') in counted or \
+                    not self.json_opt else 'not counted'
+            return
+        if len(events) == 1:
             self.fail_cmd.append(cmd)
+            self.results[events[0]] = 'fail'
+            return
+        half = len(events) // 2
+        self.check_batch(events[:half])
+        self.check_batch(events[half:])
 
     def test_nest_events(self):
-        perf_stat = "perf stat -e"
-        perf_flags = '-a -A sleep 1'
-
+        # one perf stat per PMU unit, e.g. nest_mcs01
+        units = {}
         for line in self.list_of_nest_events:
-            cmd = "%s %s %s" % (perf_stat, line, perf_flags)
-            self.run_cmd(cmd)
+            units.setdefault(line.split('/')[0], []).append(line)
+        for events in units.values():
+            self.check_batch(events)
+        self.whiteboard = json.dumps(self.results)
 
         self.error_check()
 
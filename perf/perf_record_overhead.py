@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+# See LICENSE for more details.
+#
+# Copyright: 2024 IBM
+# Measures the cost of perf record and perf trace on a fixed workload
+
+import os
+import re
+import json
+import time
+import platform
+import statistics
+from avocado import Test
+from avocado.utils import distro, process, dmesg
+from avocado.utils.software_manager.manager import SoftwareManager
+
+
+class perf_record_overhead(Test):
+
+    """
+    Runs a fixed CPU/syscall heavy workload bare, under perf record for
+    every sampling frequency and callchain mode, and under perf trace.
+    Reports the workload slowdown, samples/sec, lost samples, perf.data
+    write bandwidth and perf report time per MB.
+    :avocado: tags=perf,record,benchmark
+    """
+
+    def setUp(self):
+        '''
+        Install the basic packages to support perf
+        '''
+
+        # Check for basic utilities
+        smm = SoftwareManager()
+        detected_distro = distro.detect()
+        self.distro_name = detected_distro.name
+
+        deps = ['gcc', 'make']
+        if 'Ubuntu' in self.distro_name:
+            deps.extend(['linux-tools-common', 'linux-tools-%s' %
+                         platform.uname()[2]])
+        elif 'debian' in detected_distro.name:
+            deps.extend(['linux-perf'])
+        elif self.distro_name in ['rhel', 'SuSE', 'fedora', 'centos']:
+            deps.extend(['perf'])
+        else:
+            self.cancel("Install the package for perf supported \
+                         by %s" % detected_distro.name)
+        for package in deps:
+            if not smm.check_installed(package) and not smm.install(package):
+                self.cancel('%s is needed for the test to be run' % package)
+
+        # Getting the parameters from yaml file
+        self.workload = self.params.get(
+            'workload', default='perf bench sched messaging -g 10 -l 1000')
+        self.repeat = self.params.get('repeat', default=3)
+        self.freqs = self.params.get('freqs', default=[99, 999, 4000])
+        self.callchains = self.params.get('callchains',
+                                          default=['', 'fp', 'dwarf', 'lbr'])
+        self.perf_data = os.path.join(self.workdir, 'perf.data')
+
+        # Clear the dmesg by that we can capture delta at the end of the test
+        dmesg.clear_dmesg()
+
+    def timed_run(self, cmd):
+        '''
+        Runs the command, returns its elapsed seconds and output, None
+        when the command failed.
+        '''
+        start = time.monotonic()
+        result = process.run(cmd, ignore_status=True, sudo=True, shell=True)
+        elapsed = time.monotonic() - start
+        if result.exit_status:
+            self.log.warn("%s failed: %s", cmd, result.stderr_text)
+            return None, result.stderr_text
+        return elapsed, result.stdout_text + result.stderr_text
+
+    @staticmethod
+    def parse_stats(output):
+        '''
+        Parses perf report --stats into the count of each record type,
+        e.g. SAMPLE, LOST and LOST_SAMPLES, from the aggregated stats
+        which come first.
+        '''
+        stats = {}
+        for name, count in re.findall(r'(\w+) events:\s+(\d+)', output):
+            stats.setdefault(name, int(count))
+        return stats
+
+    def record_metrics(self, elapsed, bare):
+        '''
+        Returns the metrics of the perf.data of the last record run.
+        '''
+        size_mb = os.path.getsize(self.perf_data) / 1048576.0
+        stats = self.parse_stats(process.run(
+            'perf report -i %s --stats' % self.perf_data, sudo=True,
+            ignore_status=True).stdout_text)
+        start = time.monotonic()
+        process.run('perf report -i %s --stdio > /dev/null' % self.perf_data,
+                    sudo=True, shell=True, ignore_status=True)
+        report_sec = time.monotonic() - start
+        return {'elapsed_sec': round(elapsed, 3),
+                'slowdown': round(elapsed / bare, 3),
+                'samples': stats.get('SAMPLE', 0),
+                'samples_per_sec': round(stats.get('SAMPLE', 0) / elapsed),
+                'lost_records': stats.get('LOST', 0),
+                'lost_samples': stats.get('LOST_SAMPLES', 0),
+                'data_mb': round(size_mb, 3),
+                'write_mbs': round(size_mb / elapsed, 3),
+                'report_sec_per_mb': round(report_sec / size_mb, 3)
+                if size_mb else None}
+
+    def test_overhead(self):
+        '''
+        Measures the bare workload, then every perf record frequency and
+        callchain combination and perf trace, taking the median elapsed
+        time over repeat runs.
+        '''
+        bare_runs = [self.timed_run(self.workload)[0]
+                     for _ in range(self.repeat)]
+        if None in bare_runs:
+            self.fail("Workload %s failed" % self.workload)
+        bare = statistics.median(bare_runs)
+        self.log.info("Bare workload: %.3fs", bare)
+        results = []
+        for freq in self.freqs:
+            for callchain in self.callchains:
+                options = '-F %s' % freq
+                if callchain:
+                    options += ' --call-graph=%s' % callchain
+                result = {'mode': 'record', 'freq': freq,
+                          'callchain': callchain or 'none'}
+                runs = []
+                for _ in range(self.repeat):
+                    # no build-id collection, it would be timed with
+                    # the workload
+                    elapsed, output = self.timed_run(
+                        'perf record --no-buildid -o %s %s -- %s'
+                        % (self.perf_data, options, self.workload))
+                    if elapsed is None:
+                        break
+                    runs.append(elapsed)
+                if len(runs) < self.repeat:
+                    if callchain != 'lbr' or platform.machine() == 'x86_64':
+                        self.fail("perf record %s failed: %s"
+                                  % (options, output))
+                    result['unsupported'] = output.strip().splitlines()[-1:]
+                else:
+                    result.update(self.record_metrics(
+                        statistics.median(runs), bare))
+                self.log.info("%s", result)
+                results.append(result)
+        trace_file = os.path.join(self.workdir, 'trace.out')
+        runs = []
+        for _ in range(self.repeat):
+            elapsed, output = self.timed_run('perf trace -o %s -- %s'
+                                             % (trace_file, self.workload))
+            if elapsed is None:
+                break
+            runs.append(elapsed)
+        result = {'mode': 'trace'}
+        if len(runs) < self.repeat:
+            # perf built without libtraceevent/libaudit
+            if 'not available' not in output:
+                self.fail("perf trace failed: %s" % output)
+            result['unsupported'] = True
+        else:
+            elapsed = statistics.median(runs)
+            size_mb = os.path.getsize(trace_file) / 1048576.0
+            result.update({'elapsed_sec': round(elapsed, 3),
+                           'slowdown': round(elapsed / bare, 3),
+                           'data_mb': round(size_mb, 3),
+                           'write_mbs': round(size_mb / elapsed, 3)})
+        self.log.info("%s", result)
+        results.append(result)
+        self.whiteboard = json.dumps({'workload': self.workload,
+                                      'bare_sec': round(bare, 3),
+                                      'results': results})
+        dmesg.collect_errors_dmesg(['WARNING: CPU:', 'Oops', 'Segfault',
+                                    'soft lockup', 'Unable to handle'])
@@ -15,10 +15,12 @@
 # Author: Disha Goel <disgoel@linux.vnet.ibm.com>
 
 import os
+import re
+import json
 import platform
 import tempfile
 from avocado import Test
-from avocado.utils import distro, process, dmesg
+from avocado.utils import cpu, distro, process, dmesg
 from avocado.utils.software_manager.manager import SoftwareManager
 
 
@@ -97,6 +99,86 @@ class perf_sched(Test):
         dmesg.collect_errors_dmesg(['WARNING: CPU:', 'Oops', 'Segfault',
                                     'soft lockup', 'Unable to handle'])
 
+    @staticmethod
+    def parse_latency(output):
+        """
+        Parses the perf sched latency table into runtime, switches, avg
+        and max delay (ms) per task:pid.
+        """
+        tasks = {}
+        for line in output.splitlines():
+            match = re.match(r'\s*(\S.*?:\d+)\s*\|\s*([\d.]+) ms\s*\|'
+                             r'\s*(\d+)\s*\|\s*avg:\s*([\d.]+) ms\s*\|'
+                             r'\s*max:\s*([\d.]+) ms', line)
+            if match:
+                tasks[match.group(1)] = {
+                    'runtime_ms': float(match.group(2)),
+                    'switches': int(match.group(3)),
+                    'avg_delay_ms': float(match.group(4)),
+                    'max_delay_ms': float(match.group(5))}
+        return tasks
+
+    @staticmethod
+    def parse_timehist(output):
+        """
+        Parses perf sched timehist lines into the wait time, scheduling
+        delay and run time (ms) of every switch out, grouped by task.
+        """
+        tasks = {}
+        for line in output.splitlines():
+            match = re.match(r'\s*[\d.]+\s+\[\d+\]\s+(\S.*?)\s+([\d.]+)'
+                             r'\s+([\d.]+)\s+([\d.]+)\s*$', line)
+            if match:
+                tasks.setdefault(match.group(1), []).append(
+                    {'wait_ms': float(match.group(2)),
+                     'sch_delay_ms': float(match.group(3)),
+                     'run_ms': float(match.group(4))})
+        return tasks
+
+    def test_wakeup_delay(self):
+        """
+        Records the bundled wakeup microkernel, whose wk_sleeper thread
+        waits delay_ms behind a SCHED_FIFO hog at every wakeup, and
+        checks that perf sched latency and timehist report that delay.
+        """
+        iterations = self.params.get('iterations', default=20)
+        delay_ms = self.params.get('delay_ms', default=20)
+        tolerance = self.params.get('tolerance', default=0.2)
+        target_cpu = self.params.get('target_cpu',
+                                     default=cpu.cpu_online_list()[-1])
+        binary = os.path.join(self.workdir, 'wakeup_delay')
+        process.run('gcc -O2 -pthread %s -o %s'
+                    % (self.get_data('wakeup_delay.c'), binary))
+        self.run_cmd('perf sched record -o %s -- %s %s %s %s'
+                     % (self.temp_file, binary, iterations, delay_ms,
+                        target_cpu))
+        latency = self.parse_latency(process.run(
+            'perf sched -i %s latency' % self.temp_file,
+            sudo=True).stdout_text)
+        timehist = self.parse_timehist(process.run(
+            'perf sched -i %s timehist' % self.temp_file,
+            sudo=True).stdout_text)
+        sleeper = [stats for task, stats in latency.items()
+                   if task.startswith('wk_sleeper:')]
+        hist_delay = max([switch['sch_delay_ms']
+                          for task, switches in timehist.items()
+                          if task.startswith('wk_sleeper')
+                          for switch in switches] or [0])
+        self.whiteboard = json.dumps({'expected_delay_ms': delay_ms,
+                                      'latency': latency,
+                                      'timehist_max_delay_ms': hist_delay})
+        if not sleeper:
+            self.fail("wk_sleeper missing in perf sched latency")
+        self.log.info("wk_sleeper latency %s, timehist max delay %sms",
+                      sleeper[0], hist_delay)
+        min_delay = delay_ms * (1 - tolerance)
+        if sleeper[0]['max_delay_ms'] < min_delay:
+            self.fail("perf sched latency max delay %sms, expected about "
+                      "%sms" % (sleeper[0]['max_delay_ms'], delay_ms))
+        if hist_delay < min_delay:
+            self.fail("perf sched timehist max delay %sms, expected about "
+                      "%sms" % (hist_delay, delay_ms))
+
     def tearDown(self):
         # Delete the temporary file
         if os.path.isfile(self.temp_file):
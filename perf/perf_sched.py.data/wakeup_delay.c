@@ -0,0 +1,112 @@
+/*
+ * This program is free software; you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation; either version 2 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+ * See LICENSE for more details.
+ * Copyright: 2024 IBM
+ *
+ * Wakeup delay microkernel for perf sched.
+ * Usage: wakeup_delay <iterations> <delay in ms> <cpu>
+ * Every iteration wakes a SCHED_FIFO thread "wk_hog" spinning for delay
+ * ms on cpu, then the SCHED_OTHER thread "wk_sleeper" pinned on the
+ * same cpu, so each wakeup of wk_sleeper is delayed by about delay ms.
+ */
+
+#define _GNU_SOURCE
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <pthread.h>
+#include <sched.h>
+#include <time.h>
+#include <unistd.h>
+#include <sys/prctl.h>
+
+static int hog_pipe[2], sleep_pipe[2];
+static long delay_ns;
+static int target_cpu;
+
+static long now_ns(void)
+{
+	struct timespec tsp;
+
+	clock_gettime(CLOCK_MONOTONIC, &tsp);
+	return tsp.tv_sec * 1000000000L + tsp.tv_nsec;
+}
+
+static void pin(const char *name)
+{
+	cpu_set_t set;
+
+	CPU_ZERO(&set);
+	CPU_SET(target_cpu, &set);
+	pthread_setaffinity_np(pthread_self(), sizeof(set), &set);
+	prctl(PR_SET_NAME, name);
+}
+
+static void *hog(void *arg)
+{
+	struct sched_param param = { .sched_priority = 1 };
+	long end;
+	char buf;
+
+	pin("wk_hog");
+	if (pthread_setschedparam(pthread_self(), SCHED_FIFO, &param)) {
+		printf("cannot set SCHED_FIFO\n");
+		exit(1);
+	}
+	while (read(hog_pipe[0], &buf, 1) == 1) {
+		end = now_ns() + delay_ns;
+		while (now_ns() < end)
+			;
+	}
+	return arg;
+}
+
+static void *sleeper(void *arg)
+{
+	char buf;
+
+	pin("wk_sleeper");
+	while (read(sleep_pipe[0], &buf, 1) == 1)
+		;
+	return arg;
+}
+
+int main(int argc, char *argv[])
+{
+	pthread_t thr[2];
+	int iters, idx;
+
+	if (argc < 4) {
+		printf("Usage: %s <iterations> <delay in ms> <cpu>\n", argv[0]);
+		return 1;
+	}
+	iters = atoi(argv[1]);
+	delay_ns = atol(argv[2]) * 1000000L;
+	target_cpu = atoi(argv[3]);
+	if (pipe(hog_pipe) || pipe(sleep_pipe)) {
+		printf("pipe failed\n");
+		return 1;
+	}
+	pthread_create(&thr[0], NULL, hog, NULL);
+	pthread_create(&thr[1], NULL, sleeper, NULL);
+	usleep(100000);
+	for (idx = 0; idx < iters; idx++) {
+		if (write(hog_pipe[1], "w", 1) != 1 ||
+		    write(sleep_pipe[1], "w", 1) != 1)
+			return 1;
+		usleep(delay_ns / 1000 * 3);
+	}
+	close(hog_pipe[1]);
+	close(sleep_pipe[1]);
+	for (idx = 0; idx < 2; idx++)
+		pthread_join(thr[idx], NULL);
+	printf("delay_ms %ld\n", delay_ns / 1000000L);
+	return 0;
+}
@@ -16,6 +16,9 @@
 
 import os
 import re
+import glob
+import json
+import statistics
 from datetime import datetime
 
 from avocado import Test
@@ -194,6 +197,139 @@ class Pgbench(Test):
 
         self.extract_tps_stats(payload_file)
 
+    def pg_stats(self):
+        """
+        Returns the numeric columns of pg_stat_database for the pgbench
+        db and of pg_stat_bgwriter, whatever the server version has.
+        """
+        stats = {}
+        for view, cond in [("pg_stat_database", " where datname='pgbench'"),
+                           ("pg_stat_bgwriter", "")]:
+            result = self.run_cmd(f"psql -d pgbench -A -F '|' -P footer=off "
+                                  f"-c \"select * from {view}{cond}\"", True)
+            lines = result[1].splitlines() if not result[0] else []
+            if len(lines) < 2:
+                continue
+            for col, val in zip(lines[0].split('|'), lines[1].split('|')):
+                try:
+                    stats[f"{view}.{col}"] = float(val)
+                except ValueError:
+                    continue
+        return stats
+
+    @staticmethod
+    def percentile(values, pct):
+        """
+        Returns the pct percentile of the sorted values.
+        """
+        if not values:
+            return 0
+        return values[int(round(pct / 100.0 * (len(values) - 1)))]
+
+    @staticmethod
+    def parse_txn_logs(log_prefix, interval):
+        """
+        Parses the per transaction logs of a run into the sorted
+        latencies in ms and the transaction count of every interval
+        seconds window.
+        """
+        latencies = []
+        windows = {}
+        for log_file in glob.glob(log_prefix + ".*"):
+            with open(log_file) as txn_log:
+                for line in txn_log:
+                    # client_id transaction_no time script_no epoch usec
+                    fields = line.split()
+                    if len(fields) < 6 or not fields[2].isdigit():
+                        continue
+                    latencies.append(int(fields[2]) / 1000.0)
+                    window = int(fields[4]) // interval
+                    windows[window] = windows.get(window, 0) + 1
+        # the first and last windows are partial
+        counts = [windows[key] for key in sorted(windows)][1:-1]
+        return sorted(latencies), counts
+
+    def run_step(self, clients, scale, step_dir):
+        """
+        Runs pgbench with transaction logging and progress reports for
+        one sweep step and returns its metrics.
+        """
+        duration = self.params.get("sweep_duration", default=60)
+        interval = self.params.get("aggregate_interval", default=1)
+        sampling = self.params.get("sampling_rate", default=1)
+        # pgbench wants clients to be a multiple of the jobs
+        jobs = max(job for job in range(1, min(clients,
+                                               self.worker_threads) + 1)
+                   if clients % job == 0)
+        log_prefix = os.path.join(step_dir, f"c{clients}_s{scale}")
+        before = self.pg_stats()
+        result = process.run(f"pgbench --protocol={self.protocol} "
+                             f"--jobs={jobs} --client={clients} -n "
+                             f"--time={duration} --progress={interval} "
+                             f"--log --log-prefix={log_prefix} "
+                             f"--sampling-rate={sampling} pgbench",
+                             ignore_status=True)
+        if result.exit_status:
+            self.fail(f"pgbench failed: {result.stderr_text}")
+        after = self.pg_stats()
+        tps = re.search(r"tps\s*=\s*([\d.]+)", result.stdout_text)
+        progress = [float(val) for val in re.findall(
+            r"progress:.*?([\d.]+) tps", result.stderr_text)]
+        latencies, windows = self.parse_txn_logs(log_prefix, interval)
+        metrics = {'clients': clients, 'scale': scale, 'jobs': jobs,
+                   'tps': float(tps.group(1)) if tps else 0,
+                   'p50_ms': self.percentile(latencies, 50),
+                   'p95_ms': self.percentile(latencies, 95),
+                   'p99_ms': self.percentile(latencies, 99)}
+        # interval to interval stability of the throughput
+        for name, vals in [('progress', progress), ('window', windows)]:
+            if len(vals) > 1 and statistics.mean(vals):
+                metrics[f"{name}_tps_cv"] = round(
+                    statistics.stdev(vals) / statistics.mean(vals), 4)
+        metrics['pg_stats'] = {key: after[key] - before[key]
+                               for key in after if key in before and
+                               after[key] != before[key]}
+        return metrics
+
+    def test_sweep(self):
+        """
+        Sweeps client count and scale factor, reporting TPS, latency
+        percentiles, throughput stability and server stats per step, and
+        the scaling knee and p99 growth per scale factor.
+        """
+        clients_list = self.params.get("sweep_clients",
+                                       default=[1, 2, 4, 8, 16, 32])
+        scales = self.params.get("sweep_scales",
+                                 default=[self.scaling_factor])
+        min_gain = self.params.get("knee_min_gain", default=0.1)
+        step_dir = os.path.join(self.logdir, "pgbench_sweep")
+        os.makedirs(step_dir, exist_ok=True)
+        results = []
+        summary = {}
+        for scale in scales:
+            if scale != self.scaling_factor:
+                self.run_cmd(f"pgbench -i -s {scale} -n pgbench", False)
+                self.scaling_factor = scale
+            steps = []
+            for clients in clients_list:
+                metrics = self.run_step(int(clients), scale, step_dir)
+                self.log.info("%s", {key: val for key, val in metrics.items()
+                                     if key != 'pg_stats'})
+                steps.append(metrics)
+            base_p99 = steps[0]['p99_ms']
+            summary[scale] = {
+                # first client count gaining less than min_gain TPS over
+                # the previous one
+                'knee_clients': next(
+                    (step['clients'] for prev, step in zip(steps, steps[1:])
+                     if step['tps'] < prev['tps'] * (1 + min_gain)), None),
+                'peak_tps': max(step['tps'] for step in steps),
+                'p99_growth': [round(step['p99_ms'] / base_p99, 2)
+                               if base_p99 else None for step in steps]}
+            self.log.info("Scale %s: %s", scale, summary[scale])
+            results.extend(steps)
+        self.whiteboard = json.dumps({'steps': results, 'summary': summary})
+
     def tearDown(self):
         # destroy the db
         self.run_cmd("dropdb pgbench", True)
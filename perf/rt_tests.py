@@ -23,9 +23,14 @@
 
 
 import os
+import re
+import glob
+import json
 from avocado import Test
 from avocado.utils import archive
 from avocado.utils import build
+from avocado.utils import cpu
+from avocado.utils import genio
 from avocado.utils import process
 from avocado.utils.software_manager.manager import SoftwareManager
 from avocado.utils import distro
@@ -33,6 +38,12 @@ from avocado.utils import distro
 
 class rt_tests(Test):
 
+    """
+    Runs the rt-tests programs, test_latency_matrix runs cyclictest with
+    histograms across SMT modes, cpuidle state masks and optional
+    background stress.
+    """
+
     def setUp(self):
         # Check for basic utilities
         sm = SoftwareManager()
@@ -57,9 +68,160 @@ class rt_tests(Test):
         self.sourcedir = os.path.join(
             self.workdir, os.path.basename(tarball.split('.tar.')[0]))
         build.make(self.sourcedir)
+        self.orig_smt = None
+        self.orig_idle = {}
 
     def test(self):
         test_to_run = self.params.get('test_to_run', default='signaltest')
         args = self.params.get('args', default=' -t 10 -l 100000')
         process.system("%s %s" % (os.path.join(self.sourcedir, test_to_run), args),
                        sudo=True)
+
+    @staticmethod
+    def parse_histogram(path, cpus):
+        """
+        Parses a cyclictest --histfile, one column per thread, into per
+        CPU bucket counts (usec) with min/avg/max, overflows and p99.99.
+        """
+        hist = {}
+        summary = {}
+        for line in genio.read_all_lines(path):
+            if line.startswith('#'):
+                key, _, values = line.lstrip('# ').partition(':')
+                if key in ['Min Latencies', 'Avg Latencies',
+                           'Max Latencies', 'Histogram Overflows']:
+                    summary[key] = [int(val) for val in values.split()]
+                continue
+            values = line.split()
+            if len(values) > 1:
+                hist[int(values[0])] = [int(val) for val in values[1:]]
+        result = {}
+        for idx, cpu_id in enumerate(cpus):
+            counts = {usec: row[idx] for usec, row in hist.items()
+                      if idx < len(row) and row[idx]}
+            stats = {key.split()[0].lower(): summary[key][idx]
+                     for key in summary if idx < len(summary[key])}
+            total = sum(counts.values()) + stats.get('histogram', 0)
+            p9999 = stats.get('max', 0)
+            cumulative = 0
+            for usec in sorted(counts):
+                cumulative += counts[usec]
+                if cumulative >= 0.9999 * total:
+                    p9999 = usec
+                    break
+            result[cpu_id] = {'min_us': stats.get('min', 0),
+                              'avg_us': stats.get('avg', 0),
+                              'max_us': stats.get('max', 0),
+                              'p9999_us': p9999,
+                              'overflows': stats.get('histogram', 0),
+                              'histogram': counts}
+        return result
+
+    def set_idle_mask(self, mask):
+        """
+        Enables the cpuidle states whose bit is set in mask on every
+        online CPU, "all" enables every state. Saves the original
+        settings the first time.
+        """
+        paths = []
+        for cpu_num in cpu.cpu_online_list():
+            paths.extend(glob.glob('/sys/devices/system/cpu/cpu%s/cpuidle/'
+                                   'state[0-9]*/disable' % cpu_num))
+        for path in paths:
+            if path not in self.orig_idle:
+                self.orig_idle[path] = genio.read_one_line(path)
+            state = int(path.split('/state')[1].split('/')[0])
+            enable = mask == 'all' or int(str(mask), 0) & (1 << state)
+            genio.write_one_line(path, '0' if enable else '1')
+
+    def run_cyclictest(self, tag):
+        """
+        Runs cyclictest on every online CPU with a histogram and returns
+        the per CPU results.
+        """
+        duration = self.params.get('duration', default=60)
+        interval = self.params.get('interval', default=1000)
+        priority = self.params.get('priority', default=95)
+        hist_max = self.params.get('hist_max_us', default=1000)
+        histfile = os.path.join(self.outputdir, 'hist_%s.txt' % tag)
+        cpus = cpu.cpu_online_list()
+        process.run('%s --smp -m -q -p %s -i %s -D %s --histogram=%s '
+                    '--histfile=%s' % (os.path.join(self.sourcedir,
+                                                    'cyclictest'),
+                                       priority, interval, duration,
+                                       hist_max, histfile), sudo=True)
+        return self.parse_histogram(histfile, cpus)
+
+    def test_latency_matrix(self):
+        """
+        Runs cyclictest for every SMT mode, cpuidle enable mask and
+        stress setting, reports per CPU histograms and flags the
+        settings whose worst latency exceeds max_latency_us.
+        """
+        smt_modes = self.params.get('smt_modes', default=[None])
+        idle_masks = self.params.get('idle_masks', default=['all'])
+        stress_cmd = self.params.get('stress_cmd', default='')
+        max_latency = self.params.get('max_latency_us', default=100)
+        if smt_modes != [None]:
+            if process.system('ppc64_cpu --smt', ignore_status=True,
+                              sudo=True):
+                self.cancel("SMT modes need ppc64_cpu --smt support")
+            # "SMT=4" or "SMT is off"
+            output = process.system_output('ppc64_cpu --smt',
+                                           sudo=True).decode()
+            match = re.search(r'SMT=(\d+)', output)
+            if match:
+                self.orig_smt = match.group(1)
+            elif 'SMT is off' in output:
+                self.orig_smt = 'off'
+            else:
+                self.cancel("Cannot parse the SMT mode from %s" % output)
+        stress_modes = [False, True] if stress_cmd else [False]
+        matrix = []
+        for smt in smt_modes:
+            if smt is not None:
+                process.run('ppc64_cpu --smt=%s' % smt, sudo=True)
+            for mask in idle_masks:
+                self.set_idle_mask(mask)
+                for stress in stress_modes:
+                    stressor = None
+                    if stress:
+                        stressor = process.SubProcess(stress_cmd, shell=True,
+                                                      sudo=True)
+                        stressor.start()
+                    tag = 'smt%s_idle%s_%s' % (smt, mask,
+                                               'stress' if stress else 'idle')
+                    try:
+                        per_cpu = self.run_cyclictest(tag)
+                    finally:
+                        if stressor:
+                            stressor.terminate()
+                            stressor.wait()
+                    worst = max(per_cpu.values(),
+                                key=lambda res: res['max_us'])
+                    entry = {'smt': smt, 'idle_mask': mask, 'stress': stress,
+                             'max_us': worst['max_us'],
+                             'avg_us': max(res['avg_us']
+                                           for res in per_cpu.values()),
+                             'p9999_us': max(res['p9999_us']
+                                             for res in per_cpu.values()),
+                             'safe': worst['max_us'] <= max_latency and
+                             not worst['overflows'],
+                             'per_cpu': per_cpu}
+                    self.log.info("SMT %s idle mask %s stress %s: max %sus "
+                                  "p99.99 %sus safe %s", smt, mask, stress,
+                                  entry['max_us'], entry['p9999_us'],
+                                  entry['safe'])
+                    matrix.append(entry)
+        self.whiteboard = json.dumps(matrix)
+
+    def tearDown(self):
+        """
+        Restores the SMT mode and the cpuidle states
+        """
+        if getattr(self, 'orig_smt', None):
+            process.run('ppc64_cpu --smt=%s' % self.orig_smt, sudo=True,
+                        ignore_status=True)
+        for path, value in getattr(self, 'orig_idle', {}).items():
+            if os.path.exists(path):
+                genio.write_one_line(path, value)
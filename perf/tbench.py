@@ -19,8 +19,10 @@
 # https://github.com/autotest/autotest-client-tests/tree/master/tbench
 
 import os
+import json
 import signal
 import re
+import statistics
 from avocado import Test
 from avocado.utils import archive, cpu
 from avocado.utils import process
@@ -55,12 +57,11 @@ class tbench(Test):
         process.run('./configure', ignore_status=True, sudo=True)
         build.make(self.sourcedir)
 
-    def test(self):
-        # only supports combined server+client model at the moment
-        # should support separate I suppose, but nobody uses it
-        nprocs = self.params.get('nprocs', default=cpu.total_count())
-        args = self.params.get('args',  default=None)
-        args = '%s %s' % (args, nprocs)
+    def run_tbench(self, args):
+        """
+        Runs tbench against a local tbench_srv and returns the final
+        throughput in MB/sec.
+        """
         pid = os.fork()
         if pid:                         # parent
             client = os.path.join(self.sourcedir, 'client.txt')
@@ -68,11 +69,57 @@ class tbench(Test):
             cmd = os.path.join(self.sourcedir, "tbench") + " " + args
             # Standard output is verbose and merely makes our debug logs huge
             # so we don't retain it.  It gets parsed for the results.
-            self.results = process.system_output(cmd, shell=True).decode()
-            os.kill(pid, signal.SIGTERM)    # clean up the server
+            try:
+                self.results = process.system_output(cmd,
+                                                     shell=True).decode()
+            finally:
+                os.kill(pid, signal.SIGTERM)    # clean up the server
+                os.waitpid(pid, 0)
         else:                           # child
             server = os.path.join(self.sourcedir, 'tbench_srv')
             os.execlp(server, server)
         pattern = re.compile(r"Throughput (.*?) MB/sec (.*?) procs")
-        (throughput, procs) = pattern.findall(self.results)[0]
-        self.log.info({'throughput': throughput, 'procs': procs})
+        matches = pattern.findall(self.results)
+        if not matches:
+            self.fail("No throughput found in tbench output")
+        return float(matches[-1][0])
+
+    def test(self):
+        """
+        Runs tbench at least min_iter times and until the coefficient of
+        variation of the throughput falls under target_cv or max_iter
+        runs are done.
+        """
+        # only supports combined server+client model at the moment
+        # should support separate I suppose, but nobody uses it
+        nprocs = self.params.get('nprocs', default=cpu.total_count())
+        args = self.params.get('args',  default=None)
+        min_iter = self.params.get('min_iter', default=3)
+        max_iter = self.params.get('max_iter', default=10)
+        target_cv = self.params.get('target_cv', default=0.05)
+        trim = self.params.get('trim', default=0.1)
+        args = '%s %s' % (args, nprocs)
+        samples = []
+        cv = 0.0
+        while len(samples) < max_iter:
+            samples.append(self.run_tbench(args))
+            self.log.info("Iteration %s: %s MB/sec", len(samples),
+                          samples[-1])
+            if len(samples) > 1:
+                cv = statistics.stdev(samples) / statistics.mean(samples)
+                if len(samples) >= min_iter and cv <= target_cv:
+                    break
+        # mean without the trim fraction of lowest and highest samples
+        cut = int(len(samples) * trim)
+        kept = sorted(samples)[cut:len(samples) - cut] or samples
+        stdev = statistics.stdev(samples) if len(samples) > 1 else 0.0
+        stats = {'samples': samples, 'mean': statistics.mean(samples),
+                 'median': statistics.median(samples), 'stdev': stdev,
+                 'cv': cv, 'trimmed_mean': statistics.mean(kept)}
+        self.log.info({'throughput': stats['median'], 'procs': nprocs,
+                       'cv': cv})
+        if cv > target_cv:
+            self.log.warn("CV %.3f still above %s after %s iterations",
+                          cv, target_cv, len(samples))
+        self.whiteboard = json.dumps({'throughput_mbs': stats,
+                                      'procs': nprocs})
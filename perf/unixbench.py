@@ -19,7 +19,10 @@
 
 import os
 import re
+import json
+import platform
 from avocado import Test
+from avocado.utils import cpu
 from avocado.utils import process
 from avocado.utils import build
 from avocado.utils import archive
@@ -49,15 +52,106 @@ class Unixbench(Test):
         process.run(makefile_patch, shell=True)
         build.make(self.sourcedir)
 
+    @staticmethod
+    def parse_index(report_data):
+        """
+        Parses the "System Benchmarks Index Values" table of every pass
+        (one per -c copies value) into the per test index and the score.
+        """
+        passes = []
+        in_table = False
+        for line in report_data:
+            match = re.search(r'running (\d+) parallel cop', line)
+            if match:
+                passes.append({'copies': int(match.group(1)), 'index': {},
+                               'score': None})
+                continue
+            if 'System Benchmarks Index Values' in line:
+                in_table = bool(passes)
+                continue
+            if not in_table:
+                continue
+            match = re.search(r'Index Score.*?([\d.]+)\s*$', line)
+            if match:
+                passes[-1]['score'] = float(match.group(1))
+                in_table = False
+                continue
+            match = re.match(r'(\S.*?)\s+([\d.]+)\s+([\d.]+)\s+([\d.]+)'
+                             r'\s*$', line)
+            if match:
+                passes[-1]['index'][match.group(1)] = float(match.group(4))
+        return passes
+
+    def compare_baseline(self, passes):
+        """
+        Compares every index with the per host baseline and returns the
+        ones lower by more than regression_tolerance %. Stores the
+        results as baseline when there is none yet or when
+        update_baseline is set.
+        """
+        tolerance = self.params.get('regression_tolerance', default=5)
+        update = self.params.get('update_baseline', default=False)
+        baseline_file = self.params.get(
+            'baseline_file', default=os.path.join(
+                data_dir.get_data_dir(),
+                'unixbench_baseline_%s.json' % platform.node()))
+        baseline = {}
+        if os.path.exists(baseline_file):
+            with open(baseline_file) as base_file:
+                baseline = json.load(base_file)
+        regressions = {}
+        for run in passes:
+            copies = str(run['copies'])
+            tests = dict(run['index'], score=run['score'])
+            for name, value in tests.items():
+                base = baseline.get(copies, {}).get(name)
+                if not base or value is None:
+                    continue
+                change = round(100.0 * (value - base) / base, 2)
+                if change < -tolerance:
+                    regressions['%s copies: %s' % (copies, name)] = change
+            if copies not in baseline or update:
+                baseline[copies] = tests
+        os.makedirs(os.path.dirname(baseline_file), exist_ok=True)
+        with open(baseline_file, 'w') as base_file:
+            json.dump(baseline, base_file, indent=2)
+        return regressions
+
     def test(self):
         self.tmpdir = data_dir.get_tmp_dir()
         # Read USAGE in Unixbench directory in src to give the args
         args = self.params.get('args', default='-v -c 1')
+        # a second N-copy pass gives the parallel scaling of every test
+        if self.params.get('parallel_pass', default=True) and \
+                args.count('-c') == 1:
+            args += ' -c %s' % cpu.online_count()
         process.system('./Run %s' % args, shell=True,
                        sudo=True, ignore_status=True)
         report_path = os.path.join(self.logdir, 'stdout')
         self.report_data = open(report_path).readlines()
 
+        passes = self.parse_index(self.report_data)
+        if not passes:
+            self.log.warn("No index values found in the report")
+            return
+        scaling = {}
+        single = passes[0]
+        for run in passes[1:]:
+            scaling[run['copies']] = {
+                name: round(value / single['index'][name], 3)
+                for name, value in run['index'].items()
+                if single['index'].get(name)}
+        regressions = self.compare_baseline(passes)
+        self.whiteboard = json.dumps({'passes': passes,
+                                      'scaling_ratio': scaling,
+                                      'regressions': regressions})
+        for name, change in regressions.items():
+            self.log.warn("%s index %s%% below the baseline", name, change)
+        if regressions and self.params.get('fail_on_regression',
+                                           default=False):
+            self.fail("Index regressions against the baseline: %s"
+                      % regressions)
+
     def check_for_failure(self, words):
         length = len(words)
         if length >= 3 and words[-3:length] == ['no', 'measured', 'results']: